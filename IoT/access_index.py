@@ -0,0 +1,120 @@
+from django.db import transaction
+from django.db.models import Q
+from IoT.models import Projects, Zones, Node, Sensors, AccessIndex
+
+"""
+Token access index maintenance
+====
+
+The AccessIndex table stores one row per object a token can manage,
+this module computes those rows and keeps them updated when the
+IoT hierarchy or the access keys change
+"""
+
+
+def token_querysets(token_id):
+    """
+    Returns the querysets of every object a token can manage
+    ====
+
+    Ownership is inherited from parents to children, thus a project
+    token manages its zones, a zone token its nodes and sensors and a
+    node token its sensors
+    """
+    projects = Projects.objects.filter(access_keys=token_id)
+    zones = Zones.objects.filter(Q(project__access_keys=token_id) | Q(access_keys=token_id))
+    nodes = Node.objects.filter(Q(zone__in=zones) | Q(access_keys=token_id))
+    sensors = Sensors.objects.filter(Q(zone__in=zones) | Q(node__in=nodes))
+    return {
+        'project':projects,
+        'zone':zones,
+        'node':nodes,
+        'sensor':sensors,
+    }
+
+
+def rebuild_token_index(token_ids):
+    """
+    Recomputes the index rows of the selected tokens
+    """
+    with transaction.atomic():
+        for token_id in set(token_ids):
+            AccessIndex.objects.filter(token_id=token_id).delete()
+            rows = []
+            for field, queryset in token_querysets(token_id).items():
+                for pk in set(queryset.values_list('id', flat=True)):
+                    rows.append(AccessIndex(token_id=token_id, **{field+'_id':pk}))
+            AccessIndex.objects.bulk_create(rows, batch_size=500)
+
+
+def holders_of(**lookup):
+    """
+    Returns the ids of the tokens with an index row matching any lookup
+    """
+    query = Q()
+    for field, pk in lookup.items():
+        if pk is not None:
+            query |= Q(**{field+'_id':pk})
+    if not query:
+        return set()
+    return set(AccessIndex.objects.filter(query).values_list('token_id', flat=True))
+
+
+def grant_to_holders(field, obj, **parents):
+    """
+    Grants obj to every token that already manages one of its parents
+    ====
+
+    Used when a new zone, node or sensor is created so the index is
+    extended without recomputing it
+    """
+    AccessIndex.objects.bulk_create([
+        AccessIndex(token_id=token_id, **{field:obj}) for token_id in holders_of(**parents)
+    ])
+
+
+def subtree_querysets(obj):
+    """
+    Returns the querysets of obj and every object under it
+    """
+    if isinstance(obj, Projects):
+        return {
+            'project':Projects.objects.filter(pk=obj.pk),
+            'zone':Zones.objects.filter(project=obj),
+            'node':Node.objects.filter(zone__project=obj),
+            'sensor':Sensors.objects.filter(zone__project=obj),
+        }
+    elif isinstance(obj, Zones):
+        return {
+            'zone':Zones.objects.filter(pk=obj.pk),
+            'node':Node.objects.filter(zone=obj),
+            'sensor':Sensors.objects.filter(zone=obj),
+        }
+    return {
+        'node':Node.objects.filter(pk=obj.pk),
+        'sensor':Sensors.objects.filter(node=obj),
+    }
+
+
+def grant_subtree(token_ids, obj):
+    """
+    Grants obj and its children to the selected tokens
+    ====
+
+    Used when an access key is added to an object, rows the
+    tokens already had are not duplicated
+    """
+    if not token_ids:
+        return
+    rows = []
+    for field, queryset in subtree_querysets(obj).items():
+        ids = set(queryset.values_list('id', flat=True))
+        for token_id in set(token_ids):
+            present = AccessIndex.objects.filter(
+                token_id=token_id,
+                **{field+'__in':queryset}
+            ).values_list(field+'_id', flat=True)
+            rows.extend(
+                AccessIndex(token_id=token_id, **{field+'_id':pk}) for pk in ids.difference(present)
+            )
+    AccessIndex.objects.bulk_create(rows, batch_size=500)
@@ -5,4 +5,6 @@ from IoT import models
 admin.site.register(models.Projects)
 admin.site.register(models.Zones)
 admin.site.register(models.Node)
-admin.site.register(models.Sensors)
\ No newline at end of file
+admin.site.register(models.Sensors)
+admin.site.register(models.RetentionPolicy)
+admin.site.register(models.DeletionJob)
@@ -0,0 +1,306 @@
+from django.conf import settings
+from django.db import connections
+from IoT.models import Sensors, Measurement
+import IoT.api.ingest as ingest
+import atexit
+import datetime
+import decimal
+import glob
+import json
+import logging
+import os
+import threading
+
+"""
+Write-ahead ingest buffer
+====
+
+Instead of committing a transaction per request, validated and
+authorized measurements are appended to a local log and kept in
+memory, a flusher thread group commits them every FLUSH_MS
+milliseconds or as soon as FLUSH_ROWS are waiting.
+
+Durability modes (DURABILITY):
+
+* fsync: The log is synced to disk before the request is answered.
+  Requests arriving during a sync are covered by the next one, thus
+  concurrent requests share their syncs
+* write: The log is written without syncing, readings survive a
+  process crash but not a power loss
+* memory: No log, readings waiting to be flushed are lost on a crash
+
+Every process writes its own log segments (<PATH>.<pid>.<n>), a
+segment is removed once its readings are committed. Segments left by
+a crash are loaded by the replay_ingest_log command, which must run
+before the web workers start. Replay is at least once: readings of a
+segment committed right before a crash are stored again
+"""
+
+DEFAULT_SETTINGS = {
+    # Hand measurements to the buffer instead of storing them on every request
+    'ENABLED':False,
+    # fsync, write or memory
+    'DURABILITY':'fsync',
+    # Log segments prefix, relative paths start at BASE_DIR
+    'PATH':'ingest.wal',
+    # Milliseconds between group commits
+    'FLUSH_MS':200,
+    # Rows triggering a group commit before FLUSH_MS
+    'FLUSH_ROWS':5000,
+    # Rows waiting to be flushed before new readings are rejected
+    'MAX_ROWS':100000,
+}
+
+FSYNC = 'fsync'
+WRITE = 'write'
+MEMORY = 'memory'
+
+logger = logging.getLogger(__name__)
+
+
+class BufferFull(Exception):
+    """
+    Raised when readings can't be accepted until the buffer is flushed
+    """
+    pass
+
+
+def config():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'IOT_INGEST_BUFFER', {}))
+
+
+def log_prefix(path):
+    return path if os.path.isabs(path) else os.path.join(settings.BASE_DIR, path)
+
+
+def encode(m):
+    return [m.sensor_id, m.zone_id, m.project_id, m.measurement_type, str(m.value), m.created_at.isoformat()]
+
+
+def decode(row):
+    sensor_id, zone_id, project_id, m_type, value, created_at = row
+    return Measurement(
+        sensor_id=sensor_id,
+        zone_id=zone_id,
+        project_id=project_id,
+        measurement_type=m_type,
+        value=decimal.Decimal(value),
+        created_at=datetime.datetime.fromisoformat(created_at),
+    )
+
+
+def store(objs):
+    """
+    Commits buffered measurements, readings of deleted sensors are discarded
+    """
+    sensor_ids = {m.sensor_id for m in objs}
+    existing = set(Sensors.objects.filter(pk__in=sensor_ids).values_list('pk', flat=True))
+    objs = [m for m in objs if m.sensor_id in existing]
+    if objs:
+        ingest.store_measurements(objs)
+    return len(objs)
+
+
+def read_segment(path):
+    """
+    Returns the measurements of a log segment
+    ====
+
+    A line cut by a crash can only be the last one, it's skipped
+    """
+    objs = []
+    with open(path) as f:
+        for line in f:
+            try:
+                rows = json.loads(line)
+            except ValueError:
+                logger.warning('Skipping truncated record of %s', path)
+                continue
+            objs.extend(decode(row) for row in rows)
+    return objs
+
+
+def replay(path=None):
+    """
+    Stores the measurements of the segments left in the log, returns the amount stored
+    """
+    stored = 0
+    for segment in sorted(glob.glob(glob.escape(log_prefix(path or config()['PATH'])) + '.*.*')):
+        stored += store(read_segment(segment))
+        os.remove(segment)
+    return stored
+
+
+class IngestBuffer:
+    """
+    Log backed queue of measurements group committed by a flusher thread
+    """
+    def __init__(self, options=None):
+        self.options = dict(config(), **(options or {}))
+        if self.options['DURABILITY'] not in (FSYNC, WRITE, MEMORY):
+            raise ValueError('Unknown durability mode {}'.format(self.options['DURABILITY']))
+        self.prefix = log_prefix(self.options['PATH'])
+        # Guards pending, the sequence and the current segment
+        self._lock = threading.Lock()
+        # Serializes syncs and segment rotations, always taken before _lock
+        self._sync_lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._pending = []
+        self._seq = 0
+        self._synced = 0
+        self._segments = 0
+        self._segment = None
+        # Segments whose readings are pending or being flushed
+        self._unflushed = []
+        self._thread = None
+        self._closed = False
+
+    def _open_segment(self):
+        if self.options['DURABILITY'] == MEMORY:
+            return
+        self._segments += 1
+        path = '{}.{}.{:08d}'.format(self.prefix, os.getpid(), self._segments)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._segment = open(path, 'a')
+        self._unflushed.append(path)
+
+    def add(self, objs):
+        """
+        Accepts unsaved measurements, returns once they are as durable as configured
+        """
+        line = json.dumps([encode(m) for m in objs]) + '\n'
+        with self._lock:
+            if self._closed:
+                raise BufferFull('Ingest buffer is closed')
+            if len(self._pending) + len(objs) > self.options['MAX_ROWS']:
+                raise BufferFull('Too many measurements waiting to be stored')
+            if self.options['DURABILITY'] != MEMORY:
+                if self._segment is None:
+                    self._open_segment()
+                self._segment.write(line)
+                self._segment.flush()
+            self._seq += 1
+            seq = self._seq
+            self._pending.extend(objs)
+            if len(self._pending) >= self.options['FLUSH_ROWS']:
+                self._wake.notify()
+        if self.options['DURABILITY'] == FSYNC:
+            self._sync(seq)
+
+    def _sync(self, seq):
+        with self._sync_lock:
+            # A sync started after seq was written already covers it
+            if self._synced >= seq:
+                return
+            with self._lock:
+                target = self._seq
+                segment = self._segment
+            if segment is not None:
+                os.fsync(segment.fileno())
+            self._synced = max(self._synced, target)
+
+    def _drain(self):
+        """
+        Takes the pending measurements and starts a new segment
+        """
+        with self._sync_lock:
+            with self._lock:
+                objs, self._pending = self._pending, []
+                segment, self._segment = self._segment, None
+                segments, self._unflushed = self._unflushed, []
+                if segment is not None:
+                    if self.options['DURABILITY'] == FSYNC:
+                        os.fsync(segment.fileno())
+                    segment.close()
+                self._synced = self._seq
+        return objs, segments
+
+    def flush(self):
+        """
+        Group commits the pending measurements, returns the amount stored
+        ====
+
+        On failure measurements are queued again in front of the newer
+        ones and their segments are kept
+        """
+        objs, segments = self._drain()
+        if not objs:
+            for path in segments:
+                os.remove(path)
+            return 0
+        try:
+            stored = store(objs)
+        except Exception:
+            with self._lock:
+                self._pending[:0] = objs
+                self._unflushed[:0] = segments
+            raise
+        for path in segments:
+            os.remove(path)
+        return stored
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _run(self):
+        interval = self.options['FLUSH_MS'] / 1000
+        try:
+            while True:
+                with self._lock:
+                    if not self._closed and len(self._pending) < self.options['FLUSH_ROWS']:
+                        self._wake.wait(interval)
+                    closed = self._closed
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception('Ingest buffer flush failed')
+                    if closed:
+                        return
+                if closed:
+                    return
+        finally:
+            connections.close_all()
+
+    def start(self):
+        """
+        Starts the flusher thread
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='iot-ingest-flusher', daemon=True)
+                self._thread.start()
+
+    def close(self):
+        """
+        Stops accepting readings and flushes the pending ones
+        """
+        with self._lock:
+            self._closed = True
+            self._wake.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        else:
+            self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def active():
+    """
+    Returns the process ingest buffer, None when it's disabled
+    """
+    global _buffer
+    if not config()['ENABLED']:
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                buffer = IngestBuffer()
+                buffer.start()
+                atexit.register(buffer.close)
+                _buffer = buffer
+    return _buffer
@@ -0,0 +1,160 @@
+from django.utils.module_loading import import_string
+from rest_framework import permissions, status
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from users.api.cauth import CAccessTokenRestAuth
+from IoT.middleware import read_chunked
+import IoT.api.permissions as IoTPermissions
+import IoT.api.ingest as ingest
+import IoT.api.lines as lines
+import IoT.api.buffer as ingest_buffer
+import IoT.api.parsers as parsers
+import IoT.api.renderers as renderers
+
+"""
+Device ingestion routes
+====
+
+measure and measure_lines are served twice: as actions of
+IoTProjectsViewSet (IoT/api/g/...) and as lean views for devices
+(IoT/api/ingest/...). Lean views only accept CA-TOKEN authentication,
+always answer JSON without looking at the Accept header and, listed in
+IOT_LEAN_ROUTES, skip the session, CSRF, authentication, messages and
+clickjacking middleware (see IoT.middleware.LeanRouteMiddleware)
+"""
+
+
+def measure(request):
+    """
+    Stores the measurements of a request, see IoTProjectsViewSet.measure
+    """
+    ex = 'Unknown'
+    msg = ''
+    try:
+        if isinstance(request.data, parsers.Frames):
+            ingest_data = ingest.ingest_frames
+            measurements = request.data
+        else:
+            ingest_data = ingest.ingest_readings
+            measurements =  request.data['sensors']
+            if not isinstance(measurements, list):
+                measurements = [measurements]
+        try:
+            result = ingest_data(request, measurements, buffer=ingest_buffer.active())
+        except ingest_buffer.BufferFull as e:
+            response = Response({
+                'status':'Measurements not accepted',
+                'exception':str(e),
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = '1'
+            return response
+        if result.buffered:
+            return Response({
+                'status':'Measurements accepted' if not result.errors else 'Some measurements were not accepted',
+                'accepted':result.buffered,
+                'errors':result.errors,
+            }, status=status.HTTP_202_ACCEPTED if not result.errors else status.HTTP_207_MULTI_STATUS)
+        created = ingest.created_representation(result.created)
+        if not result.errors:
+            return Response({
+                'status':'Information shown',
+                'measurements':created
+            }, status=status.HTTP_201_CREATED)
+        elif result.created:
+            return Response({
+                'status':'Some measurements were not created',
+                'measurements':created,
+                'errors':result.errors,
+            }, status=status.HTTP_207_MULTI_STATUS)
+        else:
+            return Response({
+                'status':'Error on data',
+                'errors':result.errors,
+            }, status=status.HTTP_403_FORBIDDEN if result.denied else status.HTTP_400_BAD_REQUEST)
+
+    except KeyError as e:
+        ex = 'KeyError'
+        msg = 'Verify you are sending the measurements you want to create inside the "sensors" parameter within the body'
+    except Exception as e:
+        ex = str(e)
+        msg = ''
+    return Response({
+        'status':'Something went wrong',
+        'exception':ex,
+        'message':msg
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+
+def measure_lines(request):
+    """
+    Stores the line protocol body of a request, see IoTProjectsViewSet.measure_lines
+    """
+    # DRF has no stream without Content-Length, chunked bodies are read from Django's request
+    read_chunked(request._request)
+    stream = request.stream if request.stream is not None else request._request
+    try:
+        result = lines.ingest_lines(request, stream, buffer=ingest_buffer.active())
+    except ingest_buffer.BufferFull as e:
+        response = Response({
+            'status':'Measurements not accepted',
+            'exception':str(e),
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = '1'
+        return response
+    if not result.lines:
+        return Response({
+            'status':'Empty body',
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if result.stored and not result.rejected:
+        response_status = status.HTTP_201_CREATED
+    elif result.stored:
+        response_status = status.HTTP_207_MULTI_STATUS
+    elif result.rejected and result.denied == result.rejected:
+        response_status = status.HTTP_403_FORBIDDEN
+    else:
+        response_status = status.HTTP_400_BAD_REQUEST
+    return Response({
+        'status':'Measurements stored' if result.stored else 'Error on data',
+        'stored':result.stored,
+        'rejected':result.rejected,
+        'errors':result.errors,
+    }, status=response_status)
+
+
+class DeviceContentNegotiation(DefaultContentNegotiation):
+    """
+    Parsers are selected by Content-Type, responses always use the first renderer
+    """
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
+
+
+class DeviceAPIView(APIView):
+    """
+    Base of the lean device views
+    """
+    authentication_classes = (CAccessTokenRestAuth,)
+    permission_classes = (permissions.IsAuthenticated,IoTPermissions.CanManageSensor,)
+    renderer_classes = (import_string(renderers.JSON_RENDERER),)
+    content_negotiation_class = DeviceContentNegotiation
+    throttle_classes = ()
+
+
+class MeasureView(DeviceAPIView):
+    """
+    Lean IoTProjectsViewSet.measure
+    """
+    parser_classes = (JSONParser,) + tuple(parsers.measurement_parsers())
+
+    def post(self, request):
+        return measure(request)
+
+
+class MeasureLinesView(DeviceAPIView):
+    """
+    Lean IoTProjectsViewSet.measure_lines
+    """
+    def post(self, request):
+        return measure_lines(request)
@@ -0,0 +1,379 @@
+from collections import namedtuple
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers as rest_serializers
+from IoT.models import Sensors, Measurement
+from IoT import plot_cache, rollups
+from IoT.api.pagination import parse_timestamp
+import IoT.api.permissions as IoTPermissions
+import IoT.api.serializers as serializers
+import IoT.model_choices as choices
+import datetime
+import decimal
+import numpy as np
+
+"""
+Bulk measurement ingestion
+====
+
+Readings are validated in a single pass, their sensors are resolved
+with one query, authorization is evaluated once for the whole set of
+sensors and the resulting rows are written using bulk inserts.
+
+Readings may carry the time they were taken by the device (timestamp),
+it must lie within the clock skew bounds of IOT_TIMESTAMP_SKEW.
+Historical series are loaded with backfill, which writes them in time
+sorted chunks
+"""
+
+# Amount of rows sent on each INSERT statement
+INGEST_CHUNK_SIZE = getattr(settings, 'IOT_INGEST_CHUNK_SIZE', 500)
+
+DEFAULT_SKEW = {
+    # Seconds a device clock may run ahead of the server
+    'FUTURE':300,
+    # Seconds a reading may be delayed, None accepts any past timestamp
+    'PAST':7 * 86400,
+}
+
+# Rows written by each backfill transaction
+BACKFILL_CHUNK_SIZE = getattr(settings, 'IOT_BACKFILL_CHUNK_SIZE', 5000)
+
+# Largest absolute value in hundredths (Measurement.value has 8 digits, 2 decimals)
+MAX_FRAME_VALUE = 10 ** 8 - 1
+# Frame timestamps (epoch milliseconds) datetime can represent
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+MIN_FRAME_TIMESTAMP = (datetime.datetime(1, 1, 2, tzinfo=datetime.timezone.utc) - EPOCH) // datetime.timedelta(milliseconds=1)
+MAX_FRAME_TIMESTAMP = (datetime.datetime(9999, 12, 30, tzinfo=datetime.timezone.utc) - EPOCH) // datetime.timedelta(milliseconds=1)
+
+Reading = namedtuple('Reading', ['index', 'id_sensor', 'measurement_type', 'value', 'timestamp'], defaults=(None,))
+
+
+def skew():
+    return dict(DEFAULT_SKEW, **getattr(settings, 'IOT_TIMESTAMP_SKEW', {}))
+
+
+def parse_device_timestamp(raw, now=None, past=True):
+    """
+    Validates a device timestamp, ISO 8601 strings or UNIX epoch seconds
+    ====
+
+    Raises ValidationError when it isn't within the skew bounds,
+    past=False only checks the future bound (backfills)
+    """
+    try:
+        if isinstance(raw, bool):
+            raise ValueError
+        elif isinstance(raw, (int, float)):
+            timestamp = datetime.datetime.fromtimestamp(raw, tz=datetime.timezone.utc)
+        elif isinstance(raw, str):
+            timestamp = parse_timestamp(raw, 'timestamp')
+        else:
+            raise ValueError
+    except (ValueError, OverflowError, OSError):
+        raise rest_serializers.ValidationError('Expected an ISO 8601 datetime or UNIX epoch seconds')
+    bounds = skew()
+    now = now or timezone.now()
+    if timestamp > now + datetime.timedelta(seconds=bounds['FUTURE']):
+        raise rest_serializers.ValidationError('Timestamp is ahead of the server clock')
+    if past and bounds['PAST'] is not None and timestamp < now - datetime.timedelta(seconds=bounds['PAST']):
+        raise rest_serializers.ValidationError('Timestamp is too old, use the backfill endpoint')
+    return timestamp
+
+
+class IngestResult:
+    """
+    Outcome of a bulk ingestion
+    ====
+
+    * created: Saved Measurement instances in the order they were sent,
+    their pk is None unless the backend returns bulk inserted rows
+    * errors: One entry per rejected row containing its index inside
+    the request and the reasons it was rejected
+    * buffered: Amount of readings accepted by the ingest buffer, they
+    are stored later thus created is empty
+    """
+    def __init__(self, created, errors, denied=0, buffered=0):
+        self.created = created
+        self.errors = errors
+        self.denied = denied
+        self.buffered = buffered
+
+
+def created_representation(objs):
+    """
+    Serializes stored measurements leaving out the ids the backend didn't return
+    """
+    data = serializers.MeasurementSerializer(objs, many=True).data
+    if objs and objs[0].pk is None:
+        for row in data:
+            del row['id']
+    return data
+
+
+def row_error(index, errors, id_sensor=None):
+    """
+    Formats the error of a rejected row
+    """
+    return {
+        'index':index,
+        'id_sensor':id_sensor,
+        'errors':errors,
+    }
+
+
+def validate_readings(readings):
+    """
+    Validates every raw reading using MeasurementSerializer fields
+    ====
+
+    The serializer fields are built once and reused for every row,
+    returns a tuple (valid readings, row errors)
+    """
+    now = timezone.now()
+    fields = serializers.MeasurementSerializer().fields
+    id_field = fields['id_sensor']
+    value_field = fields['value']
+    type_field = fields['measurement_type']
+    valid = []
+    errors = []
+    for i, raw in enumerate(readings):
+        if not isinstance(raw, dict):
+            errors.append(row_error(i, {'non_field_errors':['Invalid data, expected an object']}))
+            continue
+        row_errors = {}
+        cleaned = {}
+        for name, field in (('id_sensor', id_field), ('value', value_field), ('measurement_type', type_field)):
+            try:
+                cleaned[name] = field.run_validation(raw.get(name, rest_serializers.empty))
+            except rest_serializers.ValidationError as e:
+                row_errors[name] = e.detail
+        if raw.get('timestamp') is not None:
+            try:
+                cleaned['timestamp'] = parse_device_timestamp(raw['timestamp'], now)
+            except rest_serializers.ValidationError as e:
+                row_errors['timestamp'] = e.detail
+        if row_errors:
+            errors.append(row_error(i, row_errors, raw.get('id_sensor')))
+            continue
+        valid.append(Reading(i, cleaned['id_sensor'], cleaned['measurement_type'], cleaned['value'], cleaned.get('timestamp')))
+    return valid, errors
+
+
+def resolve_sensors(request, readings):
+    """
+    Resolves and authorizes the sensors referenced by readings
+    ====
+
+    Returns a tuple (sensors by id, accepted readings, row errors, denied rows)
+    """
+    sensor_ids = {r.id_sensor for r in readings}
+    sensors = Sensors.objects.in_bulk(list(sensor_ids))
+    allowed = IoTPermissions.allowed_sensor_ids(request, sensors.keys())
+    accepted = []
+    errors = []
+    denied = 0
+    for r in readings:
+        if r.id_sensor not in sensors:
+            errors.append(row_error(r.index, {'id_sensor':['Sensor with id {} does not exist'.format(r.id_sensor)]}, r.id_sensor))
+        elif r.id_sensor not in allowed:
+            denied += 1
+            errors.append(row_error(r.index, {'id_sensor':['You do not have permission to manage this sensor']}, r.id_sensor))
+        else:
+            accepted.append(r)
+    return sensors, accepted, errors, denied
+
+
+def store_measurements(objs, chunk_size=None):
+    """
+    Stores Measurement instances using chunked bulk inserts
+    ====
+
+    Rollups and plot versions are updated within the same transaction.
+    Primary keys are only filled on backends returning the rows of bulk
+    inserts (PostgreSQL), elsewhere they stay None: matching rows by
+    sensor, type and date could hand out ids of concurrent requests
+    """
+    with transaction.atomic():
+        Measurement.objects.bulk_create(objs, batch_size=chunk_size or INGEST_CHUNK_SIZE)
+        rollups.record(objs)
+        plot_cache.touch(o.sensor_id for o in objs)
+    return objs
+
+
+def build_measurements(readings, sensors):
+    """
+    Returns the unsaved Measurement instances of validated readings
+    """
+    return [
+        Measurement(
+            sensor=sensors[r.id_sensor],
+            zone_id=sensors[r.id_sensor].zone_id,
+            project_id=sensors[r.id_sensor].project_id,
+            measurement_type=r.measurement_type,
+            value=r.value,
+            created_at=r.timestamp or timezone.now(),
+        )
+        for r in readings
+    ]
+
+
+def write_readings(readings, sensors, chunk_size=None):
+    """
+    Writes validated readings using chunked bulk inserts
+    """
+    return store_measurements(build_measurements(readings, sensors), chunk_size)
+
+
+def ingest_readings(request, readings, chunk_size=None, buffer=None):
+    """
+    Validates, authorizes and stores a batch of raw readings
+    ====
+
+    Rows that fail validation or authorization are reported
+    individually while the rest of the batch is stored. When an
+    IngestBuffer is given accepted readings are handed to it and
+    group committed later (see IoT.api.buffer)
+    """
+    valid, errors = validate_readings(readings)
+    return ingest_valid(request, valid, errors, chunk_size, buffer)
+
+
+def ingest_valid(request, valid, errors, chunk_size=None, buffer=None):
+    """
+    Authorizes and stores validated readings, see ingest_readings
+    """
+    sensors, accepted, denied_errors, denied = resolve_sensors(request, valid)
+    errors.extend(denied_errors)
+    errors.sort(key=lambda e: e['index'])
+    if buffer is not None:
+        if accepted:
+            buffer.add(build_measurements(accepted, sensors))
+        return IngestResult([], errors, denied, len(accepted))
+    created = write_readings(accepted, sensors, chunk_size) if accepted else []
+    return IngestResult(created, errors, denied)
+
+
+def validate_series(series, now=None):
+    """
+    Validates backfill series
+    ====
+
+    Every series is {id_sensor, measurement_type, points:[[timestamp, value]]},
+    returns a tuple (valid readings, errors). Errors hold the index of the
+    series and the point (None for the whole series)
+    """
+    fields = serializers.MeasurementSerializer().fields
+    now = now or timezone.now()
+    valid = []
+    errors = []
+    for i, raw in enumerate(series):
+        if not isinstance(raw, dict) or not isinstance(raw.get('points'), list):
+            errors.append(dict(row_error(i, {'non_field_errors':['Expected an object with a points list']}), point=None))
+            continue
+        header_errors = {}
+        header = {}
+        for name in ('id_sensor', 'measurement_type'):
+            try:
+                header[name] = fields[name].run_validation(raw.get(name, rest_serializers.empty))
+            except rest_serializers.ValidationError as e:
+                header_errors[name] = e.detail
+        if header_errors:
+            errors.append(dict(row_error(i, header_errors, raw.get('id_sensor')), point=None))
+            continue
+        for j, point in enumerate(raw['points']):
+            try:
+                timestamp, value = point
+                timestamp = parse_device_timestamp(timestamp, now, past=False)
+                value = fields['value'].run_validation(value)
+            except (TypeError, ValueError):
+                errors.append(dict(row_error(i, {'points':['Expected a [timestamp, value] pair']}, header['id_sensor']), point=j))
+                continue
+            except rest_serializers.ValidationError as e:
+                errors.append(dict(row_error(i, {'points':e.detail}, header['id_sensor']), point=j))
+                continue
+            valid.append(Reading(i, header['id_sensor'], header['measurement_type'], value, timestamp))
+    return valid, errors
+
+
+def backfill(readings, sensors, chunk_size=None):
+    """
+    Stores timestamped readings in time sorted chunks
+    ====
+
+    Each chunk is written in its own transaction, rollups are merged
+    and plot versions bumped incrementally per chunk. Returns the
+    amount of stored measurements
+    """
+    chunk_size = chunk_size or BACKFILL_CHUNK_SIZE
+    readings = sorted(readings, key=lambda r: (r.timestamp, r.id_sensor))
+    for i in range(0, len(readings), chunk_size):
+        store_measurements(build_measurements(readings[i:i+chunk_size], sensors))
+    return len(readings)
+
+
+def validate_frames(frames, now=None):
+    """
+    Validates decoded binary frames (see IoT.api.parsers)
+    ====
+
+    Type codes, values and timestamps are checked on whole columns,
+    readings are only built for valid rows. Returns a tuple
+    (valid readings, row errors)
+    """
+    records = frames.records
+    codes = choices.MEASUREMENT_TYPE_CODES
+    invalid_type = ~np.isin(records['type'], list(codes))
+    invalid_value = np.abs(records['value'].astype(np.int64)) > MAX_FRAME_VALUE
+    invalid = invalid_type | invalid_value
+    timestamps = None
+    if frames.timestamps:
+        bounds = skew()
+        now_ms = int((now or timezone.now()).timestamp() * 1000)
+        timestamps = records['timestamp']
+        # Timestamps datetime can't convert are only looked for row by row when the column has any
+        if len(timestamps) and (timestamps.min() < MIN_FRAME_TIMESTAMP or timestamps.max() > MAX_FRAME_TIMESTAMP):
+            out_of_range = (timestamps < MIN_FRAME_TIMESTAMP) | (timestamps > MAX_FRAME_TIMESTAMP)
+        else:
+            out_of_range = np.zeros(len(timestamps), dtype=bool)
+        invalid_timestamp = out_of_range | (timestamps > now_ms + bounds['FUTURE'] * 1000)
+        if bounds['PAST'] is not None:
+            invalid_timestamp |= (timestamps != 0) & (timestamps < now_ms - bounds['PAST'] * 1000)
+        invalid |= invalid_timestamp
+    errors = []
+    for i in np.flatnonzero(invalid).tolist():
+        row_errors = {}
+        if invalid_type[i]:
+            row_errors['measurement_type'] = ['Unknown type code {}'.format(records['type'][i])]
+        if invalid_value[i]:
+            row_errors['value'] = ['Value out of range']
+        if timestamps is not None and out_of_range[i]:
+            row_errors['timestamp'] = ['Timestamp out of range']
+        elif timestamps is not None and invalid_timestamp[i]:
+            row_errors['timestamp'] = ['Timestamp out of the clock skew bounds']
+        errors.append(row_error(i, row_errors, int(records['sensor'][i])))
+    rows = np.flatnonzero(~invalid)
+    sensors = records['sensor'][rows].tolist()
+    m_types = records['type'][rows].tolist()
+    values = records['value'][rows].tolist()
+    dates = timestamps[rows].tolist() if timestamps is not None else [0] * len(rows)
+    valid = [
+        Reading(
+            i,
+            sensor_id,
+            codes[code],
+            decimal.Decimal(value).scaleb(-2),
+            datetime.datetime.fromtimestamp(ms / 1000, tz=datetime.timezone.utc) if ms else None,
+        )
+        for i, sensor_id, code, value, ms in zip(rows.tolist(), sensors, m_types, values, dates)
+    ]
+    return valid, errors
+
+
+def ingest_frames(request, frames, chunk_size=None, buffer=None):
+    """
+    Validates, authorizes and stores binary frames, see ingest_readings
+    """
+    valid, errors = validate_frames(frames)
+    return ingest_valid(request, valid, errors, chunk_size, buffer)
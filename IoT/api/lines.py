@@ -0,0 +1,193 @@
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import serializers as rest_serializers
+import IoT.api.ingest as ingest
+import IoT.model_choices as choices
+import decimal
+
+"""
+Line protocol ingestion
+====
+
+Plain text bodies with one reading per line:
+
+    <sensor id> <measurement type> <value> [timestamp]
+
+Fields are separated by spaces or tabs, the type is its name or its
+binary frame code (MEASUREMENT_TYPE_CODES) and the optional timestamp
+is UNIX epoch seconds or an ISO 8601 datetime. Empty lines and lines
+starting with # are ignored.
+
+The body is read from the request stream in blocks and tokenized
+without decoding the whole body, readings are authorized and committed
+every LINES_CHUNK_SIZE lines so bodies of any size use bounded memory
+"""
+
+# Readings authorized and committed together
+LINES_CHUNK_SIZE = getattr(settings, 'IOT_LINES_CHUNK_SIZE', 5000)
+# Bytes read from the request on each call
+READ_SIZE = 64 * 1024
+# Longer lines are rejected without being buffered
+MAX_LINE = 1024
+# Rejected lines reported in the response, the rest are only counted
+MAX_ERRORS = 100
+
+TYPES = dict(
+    [(name.encode(), name) for name, label in choices.MEASUREMENT_TYPE_CHOICES] +
+    [(str(code).encode(), name) for code, name in choices.MEASUREMENT_TYPE_CODES.items()]
+)
+MAX_VALUE = decimal.Decimal('999999.99')
+HUNDREDTHS = decimal.Decimal('0.01')
+
+
+class LineError(Exception):
+    """
+    Raised when a line can't be parsed
+    """
+    def __init__(self, field, message):
+        super().__init__(message)
+        self.field = field
+        self.message = message
+
+
+def tokenize(stream, read_size=READ_SIZE, max_line=MAX_LINE):
+    """
+    Yields (line number, line bytes) from a binary stream
+    ====
+
+    Lines longer than max_line are yielded as None once their end is found
+    """
+    pending = b''
+    number = 0
+    overflow = False
+    while True:
+        block = stream.read(read_size)
+        if not block:
+            break
+        start = 0
+        while True:
+            end = block.find(b'\n', start)
+            if end < 0:
+                break
+            number += 1
+            if overflow or len(pending) + end - start > max_line:
+                yield number, None
+            else:
+                yield number, pending + block[start:end]
+            pending = b''
+            overflow = False
+            start = end + 1
+        if not overflow:
+            pending += block[start:]
+            if len(pending) > max_line:
+                pending = b''
+                overflow = True
+    if overflow:
+        yield number + 1, None
+    elif pending:
+        yield number + 1, pending
+
+
+def parse_line(number, line, now):
+    """
+    Parses a line into a Reading, None for empty and comment lines
+    """
+    if line is None:
+        raise LineError('non_field_errors', 'Line longer than {} bytes'.format(MAX_LINE))
+    fields = line.split()
+    if not fields or fields[0].startswith(b'#'):
+        return None
+    if len(fields) not in (3, 4):
+        raise LineError('non_field_errors', 'Expected "sensor_id type value [timestamp]"')
+    if not fields[0].isdigit() or len(fields[0]) > 10:
+        raise LineError('id_sensor', 'A valid integer is required')
+    m_type = TYPES.get(fields[1])
+    if m_type is None:
+        raise LineError('measurement_type', 'Unknown measurement type')
+    try:
+        value = decimal.Decimal(fields[2].decode('ascii'))
+    except (decimal.InvalidOperation, UnicodeDecodeError):
+        raise LineError('value', 'A valid number is required')
+    if not value.is_finite() or abs(value) > MAX_VALUE or value != value.quantize(HUNDREDTHS):
+        raise LineError('value', 'Expected at most 6 integer digits and 2 decimals')
+    timestamp = None
+    if len(fields) == 4:
+        raw = fields[3].decode('ascii', 'replace')
+        try:
+            raw = float(raw)
+        except ValueError:
+            pass
+        try:
+            timestamp = ingest.parse_device_timestamp(raw, now)
+        except rest_serializers.ValidationError as e:
+            raise LineError('timestamp', str(e.detail[0]))
+    return ingest.Reading(number, int(fields[0]), m_type, value, timestamp)
+
+
+class LinesResult:
+    """
+    Outcome of a line protocol ingestion
+    ====
+
+    * lines: Lines read, an empty body has none
+    * stored: Readings stored (or accepted by the ingest buffer)
+    * rejected: Lines rejected
+    * errors: The first MAX_ERRORS rejected lines, index is the line number
+    """
+    def __init__(self):
+        self.lines = 0
+        self.stored = 0
+        self.rejected = 0
+        self.denied = 0
+        self.errors = []
+
+    def reject(self, errors):
+        self.rejected += len(errors)
+        self.errors.extend(errors[:MAX_ERRORS - len(self.errors)])
+
+
+def commit(request, readings, result, buffer=None):
+    """
+    Authorizes and stores a chunk of readings
+    """
+    sensors, accepted, errors, denied = ingest.resolve_sensors(request, readings)
+    result.denied += denied
+    result.reject(errors)
+    if accepted:
+        measurements = ingest.build_measurements(accepted, sensors)
+        if buffer is not None:
+            buffer.add(measurements)
+        else:
+            ingest.store_measurements(measurements)
+        result.stored += len(accepted)
+
+
+def ingest_lines(request, stream, chunk_size=None, buffer=None):
+    """
+    Parses, authorizes and stores a line protocol body
+    ====
+
+    Chunks are committed as they are parsed, thus readings before
+    a failure stay stored
+    """
+    chunk_size = chunk_size or LINES_CHUNK_SIZE
+    result = LinesResult()
+    now = timezone.now()
+    readings = []
+    for number, line in tokenize(stream):
+        result.lines = number
+        try:
+            reading = parse_line(number, line, now)
+        except LineError as e:
+            result.reject([ingest.row_error(number, {e.field:[e.message]})])
+            continue
+        if reading is None:
+            continue
+        readings.append(reading)
+        if len(readings) >= chunk_size:
+            commit(request, readings, result, buffer)
+            readings = []
+    if readings:
+        commit(request, readings, result, buffer)
+    result.errors.sort(key=lambda e: e['index'])
+    return result
@@ -0,0 +1,134 @@
+from django.conf import settings
+from django.db.models import Q
+from django.utils import dateparse, timezone
+import base64, datetime
+
+"""
+Measurement time filtering and pagination
+====
+
+Time filters are translated into [start, end) ranges over created_at
+and pages are selected with a (created_at, id) keyset, thus reading a
+page costs the same no matter how much data a sensor has
+"""
+
+# Amount of measurements returned per page by default and at most, only
+# applied when "page_size" or "cursor" are given
+PAGE_SIZE = getattr(settings, 'IOT_MEASUREMENTS_PAGE_SIZE', 1000)
+MAX_PAGE_SIZE = getattr(settings, 'IOT_MEASUREMENTS_MAX_PAGE_SIZE', 10000)
+
+
+def parse_timestamp(value, name):
+    """
+    Parses an ISO 8601 date or datetime query parameter
+    """
+    parsed = dateparse.parse_datetime(value)
+    if parsed is None:
+        day = dateparse.parse_date(value)
+        if day is None:
+            raise ValueError('"{}" must be an ISO 8601 date or datetime'.format(name))
+        parsed = datetime.datetime(day.year, day.month, day.day)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.get_current_timezone())
+    return parsed
+
+
+def calendar_range(year, month=None, day=None):
+    """
+    Returns the [start, end) range of a year, month or day
+    ====
+
+    Dates that don't exist (e.g. February 30) produce an empty range
+    """
+    tz = timezone.get_current_timezone()
+    year = int(year)
+    try:
+        if month is None:
+            start = datetime.datetime(year, 1, 1)
+            end = datetime.datetime(year + 1, 1, 1)
+        elif day is None:
+            start = datetime.datetime(year, int(month), 1)
+            end = datetime.datetime(year + int(month) // 12, int(month) % 12 + 1, 1)
+        else:
+            start = datetime.datetime(year, int(month), int(day))
+            end = start + datetime.timedelta(days=1)
+    except ValueError:
+        start = end = datetime.datetime(max(min(year, datetime.MAXYEAR), datetime.MINYEAR), 1, 1)
+    return timezone.make_aware(start, tz), timezone.make_aware(end, tz)
+
+
+def time_range(params):
+    """
+    Returns the (start, end) range requested within params
+    ====
+
+    * "from" and "to": ISO 8601 bounds, "to" is exclusive
+    * "y", "m" and "d": Calendar year, month and day
+    """
+    start = end = None
+    if 'y' in params:
+        start, end = calendar_range(
+            params['y'],
+            params.get('m'),
+            params.get('d') if 'm' in params else None,
+        )
+    if 'from' in params:
+        start = max(filter(None, (start, parse_timestamp(params['from'], 'from'))))
+    if 'to' in params:
+        end = min(filter(None, (end, parse_timestamp(params['to'], 'to'))))
+    return start, end
+
+
+class KeysetPage:
+    """
+    Selects a page of measurements ordered by (created_at, id)
+    ====
+
+    The "cursor" parameter is the opaque "next" value returned by the
+    previous page and "page_size" the amount of measurements requested,
+    when neither is given the request isn't paginated
+    """
+    def __init__(self, params):
+        self.requested = 'page_size' in params or 'cursor' in params
+        try:
+            self.page_size = int(params.get('page_size', PAGE_SIZE))
+        except ValueError:
+            raise ValueError('"page_size" must be an integer')
+        if self.page_size < 1:
+            raise ValueError('"page_size" must be greater than 0')
+        self.page_size = min(self.page_size, MAX_PAGE_SIZE)
+        self.position = self.decode(params['cursor']) if params.get('cursor') else None
+
+    @staticmethod
+    def encode(created_at, pk):
+        raw = '{}|{}'.format(created_at.isoformat(), pk)
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def decode(cursor):
+        try:
+            created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            parsed = dateparse.parse_datetime(created_at)
+            if parsed is None:
+                raise ValueError()
+            return parsed, int(pk)
+        except (ValueError, TypeError, UnicodeDecodeError):
+            raise ValueError('Invalid cursor')
+
+    def paginate(self, queryset):
+        """
+        Returns (measurements of the page, cursor of the next page or None)
+        """
+        queryset = queryset.order_by('created_at', 'id')
+        if not self.requested:
+            return queryset, None
+        if self.position is not None:
+            created_at, pk = self.position
+            queryset = queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            )
+        rows = list(queryset[:self.page_size + 1])
+        if len(rows) <= self.page_size:
+            return rows, None
+        rows = rows[:self.page_size]
+        return rows, self.encode(rows[-1].created_at, rows[-1].pk)
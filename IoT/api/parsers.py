@@ -0,0 +1,145 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+import numpy as np
+import struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+"""
+Binary measurement parsers
+====
+
+Compact request bodies for constrained devices, negotiated by the
+Content-Type of the request:
+
+* application/x-iot-frame: Fixed width frames. A 4 bytes header
+  (magic "IM", version, flags) followed by little endian records of
+  (uint32 sensor id, uint8 type code, int32 value in hundredths) and,
+  when flag 1 is set, an int64 UNIX epoch timestamp in milliseconds
+  (0 uses the arrival time). Type codes are listed in
+  model_choices.MEASUREMENT_TYPE_CODES. Records are decoded in place
+  with numpy, no object is built per row
+* application/msgpack and application/cbor: The same structure as JSON
+  bodies, available when msgpack or cbor2 are installed
+"""
+
+FRAME_MEDIA_TYPE = 'application/x-iot-frame'
+FRAME_MAGIC = b'IM'
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct('<2sBB')
+# Header flags
+FLAG_TIMESTAMPS = 1
+
+RECORD = np.dtype([('sensor', '<u4'), ('type', 'u1'), ('value', '<i4')])
+TIMESTAMPED_RECORD = np.dtype([('sensor', '<u4'), ('type', 'u1'), ('value', '<i4'), ('timestamp', '<i8')])
+
+
+class Frames:
+    """
+    Decoded frame records
+    ====
+
+    records is a numpy structured array sharing the request body memory
+    """
+    def __init__(self, records, timestamps):
+        self.records = records
+        self.timestamps = timestamps
+
+    def __len__(self):
+        return len(self.records)
+
+
+def decode_frames(body):
+    """
+    Decodes a frame body into Frames without copying its records
+    """
+    body = memoryview(body)
+    if len(body) < FRAME_HEADER.size:
+        raise ParseError('Frame header missing')
+    magic, version, flags = FRAME_HEADER.unpack_from(body)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ParseError('Unknown frame format')
+    dtype = TIMESTAMPED_RECORD if flags & FLAG_TIMESTAMPS else RECORD
+    size = len(body) - FRAME_HEADER.size
+    if size % dtype.itemsize:
+        raise ParseError('Frame length is not a multiple of {} bytes'.format(dtype.itemsize))
+    records = np.frombuffer(body, dtype=dtype, offset=FRAME_HEADER.size)
+    return Frames(records, bool(flags & FLAG_TIMESTAMPS))
+
+
+def encode_frames(rows, timestamps=False):
+    """
+    Encodes (sensor id, type code, value, [epoch ms]) rows into a frame body
+    ====
+
+    Meant for clients and tests, values are rounded to hundredths
+    """
+    dtype = TIMESTAMPED_RECORD if timestamps else RECORD
+    records = np.zeros(len(rows), dtype=dtype)
+    for i, row in enumerate(rows):
+        records[i]['sensor'] = row[0]
+        records[i]['type'] = row[1]
+        records[i]['value'] = round(row[2] * 100)
+        if timestamps:
+            records[i]['timestamp'] = row[3]
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, FLAG_TIMESTAMPS if timestamps else 0)
+    return header + records.tobytes()
+
+
+class FrameParser(BaseParser):
+    """
+    Parses fixed width measurement frames into Frames
+    """
+    media_type = FRAME_MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return decode_frames(stream.read() if stream is not None else b'')
+
+
+class MessagePackParser(BaseParser):
+    """
+    Parses MessagePack bodies
+    """
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except Exception as e:
+            raise ParseError('MessagePack parse error - {}'.format(e))
+
+
+class CBORParser(BaseParser):
+    """
+    Parses CBOR bodies
+    """
+    media_type = 'application/cbor'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return cbor2.loads(stream.read())
+        except Exception as e:
+            raise ParseError('CBOR parse error - {}'.format(e))
+
+
+def measurement_parsers():
+    """
+    Returns the binary parsers available for measurement ingestion
+    ====
+
+    Optional formats are only listed when their package is installed
+    """
+    parsers = [FrameParser]
+    if msgpack is not None:
+        parsers.append(MessagePackParser)
+    if cbor2 is not None:
+        parsers.append(CBORParser)
+    return parsers
@@ -6,33 +6,65 @@ from IoT import models
 def owned_objects(token):
     """
     Returns token owned instances in a dictionary
+    ====
+    Values are lazy querysets built from the token access index
     """
     owns = {
-        'projects':[],
-        'zones':[],
-        'nodes':[],
-        'sensors':[],
+        'projects':models.Projects.objects.none(),
+        'zones':models.Zones.objects.none(),
+        'nodes':models.Node.objects.none(),
+        'sensors':models.Sensors.objects.none(),
     }
     if isinstance(token, CustomAccessTokens):
-        owns['projects'] = token.token_iot_projects.all()
-        owned_zones = []
-        for p in owns['projects']:
-            owned_zones.extend(p.project_zones.all())
-        owns['zones'] = owned_zones
-        owns['zones'].extend(token.token_iot_zones.all())
-        owned_nodes = []
-        owned_sensors = []
-        for z in owns['zones']:
-            owned_nodes.extend(z.zone_nodes.all())
-            owned_sensors.extend(z.zone_ambiental_sensors.all())
-        owns['nodes'] = owned_nodes
-        owns['nodes'].extend(token.token_iot_nodes.all())
-        for n in owns['nodes']:
-            owned_sensors.extend(n.node_sensors.all())
-        owns['sensors'] = owned_sensors
-        
+        owns['projects'] = models.Projects.objects.filter(access_index__token=token)
+        owns['zones'] = models.Zones.objects.filter(access_index__token=token)
+        owns['nodes'] = models.Node.objects.filter(access_index__token=token)
+        owns['sensors'] = models.Sensors.objects.filter(access_index__token=token)
     return owns
 
+
+def token_owns(token, **lookup):
+    """
+    Validates a single object against the token access index
+    ====
+    lookup must be a single keyword, e.g. token_owns(token, zone=zone)
+    """
+    if not isinstance(token, CustomAccessTokens):
+        return False
+    return models.AccessIndex.objects.filter(token=token, **lookup).exists()
+
+
+def allowed_sensor_ids(request, sensor_ids):
+    """
+    Returns the subset of sensor_ids the request can manage
+    ====
+    Evaluates CanManageSensor for a whole set of sensors at once
+    """
+    sensor_ids = list(set(sensor_ids))
+    if request.user.is_superuser and request.auth is None:
+        return set(sensor_ids)
+    if not isinstance(request.auth, CustomAccessTokens):
+        return set()
+    allowed = set()
+    # Chunked to stay below the query parameter limits of the database
+    for i in range(0, len(sensor_ids), 500):
+        allowed.update(models.AccessIndex.objects.filter(
+            token=request.auth,
+            sensor_id__in=sensor_ids[i:i+500]
+        ).values_list('sensor_id', flat=True))
+    return allowed
+
+
+def allowed_projects(request, queryset):
+    """
+    Filters a projects queryset to the projects the request can manage
+    ====
+    Evaluates IsProjectOwner for a whole set of projects at once
+    """
+    if request.user.is_superuser and request.auth is None:
+        return queryset
+    return queryset.filter(pk__in=owned_objects(request.auth)['projects'].values('pk'))
+
 class IsProjectOwner(permissions.BasePermission):
     """
     Validates if the request user has project permissions
@@ -48,9 +80,8 @@ class IsProjectOwner(permissions.BasePermission):
         if request.user.is_superuser and request.auth is None:
             return True
         token = request.auth
-        owns = owned_objects(token)
         if isinstance(obj, models.Projects):
-            return obj in owns['projects']
+            return token_owns(token, project=obj)
         elif isinstance(obj, models.Zones):
             return IsZoneOwner().has_object_permission(request,view,obj)
         raise exceptions.PermissionDenied(detail={'ERROR':'No project detected'}, code=403)
@@ -71,9 +102,8 @@ class IsZoneOwner(permissions.BasePermission):
         if request.user.is_superuser and request.auth is None:
             return True
         token = request.auth
-        owns = owned_objects(token)
         if isinstance(obj, models.Zones):
-            return obj in owns['zones']
+            return token_owns(token, zone=obj)
         elif isinstance(obj, models.Node):
             return IsNodeOwner().has_object_permission(request,view,obj)
         elif isinstance(obj, models.Sensors):
@@ -96,9 +126,8 @@ class IsNodeOwner(permissions.BasePermission):
         if request.user.is_superuser and request.auth is None:
             return True
         token = request.auth
-        owns = owned_objects(token)
         if isinstance(obj, models.Node):
-            return obj in owns['nodes']
+            return token_owns(token, node=obj)
         elif isinstance(obj, models.Sensors):
             return CanManageSensor().has_object_permission(request,view,obj)
         raise exceptions.PermissionDenied(detail={'ERROR':'No node detected'}, code=403)
@@ -118,7 +147,6 @@ class CanManageSensor(permissions.BasePermission):
         if request.user.is_superuser and request.auth is None:
             return True
         token = request.auth
-        owns = owned_objects(token)
         if isinstance(obj, models.Sensors):
-            return obj in owns['sensors']
+            return token_owns(token, sensor=obj)
         raise exceptions.PermissionDenied(detail={'ERROR':'No sensor detected'}, code=403)
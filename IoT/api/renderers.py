@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework import renderers
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+"""
+IoT API renderers
+====
+
+FastJSONRenderer encodes responses with orjson when it's installed,
+falling back to DRF's JSONRenderer otherwise. Output matches
+JSONRenderer: Decimal values are numbers, UTC datetimes end with Z and
+keep milliseconds, U+2028 and U+2029 are escaped.
+
+The JSON renderer of the IoT API is pluggable through IOT_JSON_RENDERER
+"""
+
+# Renderer replacing DRF's JSONRenderer on the IoT API
+JSON_RENDERER = getattr(settings, 'IOT_JSON_RENDERER', 'IoT.api.renderers.FastJSONRenderer')
+
+if orjson is not None:
+    # Datetimes are passed to encode_default, orjson keeps microseconds
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+# Decimal, datetime and the values orjson doesn't encode follow DRF's JSONEncoder
+encode_default = JSONEncoder().default
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer encoding with orjson
+    ====
+
+    Indented responses (e.g. "; indent=4" media types) are rendered
+    by JSONRenderer
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=encode_default, option=ORJSON_OPTIONS)
+        # Line separators aren't valid inside JavaScript strings
+        if b'\xe2\x80' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+def renderer_classes():
+    """
+    Returns the DEFAULT_RENDERER_CLASSES using JSON_RENDERER instead of JSONRenderer
+    """
+    json_renderer = import_string(JSON_RENDERER)
+    return tuple(
+        json_renderer if issubclass(r, renderers.JSONRenderer) and not issubclass(r, json_renderer) else r
+        for r in api_settings.DEFAULT_RENDERER_CLASSES
+    )
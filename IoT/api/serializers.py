@@ -1,7 +1,7 @@
 from rest_framework.exceptions import ParseError
 from django.shortcuts import get_object_or_404
 from rest_framework import routers, serializers, viewsets
-from IoT.models import Projects, Zones, Node, Sensors, Measurement
+from IoT.models import Projects, Zones, Node, Sensors, Measurement, MeasurementRollup, DeletionJob
 from users.models import CustomAccessTokens
 
 """
@@ -45,7 +45,7 @@ class NodeSerializer(serializers.ModelSerializer):
     """
     Serializer for Node model
     """
-    id_zone = serializers.IntegerField(source="zone.id", read_only=True)
+    id_zone = serializers.IntegerField(source="zone_id", read_only=True)
     class Meta:
         model = Node
         fields = ('id', 'name', 'description', 'id_zone')
@@ -70,7 +70,7 @@ class SensorsSerializer(serializers.ModelSerializer):
     """
     Serializer for Sensors model
     """
-    id_node = serializers.IntegerField(source="node.id", read_only=True, required=False)
+    id_node = serializers.IntegerField(source="node_id", read_only=True, required=False)
     class Meta:
         model = Sensors
         fields = ('id', 'ambiental', 'sensor_type', 'id_node')
@@ -116,6 +116,26 @@ class MeasurementSerializer(serializers.ModelSerializer):
         m.save()
         return m
 
+
+class MeasurementRollupSerializer(serializers.ModelSerializer):
+    """
+    Serializer for MeasurementRollup model
+    """
+    id_sensor = serializers.IntegerField(source="sensor_id", read_only=True)
+    average = serializers.DecimalField(max_digits=8, decimal_places=2, read_only=True)
+    class Meta:
+        model = MeasurementRollup
+        fields = ('bucket', 'id_sensor', 'measurement_type', 'min_value', 'max_value', 'average', 'count', 'last_value', 'last_at')
+
+
+class DeletionJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for DeletionJob model
+    """
+    class Meta:
+        model = DeletionJob
+        fields = ('id', 'object_type', 'object_id', 'status', 'deleted_rows', 'error', 'created_at', 'started_at', 'finished_at')
+
             
 """
 Nested serializers
@@ -127,7 +147,7 @@ class NestedSensorSerializer(serializers.ModelSerializer):
     Manages sensor measurements
     """
     measurements = MeasurementSerializer(many=True, read_only=True, source='sensor_measurements')
-    id_node = serializers.IntegerField(source="node.id", read_only=True)
+    id_node = serializers.IntegerField(source="node_id", read_only=True)
     class Meta:
         model = Sensors
         fields = ('id', 'ambiental', 'sensor_type', 'id_node', 'measurements')
@@ -140,7 +160,7 @@ class NestedNodeSerializer(serializers.ModelSerializer):
     This serializer includes The sensor nodes
     """
     sensors = SensorsSerializer(many=True, read_only=True, source='node_sensors')
-    id_zone = serializers.IntegerField(source="zone.id", read_only=True)
+    id_zone = serializers.IntegerField(source="zone_id", read_only=True)
     class Meta:
         model = Node
         fields = ['id', 'name', 'description', 'sensors','id_zone']
@@ -155,7 +175,7 @@ class NestedZoneSerializer(serializers.ModelSerializer):
     """
     ambiental = SensorsSerializer(many=True, read_only=True, source='ambiental_sensors')
     nodes = NestedNodeSerializer(many=True, read_only=True, source='zone_nodes')
-    id_project = serializers.IntegerField(source="project.id")
+    id_project = serializers.IntegerField(source="project_id", read_only=True)
     
     class Meta:
         model = Zones
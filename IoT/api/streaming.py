@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+import IoT.api.serializers as serializers
+import json
+
+"""
+Streamed measurement responses
+====
+
+Measurements are read from the database in chunks and encoded one
+row at a time, so the memory used by a response doesn't depend on
+the amount of measurements it contains
+"""
+
+# Rows fetched from the database on each round trip while streaming
+STREAM_CHUNK_SIZE = getattr(settings, 'IOT_STREAM_CHUNK_SIZE', 2000)
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """
+    Newline delimited JSON renderer
+    ====
+
+    Enables the "?format=ndjson" negotiation, streamed responses are
+    encoded by stream_measurements, other responses (e.g. errors) are
+    rendered as a single line
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return (json.dumps(data, cls=JSONEncoder) + '\n').encode()
+
+
+def measurement_representation(sensor_id):
+    """
+    Returns a function that converts a measurement values row into a dict
+    ====
+
+    Uses MeasurementSerializer fields so rows look exactly like
+    serialized Measurement instances
+    """
+    fields = serializers.MeasurementSerializer().fields
+    value = fields['value'].to_representation
+    created_at = fields['created_at'].to_representation
+
+    def represent(row):
+        pk, v, c, m_type = row
+        return {
+            'id':pk,
+            'value':value(v),
+            'created_at':created_at(c),
+            'id_sensor':sensor_id,
+            'measurement_type':m_type,
+        }
+    return represent
+
+
+def measurement_encoder(sensor_id):
+    """
+    Returns a function that encodes a measurement values row as JSON
+    """
+    represent = measurement_representation(sensor_id)
+    return lambda row: json.dumps(represent(row))
+
+
+def measurement_rows(queryset, chunk_size=None):
+    """
+    Iterates (id, value, created_at, measurement_type) rows in order
+    """
+    return queryset.order_by('created_at', 'id').values_list(
+        'id', 'value', 'created_at', 'measurement_type'
+    ).iterator(chunk_size=chunk_size or STREAM_CHUNK_SIZE)
+
+
+def ndjson_lines(rows, encode):
+    for row in rows:
+        yield encode(row) + '\n'
+
+
+def json_array(rows, encode, status):
+    """
+    Streams the same body as a non paginated response, "next" is always null
+    """
+    yield '{{"status":{},"measurements":['.format(json.dumps(status))
+    separator = ''
+    for row in rows:
+        yield separator + encode(row)
+        separator = ','
+    yield '],"next":null}'
+
+
+def stream_measurements(queryset, sensor_id, ndjson=False, chunk_size=None):
+    """
+    Returns a StreamingHttpResponse with every measurement of queryset
+    ====
+
+    * ndjson=True: One measurement per line ("application/x-ndjson")
+    * ndjson=False: A JSON object with the measurements array
+    """
+    rows = measurement_rows(queryset, chunk_size)
+    encode = measurement_encoder(sensor_id)
+    if ndjson:
+        return StreamingHttpResponse(ndjson_lines(rows, encode), content_type=NDJSONRenderer.media_type)
+    return StreamingHttpResponse(json_array(rows, encode, 'Sensor found'), content_type='application/json')
@@ -3,19 +3,27 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import action, api_view
 from rest_framework.authentication import  BasicAuthentication
+from rest_framework.settings import api_settings
 from users.api.cauth import CAccessTokenRestAuth
 from users.models import GeneralUser
 from django.http import Http404
 import IoT.api.serializers as serializers
 import IoT.models as models
 import IoT.api.permissions as IoTPermissions
-import json
+import IoT.api.ingest as ingest
+import IoT.api.pagination as pagination
+import IoT.api.parsers as parsers
+import IoT.api.renderers as renderers
+import IoT.api.streaming as streaming
+import IoT.api.device as device
+from IoT import deletions, downsampling, loaders, rollups, series
 
 class IoTProjectsViewSet(viewsets.ViewSet):
     """
     General IoT project api conncetions managment.
     """
     authentication_classes = (BasicAuthentication,CAccessTokenRestAuth, )
+    renderer_classes = renderers.renderer_classes()
 
     """
     ============
@@ -36,15 +44,12 @@ class IoTProjectsViewSet(viewsets.ViewSet):
             return Response({
                 'status':'Information not available',
             }, status=status.HTTP_400_BAD_REQUEST)
-        allowed_projects = []
-        for project in request.user.user_iot_projects.all():
-            try:
-                self.check_object_permissions(request, project)
-                allowed_projects.append(project)
-            except:
-                pass
+        allowed_projects = IoTPermissions.allowed_projects(request, request.user.user_iot_projects.order_by('id'))
         try:
-            serialized_projects = serializers.NestedProjectsSerializer(allowed_projects, many=True)
+            serialized_projects = serializers.NestedProjectsSerializer(
+                loaders.load_project_tree(allowed_projects),
+                many=True
+            )
             return Response({
                 'status':'Information shown',
                 'projects':serialized_projects.data, 
@@ -78,7 +83,7 @@ class IoTProjectsViewSet(viewsets.ViewSet):
         project = get_object_or_404(models.Projects, pk=pk)
         self.check_object_permissions(request, project)
         try:
-            serialized_project = serializers.NestedProjectsSerializer(project, many=False)
+            serialized_project = serializers.NestedProjectsSerializer(loaders.load_project_tree(project)[0], many=False)
             return Response({
                 'status':'Information shown',
                 'project'.format(pk):serialized_project.data, 
@@ -169,13 +174,18 @@ class IoTProjectsViewSet(viewsets.ViewSet):
             # Manage incoming delete requests
             elif request.method == "DELETE":
                 deleted_zones = []
-                for zone in request.data['zones']:
-                    z = get_object_or_404(models.Zones,pk=zone['id_zone'])
-                    z.delete()
-                    deleted_zones.append({'id_zone':zone['id_zone']})
+                jobs = []
+                # Every zone is validated before any of them is deleted
+                zones = [get_object_or_404(models.Zones,pk=zone['id_zone']) for zone in request.data['zones']]
+                for z in zones:
+                    self.check_object_permissions(request, z)
+                for z in zones:
+                    jobs.append(deletions.tombstone(z, request.user))
+                    deleted_zones.append({'id_zone':z.id})
                 return Response({
                     'status':'Zone{} deletion succesfull'.format('s' if len(deleted_zones) > 1 else ''),
-                    'deleted_zones':deleted_zones
+                    'deleted_zones':deleted_zones,
+                    'deletions':serializers.DeletionJobSerializer(jobs, many=True).data,
                 },status=status.HTTP_200_OK)
 
             # Manage incoming get requests
@@ -265,9 +275,10 @@ class IoTProjectsViewSet(viewsets.ViewSet):
             elif request.method == 'DELETE':
                 filtered_zone = get_object_or_404(models.Zones,pk=pk)
                 self.check_object_permissions(request, filtered_zone)
-                filtered_zone.delete()
+                job = deletions.tombstone(filtered_zone, request.user)
                 return Response({
-                    'status':'Zone deletion successful'
+                    'status':'Zone deletion successful',
+                    'deletion':serializers.DeletionJobSerializer(job).data,
                 }, status=status.HTTP_200_OK)
 
             elif request.method == 'GET':
@@ -374,14 +385,16 @@ class IoTProjectsViewSet(viewsets.ViewSet):
             # Manage incoming delete requests
             elif request.method == "DELETE":
                 deleted_nodes = []
+                jobs = []
                 for node in request.data['nodes']:
                     n = get_object_or_404(models.Node,pk=node['id_node'])
                     self.check_object_permissions(request, n)
-                    n.delete()
+                    jobs.append(deletions.tombstone(n, request.user))
                     deleted_nodes.append({'id_node':node['id_node']})
                 return Response({
                     'status':'Node{} deletion succesfull'.format('s' if len(deleted_nodes)>1 else ''),
-                    'deleted_nodes':deleted_nodes
+                    'deleted_nodes':deleted_nodes,
+                    'deletions':serializers.DeletionJobSerializer(jobs, many=True).data,
                 }, status=status.HTTP_200_OK)
             # Manage incoming get requests
             elif request.method == "GET":
@@ -488,14 +501,16 @@ class IoTProjectsViewSet(viewsets.ViewSet):
             # Manage incoming delete requests
             elif request.method == "DELETE":
                 deletd_sensors = []
+                jobs = []
                 for sensor in request.data['sensors']:
                     s = get_object_or_404(models.Sensors,pk=sensor['id_sensor'])
                     self.check_object_permissions(request, s)
-                    s.delete()
+                    jobs.append(deletions.tombstone(s, request.user))
                     deletd_sensors.append({'id_sensor':sensor['id_sensor']})
                 return Response({
                     'status':'Sensor{} deletion succesfull'.format('s' if len(deletd_sensors)>1 else ''),
-                    'deleted_sensors':deletd_sensors
+                    'deleted_sensors':deletd_sensors,
+                    'deletions':serializers.DeletionJobSerializer(jobs, many=True).data,
                 },status=status.HTTP_200_OK)
             # Manage incoming get requests
             elif request.method == "GET":
@@ -581,9 +596,10 @@ class IoTProjectsViewSet(viewsets.ViewSet):
             elif request.method == 'DELETE':
                 filtered_node = get_object_or_404(models.Node,pk=pk)
                 self.check_object_permissions(request, filtered_node)
-                filtered_node.delete()
+                job = deletions.tombstone(filtered_node, request.user)
                 return Response({
-                    'status':'Node deletion successful'
+                    'status':'Node deletion successful',
+                    'deletion':serializers.DeletionJobSerializer(job).data,
                 }, status=status.HTTP_200_OK)
 
             elif request.method == 'GET':
@@ -689,14 +705,16 @@ class IoTProjectsViewSet(viewsets.ViewSet):
             # Manage incoming delete requests
             elif request.method == "DELETE":
                 deletd_sensors = []
+                jobs = []
                 for sensor in request.data['sensors']:
                     s = get_object_or_404(models.Sensors,pk=sensor['id_sensor'])
                     self.check_object_permissions(request, s)
-                    s.delete()
+                    jobs.append(deletions.tombstone(s, request.user))
                     deletd_sensors.append({'id_sensor':sensor['id_sensor']})
                 return Response({
                     'status':'Sensor{} deletion succesfull'.format('s' if len(deletd_sensors)>1 else ''),
-                    'deleted_sensors':deletd_sensors
+                    'deleted_sensors':deletd_sensors,
+                    'deletions':serializers.DeletionJobSerializer(jobs, many=True).data,
                 },status=status.HTTP_200_OK)
             # Manage incoming get requests
             elif request.method == "GET":
@@ -761,9 +779,10 @@ class IoTProjectsViewSet(viewsets.ViewSet):
             if request.method == "DELETE":
                 sensor = get_object_or_404(models.Sensors,pk=pk)
                 self.check_object_permissions(request, sensor)
-                sensor.delete()
+                job = deletions.tombstone(sensor, request.user)
                 return Response({
-                    'status':'Sensor deleted succesfully'
+                    'status':'Sensor deleted succesfully',
+                    'deletion':serializers.DeletionJobSerializer(job).data,
                 }, status=status.HTTP_200_OK)
         
         except KeyError as e:
@@ -779,29 +798,125 @@ class IoTProjectsViewSet(viewsets.ViewSet):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
-    @action(detail=True, methods=["get",], permission_classes=(permissions.IsAuthenticated,IoTPermissions.CanManageSensor,))
+    @action(detail=True, methods=["get",], permission_classes=(permissions.IsAuthenticated,IoTPermissions.CanManageSensor,),
+        renderer_classes=renderers.renderer_classes() + (streaming.NDJSONRenderer,))
     def sensor_measurements(self, request, pk=None):
         """
         Get all sensor measurements
         =====
 
-        Measurements can filtered based on date, to do so send the "date" parameter within the get request
+        Measurements are returned ordered by their creation date, when "page_size" or
+        "cursor" are given they are returned in pages and if there are more measurements
+        the "next" argument of the body will contain the cursor of the next page,
+        otherwise every measurement in the range is returned and "next" is null
+
+        #### Query parameters:
+        * *from* / *to*: ISO 8601 dates or datetimes limiting the creation date, "to" is exclusive
+        * *y*, *m*, *d*: Calendar year, month and day of creation
+        * *page_size*: Amount of measurements per page
+        * *cursor*: Value of "next" returned by the previous page
+        * *type*: Only return measurements of this measurement type
+
+        #### Downsampling:
+        * *points*: Reduces every measurement type in the range to at most this amount of points
+        * *mode*: "lttb" (default), "minmax" or "avg", averaged points have a null id
+
+        Downsampled responses are not paginated
+
+        #### Streaming:
+        * *format=ndjson*: Streams every measurement in the range, one JSON object per line
+        * *stream=1*: Streams every measurement in the range as a single JSON body
+
+        Streamed responses ignore pagination, their "next" is always null and they
+        are never fully loaded in memory
         """
         try:
             sensor = get_object_or_404(models.Sensors,pk=pk)
             self.check_object_permissions(request, sensor)
-            measurements = sensor.sensor_measurements
-            if "y" in request.query_params:
-                measurements = measurements.filter(created_at__year=request.query_params['y'])
-                if "m" in request.query_params:
-                    measurements = measurements.filter(created_at__month=request.query_params['m'])
-                    if "d" in request.query_params:
-                        measurements = measurements.filter(created_at__day=request.query_params['d'])
-                    
+            try:
+                start, end = pagination.time_range(request.query_params)
+                page = pagination.KeysetPage(request.query_params)
+            except ValueError as e:
+                return Response({
+                    'status':'Invalid parameters',
+                    'exception':str(e),
+                }, status=status.HTTP_400_BAD_REQUEST)
+            measurements = sensor.sensor_measurements.between(start, end)
+            if 'type' in request.query_params:
+                measurements = measurements.filter(measurement_type=request.query_params['type'])
+            if 'points' in request.query_params:
+                mode = request.query_params.get('mode', 'lttb')
+                try:
+                    points = downsampling.parse_points(request.query_params['points'], mode)
+                except ValueError as e:
+                    return Response({
+                        'status':'Invalid parameters',
+                        'exception':str(e),
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                # Series are loaded as NumPy arrays, rows are only built for the kept points
+                rows = downsampling.downsample_series(
+                    series.load(measurements, 'measurement_type', ids=True),
+                    min(points, pagination.MAX_PAGE_SIZE),
+                    mode,
+                )
+                represent = streaming.measurement_representation(sensor.id)
+                return Response({
+                    'status':'Sensor found',
+                    'measurements':[represent(r) for r in rows],
+                    'next':None,
+                }, status=status.HTTP_200_OK)
+            ndjson = request.accepted_renderer.format == streaming.NDJSONRenderer.format
+            if ndjson or request.query_params.get('stream') in ('1', 'true'):
+                return streaming.stream_measurements(measurements, sensor.id, ndjson=ndjson)
+            measurements, next_cursor = page.paginate(measurements)
             ser = serializers.MeasurementSerializer(measurements, many=True)
             return Response({
                 'status':'Sensor found',
                 'measurements':ser.data,
+                'next':next_cursor,
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({
+                'status':'No sensor matching id {}'.format(pk),
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+
+    @action(detail=True, methods=["get",], permission_classes=(permissions.IsAuthenticated,IoTPermissions.CanManageSensor,))
+    def sensor_aggregates(self, request, pk=None):
+        """
+        Get aggregated sensor measurements
+        =====
+
+        Returns the minimum, maximum, average, count and last value of a
+        measurement type per time bucket, answered from the coarsest rollup
+        that satisfies the requested resolution
+
+        #### Query parameters:
+        * *type*: Measurement type to aggregate (required)
+        * *resolution*: Maximum bucket size in seconds, defaults to 3600
+        * *from* / *to*, *y*, *m*, *d*: Same range filters as sensor_measurements
+
+        The "granularity" of the body is null when the resolution is finer than
+        every rollup, in that case raw measurements are aggregated per minute
+        """
+        try:
+            sensor = get_object_or_404(models.Sensors,pk=pk)
+            self.check_object_permissions(request, sensor)
+            try:
+                start, end = pagination.time_range(request.query_params)
+                resolution = int(request.query_params.get('resolution', 3600))
+                m_type = request.query_params['type']
+            except (ValueError, KeyError) as e:
+                return Response({
+                    'status':'Invalid parameters',
+                    'exception':str(e),
+                }, status=status.HTTP_400_BAD_REQUEST)
+            granularity, buckets = rollups.series(sensor.id, m_type, start, end, resolution)
+            ser = serializers.MeasurementRollupSerializer(buckets, many=True)
+            return Response({
+                'status':'Sensor found',
+                'granularity':granularity,
+                'aggregates':ser.data,
             }, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({
@@ -815,36 +930,144 @@ class IoTProjectsViewSet(viewsets.ViewSet):
     ============
     """    
 
-    @action(detail=False, methods=["post",], permission_classes=(permissions.IsAuthenticated,IoTPermissions.CanManageSensor,))
+    @action(detail=False, methods=["post",], permission_classes=(permissions.IsAuthenticated,IoTPermissions.CanManageSensor,),
+        parser_classes=tuple(api_settings.DEFAULT_PARSER_CLASSES) + tuple(parsers.measurement_parsers()))
     def measure(self, request):
-        ex = 'Unknown'
-        msg = ''
+        """
+        ## Register sensor measurements
+        ====
+
+        #### Allowed methods:
+        * #### *POST*: Stores the measurements sent within the "sensors" argument
+
+        Batches are validated and authorized as a whole, rows that can't be
+        stored are reported individually inside the "errors" argument using
+        their index within the request while the rest of the batch is stored
+
+        Besides JSON, bodies can be sent as binary frames (application/x-iot-frame)
+        or, when installed, MessagePack and CBOR (see IoT.api.parsers)
+
+        When the ingest buffer is enabled (IOT_INGEST_BUFFER) measurements
+        are stored shortly after the response, which then contains the amount
+        of "accepted" measurements instead of the stored ones
+
+        ### Responses:
+        * *201*: Every measurement was stored
+        * *202*: Every measurement was accepted by the ingest buffer
+        * *207*: Only some measurements were stored or accepted
+        * *400* / *403*: No measurement was stored
+        * *503*: The ingest buffer is full, retry later
+        """
+        return device.measure(request)
+
+
+    @action(detail=False, methods=["post",], permission_classes=(permissions.IsAuthenticated,IoTPermissions.CanManageSensor,))
+    def measure_lines(self, request):
+        """
+        ## Register sensor measurements from plain text
+        ====
+
+        #### Allowed methods:
+        * #### *POST*: Stores one measurement per line of the body
+
+        Lines are "sensor_id type value [timestamp]" where type is the name
+        or the code of a measurement type and timestamp is optional (UNIX
+        epoch seconds or ISO 8601). The body is streamed and stored in
+        chunks, rejected lines are reported by their line number
+        ##### Example:
+        3 A_TEMPERATURE 21.5
+        3 2 40.25 1577836800
+
+        ### Responses:
+        * *201*: Every line was stored
+        * *207*: Only some lines were stored
+        * *400* / *403*: No line was stored
+        * *503*: The ingest buffer is full, retry later
+        """
+        return device.measure_lines(request)
+
+    @action(detail=False, methods=["post",], permission_classes=(permissions.IsAuthenticated,IoTPermissions.CanManageSensor,))
+    def backfill(self, request):
+        """
+        ## Load historical measurements
+        ====
+
+        #### Allowed methods:
+        * #### *POST*: Stores the series sent within the "series" argument
+
+        Every series holds the points of a sensor measurement type as
+        [timestamp, value] pairs, timestamps are ISO 8601 datetimes or UNIX
+        epoch seconds and may be as old as needed. Points are stored in time
+        sorted chunks, aggregates are updated incrementally
+        ##### Example:
+        {
+            series: [
+                {
+                    id_sensor:#,
+                    measurement_type:"",
+                    points: [["2020-01-01T00:00:00Z", 20.5], [1577836860, 20.7]]
+                }
+            ]
+        }
+
+        ### Responses:
+        * *201*: Every point was stored
+        * *207*: Only some points were stored, see "errors"
+        * *400* / *403*: No point was stored
+        """
         try:
-            measurements =  request.data['sensors']
-            for m in measurements:
-                self.check_object_permissions(request, get_object_or_404(models.Sensors,pk=m['id_sensor']))
+            series = request.data['series']
+            if not isinstance(series, list):
+                series = [series]
+        except (KeyError, TypeError):
+            return Response({
+                'status':'Something went wrong',
+                'message':'Verify you are sending the series you want to load inside the "series" parameter within the body',
+            }, status=status.HTTP_400_BAD_REQUEST)
+        valid, errors = ingest.validate_series(series)
+        sensors, accepted, denied_errors, denied = ingest.resolve_sensors(request, valid)
+        # Authorization errors are reported once per series
+        reported = set()
+        for error in denied_errors:
+            if error['index'] not in reported:
+                reported.add(error['index'])
+                errors.append(dict(error, point=None))
+        errors.sort(key=lambda e: (e['index'], -1 if e['point'] is None else e['point']))
+        stored = ingest.backfill(accepted, sensors) if accepted else 0
+        if stored and not errors:
+            response_status = status.HTTP_201_CREATED
+        elif stored:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_403_FORBIDDEN if denied else status.HTTP_400_BAD_REQUEST
+        return Response({
+            'status':'Series stored' if stored else 'Error on data',
+            'stored':stored,
+            'errors':errors,
+        }, status=response_status)
 
-            s_serializer = serializers.MeasurementSerializer(data=measurements, many=True)
-            if s_serializer.is_valid():
-                s_serializer.save()
-                return Response({
-                    'status':'Information shown',
-                    'measurements':s_serializer.data
-                }, status=status.HTTP_201_CREATED)
-            else:
-                return Response({
-                    'status':'Error on data',
-                    'errors':json.dumps(s_serializer.errors),
-                }, status=status.HTTP_400_BAD_REQUEST)
-        
-        except KeyError as e:
-            ex = 'KeyError'
-            msg = 'Verify you are sending the measurements you want to create inside the "sensors" parameter within the body'
-        except Exception as e:
-            ex = str(e)
-            msg = ''
+
+    """
+    ============
+    Deletions
+    ============
+    """
+
+    @action(detail=True, methods=["get",], permission_classes=(permissions.IsAuthenticated,))
+    def deletion(self, request, pk=None):
+        """
+        Status of a deletion
+        ====
+
+        Deleted zones, nodes and sensors disappear right away while their
+        measurements are purged in the background. Poll this endpoint with
+        the id of the "deletion" returned by the DELETE request, "status"
+        is one of pending, running, done or failed and "deleted_rows" counts
+        the measurements and aggregates purged so far
+        """
+        job = get_object_or_404(models.DeletionJob, pk=pk, user=request.user)
+        ser = serializers.DeletionJobSerializer(job)
         return Response({
-            'status':'Something went wrong',
-            'exception':ex,
-            'message':msg
-        }, status=status.HTTP_400_BAD_REQUEST)
+            'status':'Deletion found',
+            'deletion':ser.data,
+        }, status=status.HTTP_200_OK)
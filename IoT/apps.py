@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class IotConfig(AppConfig):
     name = 'IoT'
+
+    def ready(self):
+        import IoT.signals
+        import IoT.checks
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+"""
+Deployment checks
+====
+
+Hierarchy snapshot versions are bumped in the cache of the worker
+storing the change, every worker must therefore read them from the
+same cache. Run with "manage.py check --deploy"
+"""
+
+# Cache backends only visible to the process using them
+PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def shared_caches(app_configs, **kwargs):
+    """
+    Warns when IOT_HIERARCHY_CACHE uses a per process cache
+    """
+    from IoT import hierarchy
+    warnings = []
+    for name, config, stale in (
+        ('IOT_HIERARCHY_CACHE', hierarchy.config(), 'other workers keep stale hierarchy snapshots for up to MAX_AGE seconds'),
+    ):
+        alias = config['CACHE_ALIAS']
+        backend = settings.CACHES.get(alias, {}).get('BACKEND')
+        if backend in PROCESS_CACHES:
+            warnings.append(Warning(
+                '{} uses the per process cache "{}", {}'.format(name, alias, stale),
+                hint='Point CACHE_ALIAS to a cache shared by every worker (e.g. Memcached or Redis)',
+                id='IoT.W001',
+            ))
+    return warnings
@@ -0,0 +1,191 @@
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from IoT.models import Zones, Node, Sensors, Measurement, MeasurementRollup, AccessIndex, DeletionJob
+from IoT.retention import delete_in_batches
+from IoT import hierarchy
+import IoT.model_choices as choices
+import logging
+import threading
+
+"""
+Background deletion of zones, nodes and sensors
+====
+
+Deleting an object with millions of measurements through Django's
+collector takes longer than a request, thus deletions are split:
+
+* tombstone: Marks the object and everything under it as deleted
+  (deleted_at), removes their access index rows and creates a
+  DeletionJob. Tombstoned objects are hidden by their default manager
+  so they vanish from reads and permission checks right away
+* purge: Deletes the measurements and rollups of the tombstoned
+  sensors in batches (see IoT.retention.delete_in_batches) and then
+  the objects themselves, which no longer have rows to cascade
+
+Jobs are purged by a background thread started once the deleting
+transaction commits, or by the purge_deletions command
+"""
+
+DEFAULT_SETTINGS = {
+    # Purge jobs on a background thread of the web process
+    'ASYNC':True,
+}
+
+logger = logging.getLogger(__name__)
+
+# Chunk of sensor ids used within IN lookups
+SENSORS_CHUNK = 500
+
+
+def config():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'IOT_DELETIONS', {}))
+
+
+def object_type(obj):
+    return {Zones:choices.ZONE, Node:choices.NODE, Sensors:choices.SENSOR}[type(obj)]
+
+
+def subtree(kind, pk):
+    """
+    Returns {access index field: queryset} of an object and its children
+    ====
+
+    Querysets include tombstoned rows
+    """
+    if kind == choices.ZONE:
+        return {
+            'zone':Zones.all_objects.filter(pk=pk),
+            'node':Node.all_objects.filter(zone_id=pk),
+            'sensor':Sensors.all_objects.filter(zone_id=pk),
+        }
+    elif kind == choices.NODE:
+        return {
+            'node':Node.all_objects.filter(pk=pk),
+            'sensor':Sensors.all_objects.filter(node_id=pk),
+        }
+    return {'sensor':Sensors.all_objects.filter(pk=pk)}
+
+
+def tombstone(obj, user):
+    """
+    Marks obj and its children as deleted and queues their purge
+    ====
+
+    Returns the DeletionJob of the object
+    """
+    kind = object_type(obj)
+    project_id = hierarchy.object_project(obj)
+    now = timezone.now()
+    with transaction.atomic():
+        for field, queryset in subtree(kind, obj.pk).items():
+            queryset.filter(deleted_at__isnull=True).update(deleted_at=now)
+            AccessIndex.objects.filter(**{field+'_id__in':queryset.values('pk')}).delete()
+        job = DeletionJob.objects.create(user=user, object_type=kind, object_id=obj.pk)
+        # Updates don't send signals, snapshots are invalidated here
+        hierarchy.bump_on_commit(*[k for k in (project_id, hierarchy.DIRECTORY) if k is not None])
+        if config()['ASYNC']:
+            transaction.on_commit(start)
+    obj.deleted_at = now
+    return job
+
+
+def purge(job):
+    """
+    Deletes the rows of a tombstoned object
+    ====
+
+    Measurements and rollups are deleted in batches, deleted_rows is
+    updated after each one. Purging an already purged object is a no-op
+    """
+    objects = subtree(job.object_type, job.object_id)
+    sensor_ids = list(objects['sensor'].values_list('pk', flat=True))
+    deleted = 0
+
+    def progress(rows):
+        DeletionJob.objects.filter(pk=job.pk).update(deleted_rows=deleted + rows)
+
+    for model in (Measurement, MeasurementRollup):
+        for i in range(0, len(sensor_ids), SENSORS_CHUNK):
+            deleted += delete_in_batches(
+                model.objects.filter(sensor_id__in=sensor_ids[i:i+SENSORS_CHUNK]),
+                progress=progress,
+            )
+    with transaction.atomic():
+        # Children first, the collector only finds their access keys and index rows
+        for field in ('sensor', 'node', 'zone'):
+            if field in objects:
+                objects[field].delete()
+    job.deleted_rows = deleted
+    return deleted
+
+
+def run_job(job):
+    """
+    Purges a claimed job recording its outcome
+    """
+    try:
+        purge(job)
+        job.status = choices.DONE
+        job.error = ''
+    except Exception as e:
+        logger.exception('Purge of %s %s failed', job.object_type, job.object_id)
+        job.status = choices.FAILED
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'deleted_rows', 'finished_at'])
+    return job
+
+
+def run_pending():
+    """
+    Purges every pending job, returns the amount of jobs processed
+    ====
+
+    Jobs are claimed one at a time so several workers can run at once
+    """
+    processed = 0
+    for pk in list(DeletionJob.objects.filter(status=choices.PENDING).order_by('id').values_list('id', flat=True)):
+        claimed = DeletionJob.objects.filter(pk=pk, status=choices.PENDING).update(
+            status=choices.RUNNING,
+            started_at=timezone.now(),
+        )
+        if claimed:
+            run_job(DeletionJob.objects.get(pk=pk))
+            processed += 1
+    return processed
+
+
+_worker = None
+_wake = threading.Event()
+_worker_lock = threading.Lock()
+
+
+def work():
+    global _worker
+    try:
+        while True:
+            with _worker_lock:
+                if not _wake.is_set():
+                    _worker = None
+                    return
+                _wake.clear()
+            try:
+                run_pending()
+            except Exception:
+                # Jobs left pending are retried on the next wake up or by purge_deletions
+                logger.exception('Purge worker failed')
+    finally:
+        connections.close_all()
+
+
+def start():
+    """
+    Wakes the background purge thread, starting it when needed
+    """
+    global _worker
+    with _worker_lock:
+        _wake.set()
+        if _worker is None:
+            _worker = threading.Thread(target=work, name='iot-purge', daemon=True)
+            _worker.start()
@@ -0,0 +1,198 @@
+import datetime
+import numpy as np
+
+"""
+Time series downsampling
+====
+
+Reduces a series to a fixed amount of points so plots and API
+responses are bounded by the amount of pixels instead of the amount
+of measurements.
+
+Modes:
+* lttb: Largest-Triangle-Three-Buckets, keeps the visual shape using real points
+* minmax: Keeps the minimum and maximum point of every bucket
+* avg: Replaces every bucket by its average point
+"""
+
+MODES = ('lttb', 'minmax', 'avg')
+# Fewest points each mode can reduce a series to
+MIN_POINTS = {'lttb':3, 'minmax':2, 'avg':1}
+
+
+def bucket_bounds(size, buckets):
+    """
+    Returns the (starts, ends) indices of evenly sized buckets
+    """
+    edges = np.linspace(0, size, buckets + 1).astype(np.int64)
+    return edges[:-1], edges[1:]
+
+
+def lttb(x, y, points):
+    """
+    Largest-Triangle-Three-Buckets selection
+    ====
+
+    Returns the indices of the selected points, the first and last
+    points are always kept. Every bucket is evaluated with vectorized
+    triangle areas against the average point of the next bucket
+    """
+    size = len(x)
+    if points >= size or points < 3:
+        return np.arange(size)
+    # Buckets between the first and the last point
+    edges = np.linspace(1, size - 1, points - 1).astype(np.int64)
+    cx = np.concatenate(([0.0], np.cumsum(x)))
+    cy = np.concatenate(([0.0], np.cumsum(y)))
+    selected = np.empty(points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = size - 1
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            n_start, n_end = edges[i + 1], edges[i + 2]
+            avg_x = (cx[n_end] - cx[n_start]) / (n_end - n_start)
+            avg_y = (cy[n_end] - cy[n_start]) / (n_end - n_start)
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) -
+            (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(x, y, points):
+    """
+    Min/max bucket selection
+    ====
+
+    Splits the series in points/2 buckets and returns the sorted
+    indices of the minimum and maximum of every bucket
+    """
+    size = len(x)
+    if points >= size or points < 2:
+        return np.arange(size)
+    buckets = points // 2
+    bucket = (np.arange(size) * buckets) // size
+    # Sorting by (bucket, value) leaves the minimum first and the maximum last
+    order = np.lexsort((y, bucket))
+    counts = np.bincount(bucket, minlength=buckets)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    return np.unique(np.concatenate((order[starts], order[ends - 1])))
+
+
+def average(x, y, points):
+    """
+    Average bucket reduction
+    ====
+
+    Returns the (x, y) arrays of the average point of every bucket
+    """
+    size = len(x)
+    if points >= size or points < 1:
+        return x, y
+    starts, ends = bucket_bounds(size, points)
+    counts = ends - starts
+    return np.add.reduceat(x, starts) / counts, np.add.reduceat(y, starts) / counts
+
+
+def to_seconds(dates):
+    """
+    Converts datetimes into an array of POSIX timestamps
+    """
+    return np.fromiter((d.timestamp() for d in dates), dtype=np.float64, count=len(dates))
+
+
+def from_seconds(seconds):
+    return [datetime.datetime.fromtimestamp(s, tz=datetime.timezone.utc) for s in seconds]
+
+
+def check(points, mode):
+    """
+    Raises ValueError when mode is unknown or can't reduce a series to points points
+    """
+    if mode not in MODES:
+        raise ValueError('Unknown downsampling mode "{}", use one of {}'.format(mode, ', '.join(MODES)))
+    if points < MIN_POINTS[mode]:
+        raise ValueError('"points" must be at least {} with mode "{}"'.format(MIN_POINTS[mode], mode))
+
+
+def parse_points(value, mode='lttb'):
+    """
+    Parses and checks a points query parameter
+    """
+    try:
+        points = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('"points" must be an integer')
+    check(points, mode)
+    return points
+
+
+def downsample(dates, values, points, mode='lttb'):
+    """
+    Downsamples a (dates, values) series to at most points points
+    ====
+
+    Returns (dates, values, indices) where indices are the positions of
+    the kept measurements or None when the points are synthetic (avg)
+    """
+    check(points, mode)
+    if len(dates) <= points:
+        return list(dates), list(values), np.arange(len(dates))
+    x = to_seconds(dates)
+    y = np.asarray(values, dtype=np.float64)
+    if mode == 'avg':
+        ax, ay = average(x, y, points)
+        return from_seconds(ax), list(ay), None
+    indices = lttb(x, y, points) if mode == 'lttb' else minmax(x, y, points)
+    return [dates[i] for i in indices], [values[i] for i in indices], indices
+
+
+def downsample_arrays(x, y, points, mode='lttb'):
+    """
+    Downsamples (seconds, values) arrays to at most points points
+    ====
+
+    Same as downsample but the series stays as NumPy arrays
+    """
+    check(points, mode)
+    if len(x) <= points:
+        return x, y
+    if mode == 'avg':
+        return average(x, y, points)
+    indices = lttb(x, y, points) if mode == 'lttb' else minmax(x, y, points)
+    return x[indices], y[indices]
+
+
+def downsample_series(series, points, mode='lttb'):
+    """
+    Downsamples {measurement_type: (seconds, values, ids)} arrays into rows
+    ====
+
+    Returns (id, value, created_at, measurement_type) rows ordered by
+    creation date, every measurement type is downsampled independently.
+    Synthetic rows have None as id
+    """
+    check(points, mode)
+    result = []
+    for m_type, (x, y, ids) in series.items():
+        if len(x) > points and mode == 'avg':
+            ax, ay = average(x, y, points)
+            result.extend(
+                (None, round(float(value), 2), date, m_type) for date, value in zip(from_seconds(ax), ay)
+            )
+            continue
+        if len(x) > points:
+            indices = lttb(x, y, points) if mode == 'lttb' else minmax(x, y, points)
+            x, y, ids = x[indices], y[indices], ids[indices]
+        result.extend(
+            (int(pk), float(value), date, m_type) for pk, value, date in zip(ids, y, from_seconds(x))
+        )
+    result.sort(key=lambda r: r[2])
+    return result
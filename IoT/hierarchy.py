@@ -0,0 +1,211 @@
+from collections import namedtuple, OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from IoT.models import Projects, Zones, Node, Sensors
+import threading
+import time
+import uuid
+
+"""
+Project hierarchy cache
+====
+
+Keeps an immutable snapshot of the topology of every project (zones,
+nodes, sensors and their parent links) so plots and tree reads don't
+query the hierarchy on every request. Snapshots may be stale on other
+workers when CACHE_ALIAS isn't shared between them, thus they are
+never used to authorize, IoT.api.permissions reads the access index.
+
+Snapshots are versioned per project, the version lives in Django's
+cache framework and is bumped by the receivers in IoT.signals whenever
+an object of the project changes. Snapshots are stored in the cache
+under their version and kept in a small in process L1, thus reading
+one costs a single cache lookup of its version.
+
+Versions expire after MAX_AGE seconds and L1 entries are dropped once
+they're older, so snapshots are rebuilt at least that often. This bounds
+how long a worker that didn't see a change keeps an outdated snapshot
+when CACHE_ALIAS is a per process cache
+"""
+
+DEFAULT_SETTINGS = {
+    # Cache alias storing versions and snapshots
+    'CACHE_ALIAS':'default',
+    # Seconds a snapshot is kept in the cache
+    'TTL':86400,
+    # Snapshots kept in process memory
+    'L1_SIZE':256,
+    # Seconds before versions expire and L1 entries are dropped
+    'MAX_AGE':60,
+}
+
+VERSION_PREFIX = 'iot_hierarchy_v:'
+SNAPSHOT_PREFIX = 'iot_hierarchy:'
+# Version key of the zone to project directory
+DIRECTORY = 'zones'
+
+SensorLink = namedtuple('SensorLink', ('zone_id', 'node_id', 'ambiental', 'sensor_type'))
+
+
+class Snapshot(namedtuple('Snapshot', ('project_id', 'zones', 'nodes', 'sensors'))):
+    """
+    Topology of a project
+    ====
+
+    * zones: frozenset of zone ids
+    * nodes: {node_id: zone_id}
+    * sensors: {sensor_id: SensorLink}
+
+    Snapshots are shared between requests and must not be modified
+    """
+    __slots__ = ()
+
+    def ambiental(self, zone_id):
+        """
+        Returns the ids of the ambiental sensors of a zone
+        """
+        return sorted(pk for pk, s in self.sensors.items() if s.zone_id == zone_id and s.ambiental)
+
+
+def config():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'IOT_HIERARCHY_CACHE', {}))
+
+
+def cache():
+    return caches[config()['CACHE_ALIAS']]
+
+
+class L1Cache:
+    """
+    Bounded in process map of {key: (version, value)}
+    ====
+
+    Entries older than MAX_AGE seconds are ignored
+    """
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            if time.monotonic() - entry[2] > config()['MAX_AGE']:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > config()['L1_SIZE']:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+l1 = L1Cache()
+
+
+def bump(*keys):
+    """
+    Gives the selected projects (or the directory) a new version
+    """
+    cache().set_many({VERSION_PREFIX + str(k):uuid.uuid4().hex for k in keys}, config()['MAX_AGE'])
+
+
+def bump_on_commit(*keys):
+    """
+    Bumps now and once the transaction commits
+    ====
+
+    The second bump discards snapshots built from uncommitted data
+    """
+    if keys:
+        bump(*keys)
+        transaction.on_commit(lambda: bump(*keys))
+
+
+def version(key):
+    version = cache().get(VERSION_PREFIX + str(key))
+    if version is None:
+        version = uuid.uuid4().hex
+        # Keep the version of a concurrent bump
+        if not cache().add(VERSION_PREFIX + str(key), version, config()['MAX_AGE']):
+            version = cache().get(VERSION_PREFIX + str(key), version)
+    return version
+
+
+def cached(key, build):
+    """
+    Returns the current value of a versioned entry, building it when needed
+    """
+    current = version(key)
+    value = l1.get(key, current)
+    if value is not None:
+        return value
+    snapshot_key = '{}{}:{}'.format(SNAPSHOT_PREFIX, key, current)
+    value = cache().get(snapshot_key)
+    if value is None:
+        value = build()
+        cache().set(snapshot_key, value, config()['TTL'])
+    l1.set(key, current, value)
+    return value
+
+
+def build_snapshot(project_id):
+    """
+    Loads the topology of a project, False if it doesn't exist
+    """
+    if not Projects.objects.filter(pk=project_id).exists():
+        return False
+    zone_ids = list(Zones.objects.filter(project_id=project_id).values_list('id', flat=True))
+    nodes = Node.objects.filter(zone_id__in=zone_ids).values_list('id', 'zone_id')
+    # Sensors are found through their zones, a queryset update of zone doesn't refresh their project
+    sensors = Sensors.objects.filter(zone_id__in=zone_ids).values_list('id', 'zone_id', 'node_id', 'ambiental', 'sensor_type')
+    return Snapshot(
+        project_id=project_id,
+        zones=frozenset(zone_ids),
+        nodes=dict(nodes),
+        sensors={row[0]:SensorLink(*row[1:]) for row in sensors},
+    )
+
+
+def project(project_id):
+    """
+    Returns the snapshot of a project, None if it doesn't exist
+    """
+    return cached(int(project_id), lambda: build_snapshot(int(project_id))) or None
+
+
+def zone_directory():
+    """
+    Returns {zone_id: project_id} of every zone
+    """
+    return cached(DIRECTORY, lambda: dict(Zones.objects.values_list('id', 'project_id')))
+
+
+def zone_project(zone_id):
+    """
+    Returns the project id of a zone, None if it doesn't exist
+    """
+    return zone_directory().get(zone_id)
+
+
+def object_project(obj):
+    """
+    Returns the project id of a hierarchy object
+    """
+    if isinstance(obj, Projects):
+        return obj.pk
+    elif isinstance(obj, Zones):
+        return obj.project_id
+    elif isinstance(obj, Sensors) and obj.project_id is not None:
+        return obj.project_id
+    return zone_project(obj.zone_id)
@@ -0,0 +1,46 @@
+from django.db.models import Prefetch, prefetch_related_objects
+from IoT.models import Zones, Node, Sensors
+
+"""
+Project tree loader
+====
+
+Loads whole project hierarchies (zones, nodes, node sensors and
+ambiental sensors) with one query per level, independently of the
+amount of projects or objects, so the nested serializers are fed
+from memory instead of querying every relation of every object
+"""
+
+# Attribute holding the prefetched ambiental sensors of a zone
+AMBIENTAL_ATTR = 'prefetched_ambiental_sensors'
+
+
+def tree_lookups():
+    """
+    Prefetch lookups of a project hierarchy
+    """
+    return (
+        Prefetch('project_zones', queryset=Zones.objects.order_by('id')),
+        Prefetch('project_zones__zone_nodes', queryset=Node.objects.order_by('id')),
+        Prefetch('project_zones__zone_nodes__node_sensors', queryset=Sensors.objects.order_by('id')),
+        Prefetch(
+            'project_zones__zone_ambiental_sensors',
+            queryset=Sensors.objects.filter(ambiental=True).order_by('id'),
+            to_attr=AMBIENTAL_ATTR,
+        ),
+    )
+
+
+def load_project_tree(projects):
+    """
+    Prefetches the hierarchy of projects
+    ====
+
+    projects can be a queryset, a list or a single project,
+    the loaded projects are returned as a list
+    """
+    if not isinstance(projects, (list, tuple)) and not hasattr(projects, 'model'):
+        projects = [projects]
+    projects = list(projects)
+    prefetch_related_objects(projects, *tree_lookups())
+    return projects
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework import serializers as rest_serializers
+from IoT.models import Sensors
+import IoT.api.ingest as ingest
+import IoT.api.serializers as serializers
+import csv
+import sys
+
+
+class Command(BaseCommand):
+    """
+    Loads historical measurements from a CSV file
+    ====
+
+    Rows are (sensor id, measurement type, timestamp, value) where the
+    timestamp is an ISO 8601 datetime or UNIX epoch seconds. The file is
+    read and stored in time sorted chunks, aggregates and plot caches are
+    updated incrementally on every chunk. When a line is invalid the
+    chunks before it are kept
+    """
+    help = 'Loads sensor_id,measurement_type,timestamp,value rows from a CSV file (- for stdin)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='CSV file, - reads from stdin')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Rows stored by each transaction')
+        parser.add_argument('--skip-header', action='store_true', help='Ignore the first line of the file')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size'] or ingest.BACKFILL_CHUNK_SIZE
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be a positive number')
+        self.fields = serializers.MeasurementSerializer().fields
+        source = sys.stdin if options['file'] == '-' else open(options['file'], newline='')
+        try:
+            rows = csv.reader(source)
+            if options['skip_header']:
+                next(rows, None)
+            stored = 0
+            chunk = []
+            for line, row in enumerate(rows, start=1):
+                chunk.append(self.parse(line, row))
+                if len(chunk) >= chunk_size:
+                    stored += self.store(chunk, chunk_size)
+                    chunk = []
+            stored += self.store(chunk, chunk_size)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        self.stdout.write(self.style.SUCCESS('{} measurements stored'.format(stored)))
+
+    def parse(self, line, row):
+        fields = self.fields
+        try:
+            id_sensor, m_type, timestamp, value = row
+            try:
+                timestamp = float(timestamp)
+            except ValueError:
+                pass
+            return ingest.Reading(
+                line,
+                fields['id_sensor'].run_validation(id_sensor),
+                fields['measurement_type'].run_validation(m_type),
+                fields['value'].run_validation(value),
+                ingest.parse_device_timestamp(timestamp, past=False),
+            )
+        except ValueError:
+            raise CommandError('Line {}: expected sensor_id,measurement_type,timestamp,value'.format(line))
+        except rest_serializers.ValidationError as e:
+            raise CommandError('Line {}: {}'.format(line, e.detail))
+
+    def store(self, readings, chunk_size):
+        if not readings:
+            return 0
+        sensors = Sensors.objects.in_bulk(list({r.id_sensor for r in readings}))
+        for r in readings:
+            if r.id_sensor not in sensors:
+                raise CommandError('Line {}: sensor {} does not exist'.format(r.index, r.id_sensor))
+        stored = ingest.backfill(readings, sensors, chunk_size)
+        self.stdout.write('{} measurements up to {} stored'.format(stored, max(r.timestamp for r in readings)))
+        return stored
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from IoT.api.pagination import parse_timestamp
+from IoT.rollups import compact
+import datetime
+
+
+class Command(BaseCommand):
+    """
+    Recomputes measurement rollups from the raw measurements
+    ====
+
+    Meant to be run periodically when rollups aren't updated on
+    ingestion, or to repair them after measurements are changed
+    outside of the ingestion path (raw SQL, deletions, loaddata)
+    """
+    help = 'Recomputes the measurement rollups of a time range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help='ISO 8601 start of the range, defaults to --days ago')
+        parser.add_argument('--to', dest='end', help='ISO 8601 end of the range, defaults to now')
+        parser.add_argument('--days', type=int, default=1, help='Days to compact when --from is missing')
+        parser.add_argument('--sensor', type=int, action='append', dest='sensors', help='Only compact these sensors')
+
+    def handle(self, *args, **options):
+        try:
+            end = parse_timestamp(options['end'], '--to') if options['end'] else timezone.now()
+            start = parse_timestamp(options['start'], '--from') if options['start'] else end - datetime.timedelta(days=options['days'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        written = compact(start, end, options['sensors'])
+        self.stdout.write(self.style.SUCCESS('{} rollup rows written'.format(written)))
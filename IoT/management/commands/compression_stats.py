@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from IoT import middleware
+
+
+class Command(BaseCommand):
+    """
+    Prints the compressed request body counters
+    ====
+
+    Counters are kept in IOT_REQUEST_DECOMPRESSION CACHE_ALIAS, use a
+    shared cache to aggregate every web worker
+    """
+    help = 'Prints the compression ratio of compressed request bodies'
+
+    def handle(self, *args, **options):
+        stats = middleware.stats()
+        if not stats:
+            self.stdout.write('No compressed requests recorded')
+        for encoding, counters in sorted(stats.items()):
+            self.stdout.write('{}: {} requests, {} -> {} bytes (ratio {:.2f}), {} rejected'.format(
+                encoding,
+                counters['requests'],
+                counters['compressed'],
+                counters['decompressed'],
+                counters['ratio'],
+                counters['rejected'],
+            ))
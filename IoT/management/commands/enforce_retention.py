@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from IoT.models import RetentionPolicy
+from IoT import retention
+
+
+class Command(BaseCommand):
+    """
+    Enforces the measurement retention policies
+    ====
+
+    Meant to be scheduled (e.g. daily with cron), expired measurements
+    are removed in batches so the command can run next to the ingestion
+    """
+    help = 'Removes the measurements older than their retention policy'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--policy', type=int, action='append', dest='policies', help='Only enforce these policies')
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows removed by each DELETE')
+        parser.add_argument('--sleep', type=float, default=None, help='Seconds waited between batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the expired measurements')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError('--batch-size must be a positive number')
+        policies = RetentionPolicy.objects.filter(enabled=True).select_related('project')
+        if options['policies']:
+            policies = policies.filter(pk__in=options['policies'])
+        total = 0
+        for policy in policies:
+            self.stdout.write('Enforcing {}'.format(policy))
+            result = retention.enforce(
+                policy,
+                batch_size=options['batch_size'],
+                sleep=options['sleep'],
+                progress=lambda deleted: self.stdout.write('  {} measurements deleted'.format(deleted)),
+                dry_run=options['dry_run'],
+            )
+            if result['partitions']:
+                self.stdout.write('  Partitions {}: {}'.format(
+                    'expired' if options['dry_run'] else 'dropped', ' '.join(result['partitions'])
+                ))
+            total += result['deleted']
+        self.stdout.write(self.style.SUCCESS('{} measurements {}'.format(
+            total, 'expired' if options['dry_run'] else 'deleted'
+        )))
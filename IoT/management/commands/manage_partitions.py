@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from IoT import partitions
+
+
+class Command(BaseCommand):
+    """
+    Maintains the monthly partitions of the Measurement table
+    ====
+
+    Meant to be scheduled (e.g. daily with cron) so partitions of
+    the coming months always exist before measurements arrive
+    """
+    help = 'Creates the Measurement partitions of the coming months (MySQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=None, help='Months of partitions created ahead of the current one')
+        parser.add_argument('--convert', action='store_true', help='Partition a table that is not partitioned yet (rewrites the table)')
+        parser.add_argument('--list', action='store_true', help='Only list the existing partitions')
+
+    def handle(self, *args, **options):
+        if not partitions.supported(connection):
+            self.stdout.write('Native partitioning is only available on MySQL, {} uses the time-series indexes'.format(connection.vendor))
+            return
+        existing = partitions.existing_partitions(connection)
+        if options['list']:
+            self.stdout.write('\n'.join(existing) or 'Measurement table is not partitioned')
+            return
+        if not existing:
+            if not options['convert']:
+                raise CommandError('Measurement table is not partitioned, use --convert to partition it')
+            for sql in partitions.convert(options['ahead'], connection):
+                self.stdout.write(sql)
+            self.stdout.write(self.style.SUCCESS('Measurement table partitioned'))
+            return
+        created = partitions.create_ahead(options['ahead'], connection)
+        self.stdout.write(self.style.SUCCESS('{} partition{} created {}'.format(
+            len(created), 's' if len(created) != 1 else '', ' '.join(created)
+        )))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from IoT.models import DeletionJob
+from IoT import deletions
+import IoT.model_choices as choices
+
+
+class Command(BaseCommand):
+    """
+    Purges deleted zones, nodes and sensors
+    ====
+
+    Jobs are normally purged by a background thread of the web process,
+    schedule this command when IOT_DELETIONS['ASYNC'] is disabled or to
+    resume the jobs interrupted by a restart
+    """
+    help = 'Purges the measurements and objects of the pending deletions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry', action='store_true', help='Queue again failed and interrupted (running) jobs')
+
+    def handle(self, *args, **options):
+        if options['retry']:
+            retried = DeletionJob.objects.filter(status__in=[choices.FAILED, choices.RUNNING]).update(status=choices.PENDING)
+            self.stdout.write('{} job{} queued again'.format(retried, 's' if retried != 1 else ''))
+        processed = deletions.run_pending()
+        failed = DeletionJob.objects.filter(status=choices.FAILED).count()
+        self.stdout.write(self.style.SUCCESS('{} job{} processed, {} failed'.format(
+            processed, 's' if processed != 1 else '', failed
+        )))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from users.models import CustomAccessTokens
+from IoT.access_index import rebuild_token_index
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the token access index
+    ====
+
+    The index is maintained by signals, this command is meant to
+    repair it after changes done outside of the ORM (raw SQL, loaddata)
+    """
+    help = 'Recomputes the access index of every token or the selected ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tokens', nargs='*', type=int, help='Ids of the tokens to rebuild')
+
+    def handle(self, *args, **options):
+        tokens = options['tokens'] or list(CustomAccessTokens.objects.values_list('id', flat=True))
+        rebuild_token_index(tokens)
+        self.stdout.write(self.style.SUCCESS('Access index rebuilt for {} token{}'.format(len(tokens), 's' if len(tokens) != 1 else '')))
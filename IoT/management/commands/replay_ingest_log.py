@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from IoT.api import buffer
+
+
+class Command(BaseCommand):
+    """
+    Stores the measurements left in the ingest buffer log
+    ====
+
+    Run it before starting the web workers, segments of running
+    workers must not be replayed
+    """
+    help = 'Replays the ingest buffer log segments left by a crash'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help='Log segments prefix, defaults to IOT_INGEST_BUFFER PATH')
+
+    def handle(self, *args, **options):
+        stored = buffer.replay(options['path'])
+        self.stdout.write(self.style.SUCCESS('{} measurements replayed'.format(stored)))
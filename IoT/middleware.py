@@ -0,0 +1,541 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import RequestDataTooBig, SuspiciousOperation
+from django.http import JsonResponse
+from django.urls import resolve
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+import logging
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+"""
+Compressed request and response bodies
+====
+
+RequestDecompressionMiddleware inflates request bodies sent with a
+Content-Encoding (gzip, deflate and, when zstandard is installed, zstd)
+while views read them, the whole compressed body is never held in
+memory and the inflated one only when the view reads it at once.
+
+Guards against decompression bombs stop reading as soon as the inflated
+body exceeds MAX_SIZE bytes or MAX_RATIO times the compressed bytes
+read, the request is then answered with 400 Bad Request. So are
+truncated bodies and data following the end of the stream, gzip bodies
+may hold several members. Chunked bodies (without Content-Length) are
+read from the WSGI input, see read_chunked.
+
+Compressed and inflated byte counts are added to counters in Django's
+cache framework, see stats
+
+ResponseCompressionMiddleware compresses responses of the configured
+paths with the encoding preferred by the Accept-Encoding header among
+gzip, and br and zstd when brotli and zstandard are installed.
+Responses smaller than MIN_SIZE bytes are sent as they are, streamed
+responses are compressed chunk by chunk and flushed every FLUSH_SIZE
+bytes, clients receive the rows as they're produced
+
+LeanRouteMiddleware calls the views of the configured paths right
+away, skipping the middleware listed after it
+"""
+
+DEFAULT_SETTINGS = {
+    # Path prefixes accepting compressed bodies
+    'PATHS':['/IoT/api/'],
+    # Largest inflated body in bytes
+    'MAX_SIZE':64 * 1024 * 1024,
+    # Largest inflated / compressed ratio
+    'MAX_RATIO':100,
+    # Cache alias storing the metrics, None disables them
+    'CACHE_ALIAS':'default',
+}
+
+RESPONSE_SETTINGS = {
+    # Path prefixes with compressed responses
+    'PATHS':['/IoT/api/'],
+    # Smaller responses aren't compressed
+    'MIN_SIZE':1024,
+    # Encodings in order of preference when the client accepts several equally
+    'ENCODINGS':['zstd', 'br', 'gzip'],
+    # Compression level of each encoding
+    'LEVELS':{'zstd':3, 'br':4, 'gzip':6},
+    # Uncompressed bytes of streamed responses between flushes, 0 flushes every chunk
+    'FLUSH_SIZE':16 * 1024,
+}
+
+LEAN_SETTINGS = {
+    # Path prefixes served without the middleware listed after LeanRouteMiddleware
+    'PATHS':['/IoT/api/ingest/'],
+}
+
+# Compressed bytes read on each call
+READ_SIZE = 64 * 1024
+# Inflated bytes before the ratio is enforced, small bodies compress better
+RATIO_GRACE = 64 * 1024
+# Compressed bytes given to zstd at once, a 4 bytes block inflates up to 128 KiB
+ZSTD_SLICE = 512
+METRICS_PREFIX = 'iot_decompression:'
+METRICS = ('requests', 'compressed', 'decompressed', 'rejected')
+
+logger = logging.getLogger(__name__)
+
+
+def config():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'IOT_REQUEST_DECOMPRESSION', {}))
+
+
+def response_config():
+    return dict(RESPONSE_SETTINGS, **getattr(settings, 'IOT_RESPONSE_COMPRESSION', {}))
+
+
+def lean_config():
+    return dict(LEAN_SETTINGS, **getattr(settings, 'IOT_LEAN_ROUTES', {}))
+
+
+def read_chunked(request):
+    """
+    Makes the body of a chunked request readable
+    ====
+
+    Requests sent with "Transfer-Encoding: chunked" have no Content-Length
+    and Django reads them as empty, their body is read from the WSGI input
+    instead, which the server ends after the last chunk
+    """
+    if request.META.get('CONTENT_LENGTH') or getattr(request, '_chunked', False):
+        return
+    if 'chunked' not in request.META.get('HTTP_TRANSFER_ENCODING', '').lower():
+        return
+    if 'wsgi.input' in getattr(request, 'environ', {}):
+        request._stream = request.environ['wsgi.input']
+        request._chunked = True
+
+
+class CountingReader:
+    """
+    Counts the bytes read from a stream
+    """
+    def __init__(self, raw):
+        self.raw = raw
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.count += len(data)
+        return data
+
+
+class ZlibReader:
+    """
+    Inflates gzip and zlib (deflate) streams returning at most size bytes per read
+    ====
+
+    Bodies ending before their stream does are rejected instead of being
+    inflated partially. Gzip bodies may hold several members (RFC 1952),
+    they are inflated one after another, other data after the end of the
+    stream is rejected except NUL padding
+    """
+    def __init__(self, raw):
+        self.raw = raw
+        # 32 + MAX_WBITS detects gzip and zlib headers
+        self.decoder = zlib.decompressobj(32 + zlib.MAX_WBITS)
+        self.gzip = None
+
+    def _next_member(self):
+        """
+        Returns the data following the end of the stream, b'' once the body is over
+        """
+        trailing = self.decoder.unused_data
+        while True:
+            trailing = trailing.lstrip(b'\0')
+            if trailing:
+                break
+            trailing = self.raw.read(READ_SIZE)
+            if not trailing:
+                return b''
+        if not self.gzip:
+            raise SuspiciousOperation('Invalid compressed body: data after the end of the stream')
+        self.decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        return trailing
+
+    def read(self, size):
+        while True:
+            if self.decoder.unconsumed_tail:
+                data = self.decoder.unconsumed_tail
+            elif self.decoder.eof:
+                data = self._next_member()
+                if not data:
+                    return b''
+            else:
+                data = self.raw.read(READ_SIZE)
+                if not data:
+                    raise SuspiciousOperation('Invalid compressed body: truncated stream')
+                if self.gzip is None:
+                    self.gzip = data[:2] == b'\x1f\x8b'
+            try:
+                inflated = self.decoder.decompress(data, size)
+            except zlib.error as e:
+                raise SuspiciousOperation('Invalid compressed body: {}'.format(e))
+            if inflated:
+                return inflated
+
+
+class ZstdReader:
+    """
+    Inflates zstd streams returning at most size bytes per read
+    ====
+
+    Frames are inflated one after another (RFC 8878), bodies ending
+    before their last frame does and other data after a frame are
+    rejected. zstandard's decompressobj can't bound its output, thus it
+    receives ZSTD_SLICE compressed bytes at a time
+    """
+    def __init__(self, raw):
+        self.raw = raw
+        self.decoder = zstandard.ZstdDecompressor().decompressobj()
+        self.input = b''
+        self.output = b''
+        self.offset = 0
+
+    def _inflate(self):
+        """
+        Inflates the next slice of the body into output, returns False once the body is over
+        """
+        if self.decoder.eof:
+            self.input = self.decoder.unused_data + self.input
+            if not self.input:
+                self.input = self.raw.read(READ_SIZE)
+                if not self.input:
+                    return False
+            self.decoder = zstandard.ZstdDecompressor().decompressobj()
+        if not self.input:
+            self.input = self.raw.read(READ_SIZE)
+            if not self.input:
+                raise SuspiciousOperation('Invalid compressed body: truncated stream')
+        data, self.input = self.input[:ZSTD_SLICE], self.input[ZSTD_SLICE:]
+        try:
+            self.output = self.decoder.decompress(data)
+        except zstandard.ZstdError as e:
+            raise SuspiciousOperation('Invalid compressed body: {}'.format(e))
+        self.offset = 0
+        return True
+
+    def read(self, size):
+        while self.offset >= len(self.output):
+            if not self._inflate():
+                return b''
+        data = self.output[self.offset:self.offset + size]
+        self.offset += len(data)
+        return data
+
+
+def readers():
+    """
+    Returns {content encoding: reader class} of the supported encodings
+    """
+    supported = {'gzip':ZlibReader, 'x-gzip':ZlibReader, 'deflate':ZlibReader}
+    if zstandard is not None:
+        supported['zstd'] = ZstdReader
+    return supported
+
+
+class DecompressingStream:
+    """
+    File like object inflating a compressed request stream
+    ====
+
+    Raises RequestDataTooBig when a guard is exceeded and SuspiciousOperation
+    on corrupt bodies, both are answered with 400
+    """
+    def __init__(self, raw, encoding, max_size, max_ratio):
+        self.compressed = CountingReader(raw)
+        self.reader = readers()[encoding](self.compressed)
+        self.max_size = max_size
+        self.max_ratio = max_ratio
+        self.size = 0
+        self.rejected = False
+        self._buffer = bytearray()
+        self._eof = False
+
+    def _inflate(self, size):
+        data = self.reader.read(size)
+        if not data:
+            self._eof = True
+            return data
+        self.size += len(data)
+        if self.size > self.max_size:
+            self.rejected = True
+            raise RequestDataTooBig('Decompressed body exceeds {} bytes'.format(self.max_size))
+        if self.size > RATIO_GRACE and self.size > self.max_ratio * max(self.compressed.count, 1):
+            self.rejected = True
+            raise RequestDataTooBig('Body compression ratio exceeds {}'.format(self.max_ratio))
+        return data
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            chunks = [bytes(self._buffer)]
+            self._buffer.clear()
+            while not self._eof:
+                chunks.append(self._inflate(READ_SIZE))
+            return b''.join(chunks)
+        while len(self._buffer) < size and not self._eof:
+            self._buffer += self._inflate(size - len(self._buffer))
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def readline(self, size=-1):
+        while b'\n' not in self._buffer and not self._eof and (size is None or size < 0 or len(self._buffer) < size):
+            self._buffer += self._inflate(READ_SIZE)
+        end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        if size is not None and size >= 0:
+            end = min(end, size)
+        data = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return data
+
+
+def record(encoding, compressed, decompressed, rejected):
+    """
+    Adds a request to the compression counters of its encoding
+    """
+    alias = config()['CACHE_ALIAS']
+    if alias is None:
+        return
+    cache = caches[alias]
+    values = {'requests':1, 'compressed':compressed, 'decompressed':decompressed, 'rejected':int(rejected)}
+    for name, value in values.items():
+        key = '{}{}:{}'.format(METRICS_PREFIX, encoding, name)
+        if value and not cache.add(key, value, None):
+            try:
+                cache.incr(key, value)
+            except ValueError:
+                cache.set(key, value, None)
+
+
+def stats():
+    """
+    Returns {encoding: counters} including the compression ratio
+    """
+    alias = config()['CACHE_ALIAS']
+    if alias is None:
+        return {}
+    keys = ['{}{}:{}'.format(METRICS_PREFIX, e, name) for e in readers() for name in METRICS]
+    stored = caches[alias].get_many(keys)
+    result = {}
+    for encoding in readers():
+        counters = {name:stored.get('{}{}:{}'.format(METRICS_PREFIX, encoding, name), 0) for name in METRICS}
+        if counters['requests']:
+            counters['ratio'] = counters['decompressed'] / max(counters['compressed'], 1)
+            result[encoding] = counters
+    return result
+
+
+class RequestDecompressionMiddleware:
+    """
+    Inflates compressed request bodies of the configured paths
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        encoding = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        c = config()
+        if encoding in ('', 'identity') or not any(request.path.startswith(p) for p in c['PATHS']):
+            return self.get_response(request)
+        if encoding not in readers():
+            return JsonResponse({
+                'status':'Unsupported Content-Encoding {}'.format(encoding),
+                'supported':sorted(readers()),
+            }, status=415)
+        read_chunked(request)
+        stream = DecompressingStream(request._stream, encoding, c['MAX_SIZE'], c['MAX_RATIO'])
+        request._stream = stream
+        # Views and parsers receive the inflated body
+        del request.META['HTTP_CONTENT_ENCODING']
+        try:
+            return self.get_response(request)
+        finally:
+            logger.debug('%s body of %s inflated from %s to %s bytes', encoding, request.path, stream.compressed.count, stream.size)
+            record(encoding, stream.compressed.count, stream.size, stream.rejected)
+
+
+class GzipCompressor:
+    """
+    zlib compressobj writing gzip, sync returns the data compressed so far
+    """
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def sync(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def flush(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+    """
+    brotli.Compressor with the compressobj interface
+    """
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def sync(self):
+        return self.compressor.flush()
+
+    def flush(self):
+        return self.compressor.finish()
+
+
+class ZstdCompressor:
+    """
+    zstandard compressobj, sync ends the current block
+    """
+    def __init__(self, level):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def sync(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def flush(self):
+        return self.compressor.flush()
+
+
+def compressors():
+    """
+    Returns {content encoding: compressor class taking the level} of the supported encodings
+    """
+    supported = {'gzip':GzipCompressor}
+    if brotli is not None:
+        supported['br'] = BrotliCompressor
+    if zstandard is not None:
+        supported['zstd'] = ZstdCompressor
+    return supported
+
+
+accept_encoding_re = _lazy_re_compile(r'^\s*([^\s;]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$')
+
+
+def negotiate(accept_encoding, encodings):
+    """
+    Returns the encoding of encodings with the highest quality in accept_encoding, None if none is accepted
+    ====
+
+    Ties are resolved by the order of encodings
+    """
+    qualities = {}
+    for item in accept_encoding.lower().split(','):
+        match = accept_encoding_re.match(item)
+        if match is None:
+            continue
+        try:
+            qualities[match.group(1)] = float(match.group(2) or 1)
+        except ValueError:
+            continue
+    best, best_q = None, 0
+    for encoding in encodings:
+        q = qualities.get(encoding, qualities.get('*', 0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class ResponseCompressionMiddleware:
+    """
+    Compresses responses of the configured paths
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        c = response_config()
+        if not any(request.path.startswith(p) for p in c['PATHS']):
+            return response
+        if response.has_header('Content-Encoding') or response.status_code == 204:
+            return response
+        if not response.streaming and len(response.content) < c['MIN_SIZE']:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        available = compressors()
+        encoding = negotiate(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''),
+            [e for e in c['ENCODINGS'] if e in available],
+        )
+        if encoding is None:
+            return response
+        compressor = available[encoding](c['LEVELS'].get(encoding, 6))
+        if response.streaming:
+            response.streaming_content = self.compress_stream(compressor, response.streaming_content, c['FLUSH_SIZE'])
+            del response['Content-Length']
+        else:
+            compressed = compressor.compress(response.content) + compressor.flush()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+        # The compressed representation differs from the original one
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+    @staticmethod
+    def compress_stream(compressor, chunks, flush_size):
+        """
+        Yields the compressed chunks, flushing the compressor every flush_size uncompressed bytes
+        """
+        pending = 0
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            pending += len(chunk)
+            if pending >= flush_size:
+                data += compressor.sync()
+                pending = 0
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class LeanRouteMiddleware:
+    """
+    Serves the configured paths without the rest of the middleware
+    ====
+
+    Views of these paths can't rely on sessions, request.user set by
+    AuthenticationMiddleware, CSRF checks nor messages, they must
+    authenticate every request on their own (e.g. CA-TOKEN). Unknown
+    paths are answered with 404 and exceptions are handled as usual
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.paths = tuple(lean_config()['PATHS'])
+
+    def __call__(self, request):
+        if not request.path_info.startswith(self.paths):
+            return self.get_response(request)
+        match = resolve(request.path_info, getattr(request, 'urlconf', None))
+        request.resolver_match = match
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response = response.render()
+        return response
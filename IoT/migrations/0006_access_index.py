@@ -0,0 +1,70 @@
+# Generated by Django 3.0.7 on 2026-10-18 12:14
+
+from django.db import migrations, models
+from django.db.models import Q
+import django.db.models.deletion
+
+
+def build_access_index(apps, schema_editor):
+    """
+    Indexes the permissions of every existing token
+    """
+    Projects = apps.get_model('IoT', 'Projects')
+    Zones = apps.get_model('IoT', 'Zones')
+    Node = apps.get_model('IoT', 'Node')
+    Sensors = apps.get_model('IoT', 'Sensors')
+    AccessIndex = apps.get_model('IoT', 'AccessIndex')
+    CustomAccessTokens = apps.get_model('users', 'CustomAccessTokens')
+    for token_id in CustomAccessTokens.objects.values_list('id', flat=True):
+        zones = Zones.objects.filter(Q(project__access_keys=token_id) | Q(access_keys=token_id))
+        nodes = Node.objects.filter(Q(zone__in=zones) | Q(access_keys=token_id))
+        owned = {
+            'project':Projects.objects.filter(access_keys=token_id),
+            'zone':zones,
+            'node':nodes,
+            'sensor':Sensors.objects.filter(Q(zone__in=zones) | Q(node__in=nodes)),
+        }
+        AccessIndex.objects.bulk_create([
+            AccessIndex(token_id=token_id, **{field+'_id':pk})
+            for field, queryset in owned.items()
+            for pk in set(queryset.values_list('id', flat=True))
+        ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('IoT', '0005_auto_20200505_1549'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessIndex',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('node', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='access_index', to='IoT.Node')),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='access_index', to='IoT.Projects')),
+                ('sensor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='access_index', to='IoT.Sensors')),
+                ('token', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='token_access_index', to='users.CustomAccessTokens')),
+                ('zone', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='access_index', to='IoT.Zones')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='accessindex',
+            index=models.Index(fields=['token', 'project'], name='iot_access_token_project'),
+        ),
+        migrations.AddIndex(
+            model_name='accessindex',
+            index=models.Index(fields=['token', 'zone'], name='iot_access_token_zone'),
+        ),
+        migrations.AddIndex(
+            model_name='accessindex',
+            index=models.Index(fields=['token', 'node'], name='iot_access_token_node'),
+        ),
+        migrations.AddIndex(
+            model_name='accessindex',
+            index=models.Index(fields=['token', 'sensor'], name='iot_access_token_sensor'),
+        ),
+        migrations.RunPython(build_access_index, migrations.RunPython.noop),
+    ]
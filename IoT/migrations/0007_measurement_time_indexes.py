@@ -0,0 +1,29 @@
+# Generated by Django 3.0.7 on 2026-10-18 12:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('IoT', '0006_access_index'),
+    ]
+
+    # Composite indexes are created before dropping the sensor index
+    # since MySQL requires an index starting with the foreign key column
+    operations = [
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['sensor', 'measurement_type', 'created_at', 'value'], name='iot_meas_sensor_type_time'),
+        ),
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['sensor', 'created_at'], name='iot_meas_sensor_time'),
+        ),
+        migrations.AlterField(
+            model_name='measurement',
+            name='sensor',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='sensor_measurements', to='IoT.Sensors'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.0.7 on 2026-10-18 12:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('IoT', '0007_measurement_time_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeasurementRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('measurement_type', models.CharField(choices=[('A_TEMPERATURE', 'Ambiental Temperature'), ('R_HUMIDITY', 'Relative Humidity'), ('B_PRESSURE', 'Barometric Presurre'), ('B_ALTITUDE', 'Barometric Altitude'), ('A_HUMIDITY', 'Barometric Humidity'), ('S_MOISTURE', 'Soil Moisture'), ('LDR_LIGHT', 'LDR Light Index')], max_length=20)),
+                ('granularity', models.CharField(choices=[('minute', 'Per minute'), ('hour', 'Per hour'), ('day', 'Per day')], max_length=6)),
+                ('bucket', models.DateTimeField()),
+                ('min_value', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('max_value', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('sum_value', models.DecimalField(decimal_places=2, max_digits=18)),
+                ('count', models.PositiveIntegerField()),
+                ('last_value', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('last_at', models.DateTimeField()),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sensor_rollups', to='IoT.Sensors')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='measurementrollup',
+            constraint=models.UniqueConstraint(fields=('sensor', 'measurement_type', 'granularity', 'bucket'), name='iot_rollup_unique_bucket'),
+        ),
+    ]
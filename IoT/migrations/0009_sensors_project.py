@@ -0,0 +1,32 @@
+# Generated by Django 3.0.7 on 2026-10-18 12:30
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def fill_sensors_project(apps, schema_editor):
+    """
+    Copies the project of the zone of every existing sensor
+    """
+    Zones = apps.get_model('IoT', 'Zones')
+    Sensors = apps.get_model('IoT', 'Sensors')
+    Sensors.objects.update(project_id=Subquery(
+        Zones.objects.filter(pk=OuterRef('zone_id')).values('project_id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('IoT', '0008_measurement_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensors',
+            name='project',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='project_sensors', to='IoT.Projects'),
+        ),
+        migrations.RunPython(fill_sensors_project, migrations.RunPython.noop),
+    ]
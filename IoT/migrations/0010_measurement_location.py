@@ -0,0 +1,48 @@
+# Generated by Django 3.0.7 on 2026-10-18 12:32
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def fill_measurements_location(apps, schema_editor):
+    """
+    Copies the zone and project of the sensor of every existing measurement
+    """
+    Sensors = apps.get_model('IoT', 'Sensors')
+    Measurement = apps.get_model('IoT', 'Measurement')
+    sensor = Sensors.objects.filter(pk=OuterRef('sensor_id'))
+    Measurement.objects.update(
+        zone_id=Subquery(sensor.values('zone_id')[:1]),
+        project_id=Subquery(sensor.values('project_id')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('IoT', '0009_sensors_project'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='measurement',
+            name='project',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='project_measurements', to='IoT.Projects'),
+        ),
+        migrations.AddField(
+            model_name='measurement',
+            name='zone',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='zone_measurements', to='IoT.Zones'),
+        ),
+        # Filled before creating the indexes so they are built once
+        migrations.RunPython(fill_measurements_location, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['zone', 'measurement_type', 'created_at'], name='iot_meas_zone_type_time'),
+        ),
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['project', 'created_at'], name='iot_meas_project_time'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.0.7 on 2026-10-18 12:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('IoT', '0010_measurement_location'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RetentionPolicy',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('measurement_type', models.CharField(blank=True, choices=[('A_TEMPERATURE', 'Ambiental Temperature'), ('R_HUMIDITY', 'Relative Humidity'), ('B_PRESSURE', 'Barometric Presurre'), ('B_ALTITUDE', 'Barometric Altitude'), ('A_HUMIDITY', 'Barometric Humidity'), ('S_MOISTURE', 'Soil Moisture'), ('LDR_LIGHT', 'LDR Light Index')], default='', max_length=20)),
+                ('days', models.PositiveIntegerField()),
+                ('enabled', models.BooleanField(default=True)),
+                ('last_run_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='retention_policies', to='IoT.Projects')),
+            ],
+            options={
+                'verbose_name_plural': 'retention policies',
+            },
+        ),
+    ]
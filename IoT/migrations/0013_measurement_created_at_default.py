@@ -0,0 +1,19 @@
+# Generated by Django 3.0.7 on 2026-10-18 13:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('IoT', '0012_deletion_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='measurement',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
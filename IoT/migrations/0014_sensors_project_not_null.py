@@ -0,0 +1,32 @@
+# Generated by Django 3.0.7 on 2026-10-18 15:20
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def fill_missing_projects(apps, schema_editor):
+    """
+    Copies the project of the zone of sensors created without one (e.g. bulk_create)
+    """
+    Zones = apps.get_model('IoT', 'Zones')
+    Sensors = apps.get_model('IoT', 'Sensors')
+    Sensors.objects.filter(project__isnull=True).update(project_id=Subquery(
+        Zones.objects.filter(pk=OuterRef('zone_id')).values('project_id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('IoT', '0013_measurement_created_at_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_missing_projects, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='sensors',
+            name='project',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='project_sensors', to='IoT.Projects'),
+        ),
+    ]
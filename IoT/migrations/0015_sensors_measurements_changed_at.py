@@ -0,0 +1,18 @@
+# Generated by Django 3.0.7 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('IoT', '0014_sensors_project_not_null'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensors',
+            name='measurements_changed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -34,4 +34,54 @@ MEASUREMENT_TYPE_CHOICES = [
         (B_HUMIDITY, 'Barometric Humidity'),
         (S_MOISTURE, 'Soil Moisture'),
         (LDR_LIGHT, 'LDR Light Index'),
-]
\ No newline at end of file
+]
+
+MINUTE = 'minute'
+HOUR = 'hour'
+DAY = 'day'
+
+ROLLUP_GRANULARITY_CHOICES = [
+        (MINUTE, 'Per minute'),
+        (HOUR, 'Per hour'),
+        (DAY, 'Per day'),
+]
+
+# Length in seconds of every rollup granularity
+ROLLUP_GRANULARITY_SECONDS = {
+    MINUTE:60,
+    HOUR:3600,
+    DAY:86400,
+}
+
+ZONE = 'zone'
+NODE = 'node'
+SENSOR = 'sensor'
+
+DELETION_OBJECT_CHOICES = [
+        (ZONE, 'Zone'),
+        (NODE, 'Node'),
+        (SENSOR, 'Sensor'),
+]
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+DELETION_STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+]
+
+# Stable codes of the measurement types inside binary frames (see IoT.api.parsers)
+MEASUREMENT_TYPE_CODES = {
+    1:A_TEMPERATURE,
+    2:R_HUMIDITY,
+    3:B_PRESSURE,
+    4:B_ALTITUDE,
+    5:B_HUMIDITY,
+    6:S_MOISTURE,
+    7:LDR_LIGHT,
+}
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from users.models import GeneralUser, CustomAccessTokens
 import IoT.model_choices as choices
 
@@ -28,6 +29,19 @@ class Projects(models.Model):
     def __str__(self):
         return '{}: {}'.format(self.name, self.snippet_title)
 
+class ActiveManager(models.Manager):
+    """
+    Hides the objects deleted and waiting to be purged
+    ====
+
+    Used as default manager, thus related managers, lookups and
+    get_object_or_404 ignore tombstoned objects. all_objects keeps
+    every row (see IoT.deletions)
+    """
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Zones(models.Model):
     """
     Class that manages information related
@@ -51,11 +65,19 @@ class Zones(models.Model):
     )
     name = models.CharField(max_length=30)
     description = models.TextField()
+    # Set when the object is deleted, its rows are purged by IoT.deletions
+    deleted_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    objects = ActiveManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return '{} from {}'.format(self.name, self.project.name)
 
     def ambiental_sensors(self):
+        # Loaded by IoT.loaders when the whole project tree is prefetched
+        if hasattr(self, 'prefetched_ambiental_sensors'):
+            return self.prefetched_ambiental_sensors
         return Sensors.objects.filter(zone=self, ambiental=True)
 
 
@@ -77,6 +99,12 @@ class Node(models.Model):
         blank=True,
         related_name="token_iot_nodes"
     )
+    # Set when the object is deleted, its rows are purged by IoT.deletions
+    deleted_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    objects = ActiveManager()
+    all_objects = models.Manager()
+
     def __str__(self):
         return '{} from {}'.format(self.name, self.zone.name)
 
@@ -108,10 +136,47 @@ class Sensors(models.Model):
         on_delete=models.CASCADE,
         related_name="zone_ambiental_sensors",
     )
+    # Project of the zone, kept updated by IoT.signals. Signals don't run on
+    # bulk_create nor queryset updates, they must set project explicitly
+    project = models.ForeignKey(
+        Projects,
+        on_delete=models.CASCADE,
+        related_name="project_sensors",
+        editable=False,
+    )
+    # Set when the object is deleted, its rows are purged by IoT.deletions
+    deleted_at = models.DateTimeField(blank=True, null=True, editable=False)
+    # Last time measurements were stored or deleted, version of cached plots (see IoT.plot_cache)
+    measurements_changed_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    objects = ActiveManager()
+    all_objects = models.Manager()
+
     def __str__(self):
         return '{} from {}'.format(self.sensor_type, self.zone.name)
 
 
+class MeasurementQuerySet(models.QuerySet):
+    """
+    Time aware queries for measurements
+    ====
+    """
+    def between(self, start=None, end=None):
+        """
+        Filters measurements created within [start, end)
+        ====
+
+        Plain range predicates are used so the time-series
+        indexes can be used, None leaves the side open
+        """
+        qs = self
+        if start is not None:
+            qs = qs.filter(created_at__gte=start)
+        if end is not None:
+            qs = qs.filter(created_at__lt=end)
+        return qs
+
+
 class Measurement(models.Model):
     """
     Class to store and keep a register of
@@ -125,11 +190,228 @@ class Measurement(models.Model):
         null=False
     )
     value = models.DecimalField(max_digits=8, decimal_places=2)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add, buffered readings keep the time they were accepted
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     sensor = models.ForeignKey(
         Sensors,
         on_delete=models.CASCADE,
         related_name="sensor_measurements",
+        # Covered by the composite indexes below
+        db_index=False,
+    )
+    # Zone and project of the sensor, set on insert and kept updated by IoT.signals
+    # so zone and project wide queries don't join through Sensors
+    zone = models.ForeignKey(
+        Zones,
+        on_delete=models.CASCADE,
+        related_name="zone_measurements",
+        blank=True,
+        null=True,
+        editable=False,
+        db_index=False,
     )
+    project = models.ForeignKey(
+        Projects,
+        on_delete=models.CASCADE,
+        related_name="project_measurements",
+        blank=True,
+        null=True,
+        editable=False,
+        db_index=False,
+    )
+
+    objects = MeasurementQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Series of a sensor measurement type, includes value so plots
+            # are answered from the index
+            models.Index(fields=['sensor', 'measurement_type', 'created_at', 'value'], name='iot_meas_sensor_type_time'),
+            # Time ordered measurements of a sensor
+            models.Index(fields=['sensor', 'created_at'], name='iot_meas_sensor_time'),
+            # Zone wide series of a measurement type
+            models.Index(fields=['zone', 'measurement_type', 'created_at'], name='iot_meas_zone_type_time'),
+            # Project wide time ranges
+            models.Index(fields=['project', 'created_at'], name='iot_meas_project_time'),
+        ]
+
     def __str__(self):
         return '{}:{} from {}'.format(self.created_at, self.value, self.sensor.sensor_type)
+
+
+class AccessIndex(models.Model):
+    """
+    Materialized access token permissions
+    ====
+
+    Every row grants a token access to a single project, zone,
+    node or sensor, including the ones inherited from parent
+    objects. It's kept up to date by the receivers inside
+    IoT.signals so permission checks become a single lookup
+    """
+    token = models.ForeignKey(
+        CustomAccessTokens,
+        on_delete=models.CASCADE,
+        related_name="token_access_index",
+    )
+    project = models.ForeignKey(
+        Projects,
+        on_delete=models.CASCADE,
+        related_name="access_index",
+        blank=True,
+        null=True,
+    )
+    zone = models.ForeignKey(
+        Zones,
+        on_delete=models.CASCADE,
+        related_name="access_index",
+        blank=True,
+        null=True,
+    )
+    node = models.ForeignKey(
+        Node,
+        on_delete=models.CASCADE,
+        related_name="access_index",
+        blank=True,
+        null=True,
+    )
+    sensor = models.ForeignKey(
+        Sensors,
+        on_delete=models.CASCADE,
+        related_name="access_index",
+        blank=True,
+        null=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['token', 'project'], name='iot_access_token_project'),
+            models.Index(fields=['token', 'zone'], name='iot_access_token_zone'),
+            models.Index(fields=['token', 'node'], name='iot_access_token_node'),
+            models.Index(fields=['token', 'sensor'], name='iot_access_token_sensor'),
+        ]
+
+    def __str__(self):
+        return '{} access to {}'.format(self.token, self.project or self.zone or self.node or self.sensor)
+
+
+class MeasurementRollup(models.Model):
+    """
+    Aggregated measurements of a sensor per time bucket
+    ====
+
+    Stores min, max, sum, count and last value of the measurements
+    of a type created within [bucket, bucket + granularity). Rows are
+    maintained by IoT.rollups on ingestion and by compact_rollups
+    """
+    sensor = models.ForeignKey(
+        Sensors,
+        on_delete=models.CASCADE,
+        related_name="sensor_rollups",
+    )
+    measurement_type = models.CharField(
+        max_length=20,
+        choices=choices.MEASUREMENT_TYPE_CHOICES,
+    )
+    granularity = models.CharField(
+        max_length=6,
+        choices=choices.ROLLUP_GRANULARITY_CHOICES,
+    )
+    bucket = models.DateTimeField()
+    min_value = models.DecimalField(max_digits=8, decimal_places=2)
+    max_value = models.DecimalField(max_digits=8, decimal_places=2)
+    sum_value = models.DecimalField(max_digits=18, decimal_places=2)
+    count = models.PositiveIntegerField()
+    last_value = models.DecimalField(max_digits=8, decimal_places=2)
+    last_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['sensor', 'measurement_type', 'granularity', 'bucket'],
+                name='iot_rollup_unique_bucket'
+            ),
+        ]
+
+    @property
+    def average(self):
+        return self.sum_value / self.count if self.count else None
+
+    def __str__(self):
+        return '{} {} of {} at {}'.format(self.granularity, self.measurement_type, self.sensor_id, self.bucket)
+
+
+class RetentionPolicy(models.Model):
+    """
+    Maximum age of stored measurements
+    ====
+
+    A policy can be limited to a project and/or a measurement type,
+    empty values apply it to every project or type. Policies are
+    enforced by the enforce_retention command (see IoT.retention)
+    """
+    project = models.ForeignKey(
+        Projects,
+        on_delete=models.CASCADE,
+        related_name="retention_policies",
+        blank=True,
+        null=True,
+    )
+    measurement_type = models.CharField(
+        max_length=20,
+        choices=choices.MEASUREMENT_TYPE_CHOICES,
+        blank=True,
+        default='',
+    )
+    days = models.PositiveIntegerField()
+    enabled = models.BooleanField(default=True)
+    last_run_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    class Meta:
+        verbose_name_plural = 'retention policies'
+
+    def __str__(self):
+        return '{} days of {} in {}'.format(
+            self.days,
+            self.measurement_type or 'every type',
+            self.project.name if self.project_id else 'every project',
+        )
+
+
+class DeletionJob(models.Model):
+    """
+    Background purge of a deleted zone, node or sensor
+    ====
+
+    Deleted objects are tombstoned right away and their rows are
+    purged afterwards by IoT.deletions, clients poll the job status
+    """
+    user = models.ForeignKey(
+        GeneralUser,
+        on_delete=models.CASCADE,
+        related_name="iot_deletion_jobs",
+    )
+    object_type = models.CharField(
+        max_length=10,
+        choices=choices.DELETION_OBJECT_CHOICES,
+    )
+    object_id = models.PositiveIntegerField()
+    status = models.CharField(
+        max_length=10,
+        choices=choices.DELETION_STATUS_CHOICES,
+        default=choices.PENDING,
+    )
+    # Measurements and rollups purged so far
+    deleted_rows = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='iot_deletion_status'),
+        ]
+
+    def __str__(self):
+        return 'Deletion of {} {} ({})'.format(self.object_type, self.object_id, self.status)
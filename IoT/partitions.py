@@ -0,0 +1,210 @@
+from django.conf import settings
+from django.db import connection as default_connection
+from IoT.models import Measurement
+import datetime
+
+"""
+Time chunked Measurement storage
+====
+
+Measurements are stored in monthly chunks (UTC). On MySQL the chunks
+are native RANGE partitions over TO_DAYS(created_at), thus queries
+filtering created_at with range predicates (MeasurementQuerySet.between)
+only read the partitions of the requested range and old months can be
+dropped as a whole.
+
+Other databases keep a single table, their chunks are the month
+ranges returned by month_chunks which are used to process long ranges
+one month at a time over the time-series indexes.
+
+MySQL requires the partitioning column to be part of every unique key
+and doesn't allow foreign keys on partitioned tables, converting the
+table (manage_partitions --convert) changes the primary key to
+(id, created_at) and drops its foreign key constraints. Cascades keep
+working since Django emulates them
+"""
+
+DEFAULT_SETTINGS = {
+    # Months of partitions created ahead of the current one
+    'AHEAD':3,
+}
+
+# Name of the partition receiving dates beyond the last month
+MAX_PARTITION = 'pmax'
+
+
+def config():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'IOT_MEASUREMENT_PARTITIONS', {}))
+
+
+def month_start(date):
+    """
+    Returns the first instant of the (UTC) month of date
+    """
+    if isinstance(date, datetime.datetime):
+        date = date.astimezone(datetime.timezone.utc)
+    return datetime.datetime(date.year, date.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def month_chunks(start, end):
+    """
+    Splits [start, end) into (chunk_start, chunk_end) ranges on month boundaries
+    """
+    current = start
+    while current < end:
+        chunk_end = min(add_months(month_start(current), 1), end)
+        yield current, chunk_end
+        current = chunk_end
+
+
+def partition_name(month):
+    return 'p{:04d}{:02d}'.format(month.year, month.month)
+
+
+def partition_clause(month):
+    """
+    Returns the definition of the partition holding month
+    """
+    return "PARTITION {} VALUES LESS THAN (TO_DAYS('{}'))".format(
+        partition_name(month),
+        add_months(month, 1).strftime('%Y-%m-%d'),
+    )
+
+
+def partition_clauses(first, last):
+    """
+    Definitions of the partitions from month first to month last, plus the catch all one
+    """
+    clauses = []
+    month = month_start(first)
+    while month <= last:
+        clauses.append(partition_clause(month))
+        month = add_months(month, 1)
+    clauses.append('PARTITION {} VALUES LESS THAN MAXVALUE'.format(MAX_PARTITION))
+    return clauses
+
+
+def supported(connection=None):
+    """
+    Native partitioning is only available on MySQL
+    """
+    return (connection or default_connection).vendor == 'mysql'
+
+
+def table():
+    return Measurement._meta.db_table
+
+
+def existing_partitions(connection=None):
+    """
+    Returns the month partitions of the table ordered by month
+    """
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT PARTITION_NAME FROM information_schema.PARTITIONS '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL '
+            'ORDER BY PARTITION_ORDINAL_POSITION',
+            [table()]
+        )
+        return [row[0] for row in cursor.fetchall() if row[0] != MAX_PARTITION]
+
+
+def partition_month(name):
+    return datetime.datetime(int(name[1:5]), int(name[5:7]), 1, tzinfo=datetime.timezone.utc)
+
+
+def convert(ahead=None, connection=None):
+    """
+    Partitions the Measurement table by month
+    ====
+
+    Rewrites the whole table, returns the statements executed
+    """
+    connection = connection or default_connection
+    ahead = config()['AHEAD'] if ahead is None else ahead
+    qn = connection.ops.quote_name
+    first = Measurement.objects.order_by('created_at').values_list('created_at', flat=True).first()
+    now = month_start(datetime.datetime.now(datetime.timezone.utc))
+    statements = []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND REFERENCED_TABLE_NAME IS NOT NULL',
+            [table()]
+        )
+        for (name,) in cursor.fetchall():
+            statements.append('ALTER TABLE {} DROP FOREIGN KEY {}'.format(qn(table()), qn(name)))
+        statements.append('ALTER TABLE {} DROP PRIMARY KEY, ADD PRIMARY KEY ({}, {})'.format(
+            qn(table()), qn('id'), qn('created_at')
+        ))
+        statements.append('ALTER TABLE {} PARTITION BY RANGE (TO_DAYS({})) ({})'.format(
+            qn(table()),
+            qn('created_at'),
+            ', '.join(partition_clauses(month_start(first or now), add_months(now, ahead))),
+        ))
+        for sql in statements:
+            cursor.execute(sql)
+    return statements
+
+
+def create_ahead(ahead=None, connection=None):
+    """
+    Creates the monthly partitions up to ahead months from now
+    ====
+
+    New months are split from the catch all partition, which is
+    empty while partitions are created in time. Returns the names
+    of the new partitions
+    """
+    connection = connection or default_connection
+    ahead = config()['AHEAD'] if ahead is None else ahead
+    partitions = existing_partitions(connection)
+    if not partitions:
+        raise ValueError('{} is not partitioned, run manage_partitions --convert first'.format(table()))
+    last = add_months(month_start(datetime.datetime.now(datetime.timezone.utc)), ahead)
+    first = add_months(partition_month(partitions[-1]), 1)
+    clauses = partition_clauses(first, last)
+    if len(clauses) == 1:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute('ALTER TABLE {} REORGANIZE PARTITION {} INTO ({})'.format(
+            connection.ops.quote_name(table()),
+            MAX_PARTITION,
+            ', '.join(clauses),
+        ))
+    return [c.split()[1] for c in clauses[:-1]]
+
+
+def expired_partitions(cutoff, connection=None):
+    """
+    Returns the partitions whose whole month is older than cutoff
+    """
+    return [
+        name for name in existing_partitions(connection)
+        if add_months(partition_month(name), 1) <= cutoff
+    ]
+
+
+def drop_before(cutoff, connection=None):
+    """
+    Drops the partitions whose whole month is older than cutoff
+    ====
+
+    Dropping a partition discards its rows instantly without
+    deleting them one by one, returns the dropped partitions
+    """
+    connection = connection or default_connection
+    expired = expired_partitions(cutoff, connection)
+    if expired:
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE {} DROP PARTITION {}'.format(
+                connection.ops.quote_name(table()),
+                ', '.join(expired),
+            ))
+    return expired
@@ -0,0 +1,123 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from IoT.models import Sensors
+import hashlib
+
+"""
+Rendered plot cache
+====
+
+Rendered PNG plots are stored within Django's cache framework under a
+key built from the view, its target, measurement type, time window,
+size and the versions of the plotted sensors.
+
+Every sensor has a version (Sensors.measurements_changed_at, the time
+its measurements last changed) which is bumped whenever measurements
+are stored or deleted, thus new data changes the key of every plot it
+appears in and old entries simply expire. Versions are also sent as
+ETag and Last-Modified so clients polling a plot receive 304 Not
+Modified until new data arrives.
+
+Versions are read from the database, every worker sees a bump as soon
+as its transaction commits, thus CACHE_ALIAS may be a per process cache
+"""
+
+DEFAULT_SETTINGS = {
+    # Cache alias storing versions and rendered plots
+    'CACHE_ALIAS':'default',
+    # Seconds a rendered plot is kept, 0 disables the cache
+    'TTL':3600,
+}
+
+PLOT_PREFIX = 'iot_plot:'
+
+
+def config():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'IOT_PLOT_CACHE', {}))
+
+
+def cache():
+    return caches[config()['CACHE_ALIAS']]
+
+
+def touch(sensor_ids):
+    """
+    Marks the measurements of the selected sensors as modified
+    ====
+
+    Runs within the transaction storing or deleting the measurements,
+    the new version is visible once it commits
+    """
+    sensor_ids = sorted(set(sensor_ids))
+    if sensor_ids:
+        Sensors.all_objects.filter(pk__in=sensor_ids).update(measurements_changed_at=timezone.now())
+
+
+def touch_all():
+    """
+    Marks the measurements of every sensor as modified
+    """
+    Sensors.all_objects.update(measurements_changed_at=timezone.now())
+
+
+def versions(sensor_ids):
+    """
+    Returns {sensor_id: version} of the selected sensors
+    ====
+
+    Versions are POSIX timestamps, 0 while the measurements of a
+    sensor haven't changed since versions are tracked
+    """
+    stored = dict(Sensors.all_objects.filter(pk__in=list(sensor_ids)).values_list('pk', 'measurements_changed_at'))
+    return {pk:stored[pk].timestamp() if stored.get(pk) else 0 for pk in sensor_ids}
+
+
+def plot_key(parts, sensor_versions):
+    """
+    Returns the cache key of a plot for the current sensor versions
+    """
+    raw = '|'.join(str(p) for p in parts) + '|' + ','.join(
+        '{}:{!r}'.format(pk, v) for pk, v in sorted(sensor_versions.items())
+    )
+    return PLOT_PREFIX + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def png_response(content):
+    response = HttpResponse(content, content_type='image/png')
+    response['Content-Length'] = str(len(content))
+    return response
+
+
+def cached_plot(request, parts, sensor_ids, render):
+    """
+    Returns the PNG response of a plot, rendering it only when needed
+    ====
+
+    * parts: Values identifying the plot (view, target, type, window, size)
+    * sensor_ids: Sensors whose measurements are plotted
+    * render: Callable returning the PNG bytes of the plot
+
+    Answers 304 Not Modified when the client already has the plot
+    """
+    sensor_versions = versions(sensor_ids)
+    key = plot_key(parts, sensor_versions)
+    etag = quote_etag(key[len(PLOT_PREFIX):])
+    last_modified = int(max(sensor_versions.values(), default=0))
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        ttl = config()['TTL']
+        content = cache().get(key) if ttl else None
+        if content is None:
+            content = render()
+            if ttl:
+                cache().set(key, content, ttl)
+        response = png_response(content)
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,157 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from django.conf import settings
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import io
+import threading
+
+"""
+Plot rendering engine
+====
+
+Plots are drawn on matplotlib Figure objects created without pyplot,
+so no global state is shared between requests and no figure is ever
+registered in pyplot's figure manager.
+
+Rendering runs inside a bounded pool of worker threads, every worker
+keeps a single figure and canvas which are cleared after each plot.
+When the pool and its queue are full new renders are rejected right
+away with RenderBusy instead of holding the request worker
+"""
+
+DEFAULT_SETTINGS = {
+    # Threads drawing plots
+    'WORKERS':2,
+    # Renders waiting for a worker before new ones are rejected
+    'QUEUE':8,
+    # Seconds a request waits for its plot
+    'TIMEOUT':30,
+}
+
+
+class RenderBusy(Exception):
+    """
+    Raised when a plot can't be rendered in time
+    """
+    pass
+
+
+def config():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'IOT_PLOT_RENDERING', {}))
+
+
+class Panel:
+    """
+    Subplot of a figure
+    ====
+
+    Holds (label, dates, values) series drawn on the same axes
+    """
+    def __init__(self, title=None, series=None):
+        self.title = title
+        self.series = series or []
+
+    def add(self, label, dates, values):
+        self.series.append((label, dates, values))
+
+
+_local = threading.local()
+
+
+def worker_figure():
+    """
+    Returns the figure and canvas reused by the current thread
+    """
+    figure = getattr(_local, 'figure', None)
+    if figure is None:
+        figure = Figure()
+        _local.canvas = FigureCanvasAgg(figure)
+        _local.figure = figure
+    return figure, _local.canvas
+
+
+def draw(panels, title=None, figsize=(10, 5), legend=True):
+    """
+    Draws panels as stacked subplots and returns the PNG bytes
+    ====
+
+    figsize is the size of a single panel, a figure without panels
+    is rendered with a "No measurements" notice
+    """
+    figure, canvas = worker_figure()
+    try:
+        rows = max(len(panels), 1)
+        figure.set_size_inches(figsize[0], figsize[1] * rows)
+        axes = figure.subplots(rows, 1, squeeze=False)[:, 0]
+        if title:
+            figure.suptitle(title, fontsize=16)
+        if not panels:
+            axes[0].text(0.5, 0.5, 'No measurements', ha='center', va='center', transform=axes[0].transAxes)
+        for ax, panel in zip(axes, panels):
+            if panel.title:
+                ax.set_title(panel.title)
+            for label, dates, values in panel.series:
+                ax.plot(dates, values, label=label)
+            if legend and any(label for label, d, v in panel.series):
+                ax.legend()
+        figure.autofmt_xdate()
+        buf = io.BytesIO()
+        canvas.print_png(buf)
+        return buf.getvalue()
+    finally:
+        # Release artists and their data, the figure is kept for the next plot
+        figure.clear()
+
+
+class RenderPool:
+    """
+    Bounded thread pool drawing plots
+    """
+    def __init__(self, workers, queue, timeout):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='iot-render')
+        self._slots = threading.BoundedSemaphore(workers + queue)
+
+    def render(self, *args, **kwargs):
+        """
+        Draws a plot within the pool, see draw for the arguments
+        """
+        if not self._slots.acquire(blocking=False):
+            raise RenderBusy('Too many plots being rendered')
+        try:
+            future = self._executor.submit(draw, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise RenderBusy('Plot rendering timed out')
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool():
+    """
+    Returns the process render pool, created on first use
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                c = config()
+                _pool = RenderPool(c['WORKERS'], c['QUEUE'], c['TIMEOUT'])
+    return _pool
+
+
+def render(panels, title=None, figsize=(10, 5), legend=True):
+    """
+    Renders panels into PNG bytes using the render pool
+    """
+    return pool().render(panels, title, figsize, legend)
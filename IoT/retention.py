@@ -0,0 +1,126 @@
+from django.conf import settings
+from django.utils import timezone
+from django.db import transaction
+from IoT.models import Measurement, RetentionPolicy
+from IoT import partitions, plot_cache
+import datetime
+import time
+
+"""
+Measurement retention
+====
+
+Enforces RetentionPolicy rows removing the measurements older than
+their age. Rows are deleted in bounded batches, every batch is a
+single DELETE over a primary key range, thus no object is loaded,
+no signal is sent and locks are only held for a batch. Policies
+covering every project and type first drop the expired monthly
+partitions when the table is partitioned (see IoT.partitions).
+
+enforce_all is the scheduler hook, it's called by the
+enforce_retention command and can be called by any task runner.
+Rollups are kept, so aggregates outlive the raw measurements
+"""
+
+DEFAULT_SETTINGS = {
+    # Rows removed by each DELETE
+    'BATCH_SIZE':5000,
+    # Seconds waited between batches, leaves room to other queries
+    'SLEEP':0.0,
+}
+
+
+def config():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'IOT_RETENTION', {}))
+
+
+def delete_in_batches(queryset, batch_size=None, sleep=None, progress=None):
+    """
+    Deletes the rows of queryset by primary key ranges
+    ====
+
+    Each batch selects the next batch_size ids and deletes the range
+    they span, every DELETE runs in its own transaction along with the
+    plot version bump of the sensors it removed rows from (queryset
+    rows must have a sensor_id). progress is called with the amount of
+    rows deleted so far after each batch. Returns the amount of rows
+    deleted
+    """
+    c = config()
+    batch_size = batch_size or c['BATCH_SIZE']
+    sleep = c['SLEEP'] if sleep is None else sleep
+    deleted = 0
+    while True:
+        rows = list(queryset.order_by('pk').values_list('pk', 'sensor_id')[:batch_size])
+        if not rows:
+            return deleted
+        ids = [pk for pk, sensor_id in rows]
+        with transaction.atomic():
+            # Measurement has no dependent rows nor delete signals, thus a single DELETE is issued
+            deleted += queryset.filter(pk__gte=ids[0], pk__lte=ids[-1]).delete()[0]
+            plot_cache.touch(sensor_id for pk, sensor_id in rows)
+        if progress is not None:
+            progress(deleted)
+        if len(ids) < batch_size:
+            return deleted
+        if sleep:
+            time.sleep(sleep)
+
+
+def cutoff(policy, now=None):
+    return (now or timezone.now()) - datetime.timedelta(days=policy.days)
+
+
+def expired(policy, now=None):
+    """
+    Returns the measurements expired under policy
+    """
+    queryset = Measurement.objects.filter(created_at__lt=cutoff(policy, now))
+    if policy.project_id is not None:
+        queryset = queryset.filter(project_id=policy.project_id)
+    if policy.measurement_type:
+        queryset = queryset.filter(measurement_type=policy.measurement_type)
+    return queryset
+
+
+def is_global(policy):
+    return policy.project_id is None and not policy.measurement_type
+
+
+def enforce(policy, now=None, batch_size=None, sleep=None, progress=None, dry_run=False):
+    """
+    Removes the measurements expired under policy
+    ====
+
+    Returns {'partitions': dropped partitions, 'deleted': rows deleted},
+    on a dry run nothing is removed and deleted is the amount of rows
+    that would be deleted
+    """
+    now = now or timezone.now()
+    dropped = []
+    if is_global(policy) and partitions.supported():
+        if dry_run:
+            dropped = partitions.expired_partitions(cutoff(policy, now))
+        else:
+            dropped = partitions.drop_before(cutoff(policy, now))
+            if dropped:
+                plot_cache.touch_all()
+    queryset = expired(policy, now)
+    if dry_run:
+        return {'partitions':dropped, 'deleted':queryset.count()}
+    deleted = delete_in_batches(queryset, batch_size, sleep, progress)
+    policy.last_run_at = now
+    policy.save(update_fields=['last_run_at'])
+    return {'partitions':dropped, 'deleted':deleted}
+
+
+def enforce_all(policies=None, **kwargs):
+    """
+    Enforces every enabled policy, see enforce for the arguments
+    ====
+
+    Returns [(policy, result)]
+    """
+    if policies is None:
+        policies = RetentionPolicy.objects.filter(enabled=True)
+    return [(policy, enforce(policy, **kwargs)) for policy in policies]
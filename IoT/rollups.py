@@ -0,0 +1,298 @@
+from collections import OrderedDict
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncMinute
+from IoT.models import Measurement, MeasurementRollup
+import IoT.model_choices as choices
+import datetime
+
+"""
+Measurement rollups
+====
+
+Maintains per minute, hour and day aggregates of measurements inside
+MeasurementRollup. Rollups are updated incrementally when measurements
+are ingested (IoT.api.ingest) or saved one at a time (IoT.signals) and
+can be recomputed from the raw measurements with the compact_rollups
+management command, which is required after editing or deleting
+measurements.
+
+Queries ask for a resolution in seconds and are answered using the
+coarsest enabled granularity that is not coarser than the resolution
+"""
+
+DEFAULT_SETTINGS = {
+    # Update rollups whenever measurements are ingested
+    'ON_INGEST':True,
+    # Maintained granularities
+    'GRANULARITIES':[choices.MINUTE, choices.HOUR, choices.DAY],
+}
+
+
+def config():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'IOT_ROLLUPS', {}))
+
+
+def granularities():
+    """
+    Enabled granularities from the finest to the coarsest
+    """
+    enabled = config()['GRANULARITIES']
+    return sorted(enabled, key=lambda g: choices.ROLLUP_GRANULARITY_SECONDS[g])
+
+
+def truncate(date, granularity):
+    """
+    Returns the start of the bucket date belongs to (in UTC)
+    """
+    date = date.astimezone(datetime.timezone.utc)
+    if granularity == choices.MINUTE:
+        return date.replace(second=0, microsecond=0)
+    elif granularity == choices.HOUR:
+        return date.replace(minute=0, second=0, microsecond=0)
+    return date.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class Aggregate:
+    """
+    Mergeable min, max, sum, count and last value of a bucket
+    """
+    __slots__ = ('min_value', 'max_value', 'sum_value', 'count', 'last_value', 'last_at')
+
+    def __init__(self, value, created_at):
+        self.min_value = value
+        self.max_value = value
+        self.sum_value = value
+        self.count = 1
+        self.last_value = value
+        self.last_at = created_at
+
+    def add(self, value, created_at):
+        self.merge(self.__class__(value, created_at))
+
+    def merge(self, other):
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+        self.sum_value += other.sum_value
+        self.count += other.count
+        if other.last_at >= self.last_at:
+            self.last_value = other.last_value
+            self.last_at = other.last_at
+
+    @classmethod
+    def from_rollup(cls, rollup):
+        aggregate = cls(rollup.last_value, rollup.last_at)
+        aggregate.min_value = rollup.min_value
+        aggregate.max_value = rollup.max_value
+        aggregate.sum_value = rollup.sum_value
+        aggregate.count = rollup.count
+        return aggregate
+
+    def apply(self, rollup):
+        for field in self.__slots__:
+            setattr(rollup, field, getattr(self, field))
+        return rollup
+
+
+def aggregate_rows(rows, enabled=None):
+    """
+    Aggregates (sensor_id, measurement_type, value, created_at) rows
+    ====
+
+    Returns a dictionary {(sensor_id, type, granularity, bucket): Aggregate}
+    """
+    enabled = enabled or granularities()
+    buckets = OrderedDict()
+    for sensor_id, m_type, value, created_at in rows:
+        for granularity in enabled:
+            key = (sensor_id, m_type, granularity, truncate(created_at, granularity))
+            if key in buckets:
+                buckets[key].add(value, created_at)
+            else:
+                buckets[key] = Aggregate(value, created_at)
+    return buckets
+
+
+def bucket_lookup(keys):
+    """
+    Returns a Q matching the rollup rows of keys
+    """
+    lookup = Q()
+    by_group = {}
+    for sensor_id, m_type, granularity, bucket in keys:
+        by_group.setdefault((sensor_id, m_type, granularity), []).append(bucket)
+    for (sensor_id, m_type, granularity), buckets in by_group.items():
+        lookup |= Q(sensor_id=sensor_id, measurement_type=m_type, granularity=granularity, bucket__in=buckets)
+    return lookup
+
+
+def merge_aggregates(buckets):
+    """
+    Merges aggregates into the stored rollups
+    ====
+
+    Existing rows are locked and updated, missing rows are created.
+    Must be called inside a transaction
+    """
+    if not buckets:
+        return
+    stored = MeasurementRollup.objects.select_for_update().filter(bucket_lookup(buckets.keys()))
+    existing = {(r.sensor_id, r.measurement_type, r.granularity, r.bucket):r for r in stored}
+    updated = []
+    created = []
+    for key, aggregate in buckets.items():
+        rollup = existing.get(key)
+        if rollup is not None:
+            merged = Aggregate.from_rollup(rollup)
+            merged.merge(aggregate)
+            updated.append(merged.apply(rollup))
+        else:
+            sensor_id, m_type, granularity, bucket = key
+            created.append(aggregate.apply(MeasurementRollup(
+                sensor_id=sensor_id,
+                measurement_type=m_type,
+                granularity=granularity,
+                bucket=bucket,
+            )))
+    fields = list(Aggregate.__slots__)
+    MeasurementRollup.objects.bulk_update(updated, fields, batch_size=500)
+    MeasurementRollup.objects.bulk_create(created, batch_size=500)
+
+
+def record(measurements):
+    """
+    Adds newly stored measurements to their rollups
+    ====
+
+    Rows created concurrently for the same bucket make the insert fail,
+    in that case the merge is retried once against the stored rows
+    """
+    if not measurements or not config()['ON_INGEST']:
+        return
+    buckets = aggregate_rows(
+        (m.sensor_id, m.measurement_type, m.value, m.created_at) for m in measurements
+    )
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                merge_aggregates(buckets)
+            return
+        except IntegrityError:
+            if attempt:
+                raise
+
+
+def compact(start, end, sensor_ids=None, chunk=datetime.timedelta(days=1)):
+    """
+    Recomputes the rollups of [start, end) from the raw measurements
+    ====
+
+    The range is extended to whole days and processed one chunk at
+    a time, returns the amount of rollup rows written
+    """
+    enabled = granularities()
+    start = truncate(start, choices.DAY)
+    if truncate(end, choices.DAY) != end:
+        end = truncate(end, choices.DAY) + datetime.timedelta(days=1)
+    written = 0
+    current = start
+    while current < end:
+        chunk_end = min(current + chunk, end)
+        measurements = Measurement.objects.between(current, chunk_end)
+        rollups = MeasurementRollup.objects.filter(bucket__gte=current, bucket__lt=chunk_end, granularity__in=enabled)
+        if sensor_ids is not None:
+            measurements = measurements.filter(sensor_id__in=sensor_ids)
+            rollups = rollups.filter(sensor_id__in=sensor_ids)
+        rows = measurements.order_by('created_at').values_list(
+            'sensor_id', 'measurement_type', 'value', 'created_at'
+        ).iterator(chunk_size=5000)
+        buckets = aggregate_rows(rows, enabled)
+        with transaction.atomic():
+            rollups.delete()
+            MeasurementRollup.objects.bulk_create([
+                aggregate.apply(MeasurementRollup(
+                    sensor_id=sensor_id,
+                    measurement_type=m_type,
+                    granularity=granularity,
+                    bucket=bucket,
+                ))
+                for (sensor_id, m_type, granularity, bucket), aggregate in buckets.items()
+            ], batch_size=500)
+        written += len(buckets)
+        current = chunk_end
+    return written
+
+
+def pick_granularity(resolution):
+    """
+    Returns the coarsest enabled granularity satisfying resolution seconds
+    ====
+
+    None is returned when the resolution is finer than every rollup
+    """
+    selected = None
+    for granularity in granularities():
+        if choices.ROLLUP_GRANULARITY_SECONDS[granularity] <= resolution:
+            selected = granularity
+    return selected
+
+
+def aggregate_minutes(measurements):
+    """
+    Aggregates a measurements queryset per minute within the database
+    ====
+
+    Returns unsaved MeasurementRollup rows ordered by bucket, the last
+    values are read with a second query over the last_at of every bucket
+    """
+    rows = list(measurements.annotate(
+        bucket=TruncMinute('created_at', tzinfo=datetime.timezone.utc),
+    ).values('sensor_id', 'measurement_type', 'bucket').annotate(
+        min_value=Min('value'),
+        max_value=Max('value'),
+        sum_value=Sum('value'),
+        count=Count('id'),
+        last_at=Max('created_at'),
+    ).order_by('bucket'))
+    last_values = {}
+    for i in range(0, len(rows), 500):
+        dates = [r['last_at'] for r in rows[i:i+500]]
+        # Ties are resolved by the latest id
+        for s, m, c, value in measurements.filter(created_at__in=dates).order_by('id').values_list(
+            'sensor_id', 'measurement_type', 'created_at', 'value'
+        ):
+            last_values[(s, m, c)] = value
+    return [
+        MeasurementRollup(
+            granularity=choices.MINUTE,
+            last_value=last_values[(r['sensor_id'], r['measurement_type'], r['last_at'])],
+            **r
+        ) for r in rows
+    ]
+
+
+def series(sensor_id, measurement_type, start=None, end=None, resolution=3600):
+    """
+    Aggregated series of a sensor measurement type
+    ====
+
+    Returns (granularity, rollups ordered by bucket). When the resolution
+    is finer than every rollup the raw measurements are aggregated per
+    minute by the database instead and granularity is None
+    """
+    granularity = pick_granularity(resolution)
+    if granularity is None:
+        return None, aggregate_minutes(Measurement.objects.between(start, end).filter(
+            sensor_id=sensor_id, measurement_type=measurement_type
+        ))
+    rollups = MeasurementRollup.objects.filter(
+        sensor_id=sensor_id,
+        measurement_type=measurement_type,
+        granularity=granularity,
+    )
+    if start is not None:
+        rollups = rollups.filter(bucket__gte=truncate(start, granularity))
+    if end is not None:
+        rollups = rollups.filter(bucket__lt=end)
+    return granularity, list(rollups.order_by('bucket'))
@@ -0,0 +1,63 @@
+from django.conf import settings
+from IoT import downsampling
+import itertools
+import numpy as np
+
+"""
+Measurement series loader
+====
+
+Loads every series of a queryset (e.g. all the sensors of a zone or
+all the measurement types of a sensor) with a single time ordered
+query, which is read in chunks converted to NumPy arrays right away,
+thus a loaded row costs a few bytes instead of a tuple of Python
+objects, and split into per series arrays in one pass
+"""
+
+# Rows fetched from the database on each round trip
+SERIES_CHUNK_SIZE = getattr(settings, 'IOT_STREAM_CHUNK_SIZE', 2000)
+
+
+def load(queryset, key, chunk_size=None, ids=False):
+    """
+    Loads the measurements of queryset split by the key field
+    ====
+
+    Returns {key: (seconds, values)} where seconds are POSIX timestamps,
+    both float64 arrays ordered by creation date. With ids the int64
+    array of measurement ids is added, {key: (seconds, values, ids)}
+    """
+    chunk_size = chunk_size or SERIES_CHUNK_SIZE
+    fields = (key, 'value', 'created_at', 'id') if ids else (key, 'value', 'created_at')
+    rows = queryset.order_by('created_at').values_list(*fields).iterator(chunk_size=chunk_size)
+    chunks = []
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        columns = [
+            np.asarray([r[0] for r in chunk]),
+            np.fromiter((r[2].timestamp() for r in chunk), dtype=np.float64, count=len(chunk)),
+            np.fromiter((r[1] for r in chunk), dtype=np.float64, count=len(chunk)),
+        ]
+        if ids:
+            columns.append(np.fromiter((r[3] for r in chunk), dtype=np.int64, count=len(chunk)))
+        chunks.append(columns)
+    if not chunks:
+        return {}
+    keys, *columns = [np.concatenate(c) for c in zip(*chunks)]
+    # A stable sort groups the series keeping their time order
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    columns = [c[order] for c in columns]
+    starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+    ends = np.append(starts[1:], len(keys))
+    return {keys[s].item():tuple(c[s:e] for c in columns) for s, e in zip(starts, ends)}
+
+
+def plot_series(x, y, points, mode='lttb'):
+    """
+    Downsamples a loaded series returning (dates, values) ready to plot
+    """
+    x, y = downsampling.downsample_arrays(x, y, points, mode)
+    return downsampling.from_seconds(x), y
@@ -0,0 +1,198 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, m2m_changed
+from django.dispatch import receiver
+from IoT import models
+from IoT import access_index, hierarchy, plot_cache, rollups
+
+"""
+IoT model signal receivers
+====
+
+Keeps the token access index updated whenever the hierarchy
+of a project or the access keys of its objects change, bumps the
+hierarchy snapshots of changed projects, and invalidates cached
+plots when measurements are stored
+"""
+
+# Parent fields of every hierarchy model and the index field they map to
+HIERARCHY_PARENTS = {
+    models.Zones:('zone', ('project',)),
+    models.Node:('node', ('zone',)),
+    models.Sensors:('sensor', ('zone', 'node')),
+}
+
+
+@receiver(pre_save, sender=models.Zones)
+@receiver(pre_save, sender=models.Node)
+@receiver(pre_save, sender=models.Sensors)
+def track_parents(sender, instance, raw=False, **kwargs):
+    """
+    Detects updates that move an object to a different parent
+    """
+    instance._iot_moved = False
+    instance._iot_previous = {}
+    if raw or instance.pk is None:
+        return
+    field, parents = HIERARCHY_PARENTS[sender]
+    parent_fields = [p+'_id' for p in parents]
+    stored = sender.objects.filter(pk=instance.pk).values_list(*parent_fields).first()
+    instance._iot_moved = stored is not None and tuple(stored) != tuple(getattr(instance, f) for f in parent_fields)
+    if instance._iot_moved:
+        instance._iot_previous = dict(zip(parents, stored))
+
+
+@receiver(pre_save, sender=models.Sensors)
+def sensor_project(sender, instance, raw=False, **kwargs):
+    """
+    Copies the project of the zone into the sensor
+    """
+    if raw:
+        return
+    if sender._meta.get_field('zone').is_cached(instance):
+        instance.project_id = instance.zone.project_id
+    else:
+        instance.project_id = models.Zones.objects.filter(pk=instance.zone_id).values_list('project_id', flat=True).first()
+
+
+@receiver(post_save, sender=models.Zones)
+def zone_sensors_project(sender, instance, raw=False, **kwargs):
+    """
+    Moves the sensors and measurements of a zone moved to a different project
+    """
+    if not raw and getattr(instance, '_iot_moved', False):
+        models.Sensors.objects.filter(zone=instance).update(project_id=instance.project_id)
+        models.Measurement.objects.filter(zone=instance).update(project_id=instance.project_id)
+
+
+@receiver(post_save, sender=models.Sensors)
+def sensor_measurements_location(sender, instance, raw=False, **kwargs):
+    """
+    Moves the measurements of a sensor moved to a different zone
+    """
+    previous = getattr(instance, '_iot_previous', {})
+    if not raw and previous.get('zone', instance.zone_id) != instance.zone_id:
+        models.Measurement.objects.filter(sensor=instance).update(
+            zone_id=instance.zone_id,
+            project_id=instance.project_id,
+        )
+
+
+@receiver(pre_save, sender=models.Measurement)
+def measurement_location(sender, instance, raw=False, **kwargs):
+    """
+    Copies the zone and project of the sensor into measurements saved one at a time
+    """
+    if raw:
+        return
+    if sender._meta.get_field('sensor').is_cached(instance):
+        instance.zone_id, instance.project_id = instance.sensor.zone_id, instance.sensor.project_id
+    else:
+        instance.zone_id, instance.project_id = models.Sensors.objects.filter(
+            pk=instance.sensor_id
+        ).values_list('zone_id', 'project_id').first() or (None, None)
+
+
+@receiver(post_save, sender=models.Zones)
+@receiver(post_save, sender=models.Node)
+@receiver(post_save, sender=models.Sensors)
+def index_hierarchy(sender, instance, created, raw=False, **kwargs):
+    """
+    Grants new objects to the tokens managing their parents and
+    recomputes the affected tokens when an object changes parents
+    """
+    if raw:
+        return
+    field, parents = HIERARCHY_PARENTS[sender]
+    parent_ids = {p:getattr(instance, p+'_id') for p in parents}
+    if created:
+        access_index.grant_to_holders(field, instance, **parent_ids)
+    elif getattr(instance, '_iot_moved', False):
+        tokens = access_index.holders_of(**{field:instance.pk}, **parent_ids)
+        access_index.rebuild_token_index(tokens)
+
+
+def index_access_keys(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    Extends the index of tokens added to an object and recomputes
+    the tokens removed from it
+    """
+    if action == 'pre_clear':
+        if reverse:
+            instance._iot_cleared_tokens = {instance.pk}
+        else:
+            instance._iot_cleared_tokens = set(instance.access_keys.values_list('id', flat=True))
+    elif action == 'post_add':
+        if reverse:
+            for obj in model.objects.filter(pk__in=pk_set or ()):
+                access_index.grant_subtree([instance.pk], obj)
+        else:
+            access_index.grant_subtree(pk_set or (), instance)
+    elif action == 'post_remove':
+        access_index.rebuild_token_index({instance.pk} if reverse else pk_set or ())
+    elif action == 'post_clear':
+        access_index.rebuild_token_index(getattr(instance, '_iot_cleared_tokens', ()))
+
+
+def affected_projects(objs):
+    """
+    Returns the hierarchy cache keys affected by changes of objs
+    """
+    keys = set()
+    for obj in objs:
+        previous = getattr(obj, '_iot_previous', {})
+        if isinstance(obj, models.Projects):
+            keys.add(obj.pk)
+        elif isinstance(obj, models.Zones):
+            keys.update((obj.project_id, previous.get('project'), hierarchy.DIRECTORY))
+        else:
+            for zone_id in (obj.zone_id, previous.get('zone')):
+                if zone_id is not None:
+                    keys.add(hierarchy.zone_project(zone_id))
+    keys.discard(None)
+    return keys
+
+
+@receiver(post_save, sender=models.Projects)
+@receiver(post_save, sender=models.Zones)
+@receiver(post_save, sender=models.Node)
+@receiver(post_save, sender=models.Sensors)
+@receiver(pre_delete, sender=models.Projects)
+@receiver(pre_delete, sender=models.Zones)
+@receiver(pre_delete, sender=models.Node)
+@receiver(pre_delete, sender=models.Sensors)
+def invalidate_hierarchy(sender, instance, **kwargs):
+    """
+    Bumps the snapshot version of the projects an object belongs (or belonged) to
+    """
+    hierarchy.bump_on_commit(*affected_projects([instance]))
+
+
+for model in (models.Projects, models.Zones, models.Node):
+    m2m_changed.connect(
+        index_access_keys,
+        sender=model.access_keys.through,
+        dispatch_uid='iot_access_keys_{}'.format(model.__name__),
+    )
+
+
+@receiver(post_save, sender=models.Measurement)
+def invalidate_plots(sender, instance, raw=False, **kwargs):
+    """
+    Measurements stored one at a time outside of IoT.api.ingest
+    """
+    if raw:
+        return
+    plot_cache.touch([instance.sensor_id])
+
+
+@receiver(post_save, sender=models.Measurement)
+def record_rollups(sender, instance, created, raw=False, **kwargs):
+    """
+    Adds measurements saved one at a time (e.g. MeasurementSerializer.create) to their rollups
+    ====
+
+    bulk_create sends no signals, IoT.api.ingest records its batches.
+    Edited measurements aren't updated in their rollups, see compact_rollups
+    """
+    if raw or not created:
+        return
+    rollups.record([instance])
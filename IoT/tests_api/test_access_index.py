@@ -0,0 +1,120 @@
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+from users.models import GeneralUser, CustomAccessTokens
+from IoT.access_index import rebuild_token_index
+import IoT.models as models
+import IoT.model_choices as choices
+
+class AccessIndexTestCase(TestCase):
+    """
+    Test the token access index follows the IoT hierarchy
+    """
+    client_api = APIClient()
+
+    def setUp(self):
+        # Create User
+        user = GeneralUser.objects.create_user(
+            username = 'TUAccessIndex',
+            password = "123Password",
+            email = 'test@test.com'
+        )
+        # Create project
+        self.project = models.Projects.objects.create(
+            user=user,
+            name='Test',
+            description='Test project',
+            snippet_title='Test Snippet',
+            snippet_image='image.png',
+        )
+        # Create and save project token
+        token = CustomAccessTokens(
+            user=user,
+            name="testToken"
+        )
+        self.project_token = token.uuid_token
+        token.save()
+        self.token = token
+        self.project.access_keys.add(token)
+        # Create and save node token
+        token = CustomAccessTokens(
+            user=user,
+            name="nodeToken"
+        )
+        self.node_token = token.uuid_token
+        token.save()
+        self.node_token_obj = token
+
+
+    def CreateTree(self, zones=2, nodes=2, sensors=3):
+        """
+        Create zones with nodes and sensors inside self.project
+        """
+        created = []
+        for z in range(zones):
+            zone = models.Zones.objects.create(project=self.project, name='Z{}'.format(z), description='')
+            for n in range(nodes):
+                node = models.Node.objects.create(zone=zone, name='N{}'.format(n), description='')
+                for s in range(sensors):
+                    created.append(models.Sensors.objects.create(
+                        zone=zone,
+                        node=node,
+                        sensor_type=choices.DHT22,
+                        ambiental=False
+                    ))
+        return created
+
+
+    def test_index_follows_hierarchy(self):
+        """
+        Test new objects, access keys and moved nodes update the index
+        """
+        sensors = self.CreateTree()
+        index = models.AccessIndex.objects.filter(token=self.token)
+        self.assertEqual(index.filter(sensor__isnull=False).count(), len(sensors))
+        self.assertEqual(index.filter(zone__isnull=False).count(), 2)
+        # Node tokens only manage their node sensors
+        node = sensors[0].node
+        node.access_keys.add(self.node_token_obj)
+        node_index = models.AccessIndex.objects.filter(token=self.node_token_obj)
+        self.assertEqual(set(node_index.exclude(sensor=None).values_list('sensor_id', flat=True)), {s.id for s in node.node_sensors.all()})
+        # Index must match a full rebuild
+        before = set(index.values_list('project_id', 'zone_id', 'node_id', 'sensor_id'))
+        rebuild_token_index([self.token.id])
+        self.assertEqual(before, set(index.values_list('project_id', 'zone_id', 'node_id', 'sensor_id')))
+        # Removing the key revokes the access
+        node.access_keys.remove(self.node_token_obj)
+        self.assertFalse(node_index.exists())
+        # Moving a zone to another project revokes its sensors
+        other = models.Projects.objects.create(
+            user=self.project.user,
+            name='Other',
+            description='Other project',
+            snippet_title='Test Snippet',
+            snippet_image='image.png',
+        )
+        zone = node.zone
+        zone.project = other
+        zone.save()
+        self.assertFalse(index.filter(sensor__zone=zone).exists())
+        self.assertEqual(index.filter(sensor__isnull=False).count(), len(sensors) // 2)
+
+
+    def test_permission_queries(self):
+        """
+        Test permission checks don't depend on the size of the project
+        """
+        url = lambda s: reverse('iot_api:iot_general_api-sensor', args=(s.id,))
+        header = {'HTTP_CA_TOKEN':self.project_token}
+        queries = []
+        for size in (1, 10):
+            sensors = self.CreateTree(zones=size, nodes=size)
+            # Warm up token resolution
+            self.client_api.get(url(sensors[0]), format="json", **header)
+            with CaptureQueriesContext(connection) as ctx:
+                get_response = self.client_api.get(url(sensors[-1]), format="json", **header)
+            self.assertEqual(get_response.status_code, 200)
+            queries.append(len(ctx.captured_queries))
+        self.assertEqual(queries[0], queries[1])
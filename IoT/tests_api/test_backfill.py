@@ -0,0 +1,111 @@
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+from users.models import GeneralUser, CustomAccessTokens
+import IoT.models as models
+import IoT.model_choices as choices
+import datetime
+import io
+import pytz
+import tempfile
+
+class BackfillTestCase(TestCase):
+    """
+    Test device timestamps and historical backfills
+    """
+    client_api = APIClient()
+
+    def setUp(self):
+        user = GeneralUser.objects.create_user(
+            username = 'TUBackfill',
+            password = "123Password",
+            email = 'test@test.com'
+        )
+        project = models.Projects.objects.create(
+            user=user,
+            name='Test',
+            description='Test project',
+            snippet_title='Test Snippet',
+            snippet_image='image.png',
+        )
+        token = CustomAccessTokens(user=user, name="testToken")
+        self.header = {'HTTP_CA_TOKEN':token.uuid_token}
+        token.save()
+        project.access_keys.add(token)
+        zone = models.Zones.objects.create(project=project, name='Test zone', description='')
+        self.sensor = models.Sensors.objects.create(zone=zone, sensor_type=choices.DHT22, ambiental=True)
+        # Sensor the token can't manage
+        other = models.Projects.objects.create(
+            user=user, name='Other', description='', snippet_title='', snippet_image=''
+        )
+        self.other_sensor = models.Sensors.objects.create(
+            zone=models.Zones.objects.create(project=other, name='Other zone', description=''),
+            sensor_type=choices.DHT22,
+            ambiental=True,
+        )
+
+
+    def test_device_timestamps(self):
+        """
+        Test measure stores device timestamps within the skew bounds
+        """
+        url = reverse('iot_api:iot_general_api-measure')
+        taken = datetime.datetime.now(pytz.utc).replace(microsecond=0) - datetime.timedelta(hours=2)
+        post_response = self.client_api.post(url, {
+            'sensors':[
+                {'id_sensor':self.sensor.id, 'measurement_type':choices.A_TEMPERATURE, 'value':1, 'timestamp':taken.isoformat()},
+                {'id_sensor':self.sensor.id, 'measurement_type':choices.A_TEMPERATURE, 'value':2, 'timestamp':taken.timestamp() - 60},
+                {'id_sensor':self.sensor.id, 'measurement_type':choices.A_TEMPERATURE, 'value':3, 'timestamp':'2001-01-01'},
+                {'id_sensor':self.sensor.id, 'measurement_type':choices.A_TEMPERATURE, 'value':4, 'timestamp':taken.timestamp() + 86400},
+                {'id_sensor':self.sensor.id, 'measurement_type':choices.A_TEMPERATURE, 'value':5},
+            ]
+        }, format='json', **self.header)
+        self.assertEqual(post_response.status_code, 207)
+        self.assertEqual([e['index'] for e in post_response.data['errors']], [2, 3])
+        self.assertIn('timestamp', post_response.data['errors'][0]['errors'])
+        self.assertEqual(len(post_response.data['measurements']), 3)
+        stored = {int(m.value):m.created_at for m in models.Measurement.objects.all()}
+        self.assertEqual(stored[1], taken)
+        self.assertEqual(stored[2], taken - datetime.timedelta(minutes=1))
+        self.assertGreater(stored[5], taken)
+
+
+    def test_backfill_endpoint(self):
+        """
+        Test historical series are stored and aggregated
+        """
+        url = reverse('iot_api:iot_general_api-backfill')
+        start = datetime.datetime(2019, 1, 1, tzinfo=pytz.utc)
+        points = [[(start + datetime.timedelta(hours=h)).isoformat(), h] for h in range(48)]
+        post_response = self.client_api.post(url, {
+            'series':[
+                {'id_sensor':self.sensor.id, 'measurement_type':choices.A_TEMPERATURE, 'points':points[::-1] + [['yesterday', 1]]},
+                {'id_sensor':self.other_sensor.id, 'measurement_type':choices.A_TEMPERATURE, 'points':points},
+            ]
+        }, format='json', **self.header)
+        self.assertEqual(post_response.status_code, 207)
+        self.assertEqual(post_response.data['stored'], 48)
+        self.assertEqual([(e['index'], e['point']) for e in post_response.data['errors']], [(0, 48), (1, None)])
+        days = models.MeasurementRollup.objects.filter(sensor=self.sensor, granularity=choices.DAY).order_by('bucket')
+        self.assertEqual([(d.bucket, d.count, int(d.last_value)) for d in days], [
+            (start, 24, 23),
+            (start + datetime.timedelta(days=1), 24, 47),
+        ])
+
+
+    def test_backfill_command(self):
+        """
+        Test CSV files are loaded in chunks
+        """
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write('sensor,type,timestamp,value\n')
+            for minute in range(10):
+                f.write('{},{},{},{}\n'.format(self.sensor.id, choices.A_TEMPERATURE, 1546300800 + minute * 60, minute))
+            f.flush()
+            out = io.StringIO()
+            call_command('backfill_measurements', f.name, chunk_size=4, skip_header=True, stdout=out)
+        self.assertIn('10 measurements stored', out.getvalue())
+        hour = models.MeasurementRollup.objects.get(sensor=self.sensor, granularity=choices.HOUR)
+        self.assertEqual((hour.count, int(hour.max_value)), (10, 9))
+        self.assertEqual(models.Measurement.objects.earliest('created_at').created_at, datetime.datetime(2019, 1, 1, tzinfo=pytz.utc))
@@ -0,0 +1,111 @@
+from django.test import TestCase
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+from users.models import GeneralUser, CustomAccessTokens
+from IoT.api import parsers
+import IoT.models as models
+import IoT.model_choices as choices
+import datetime
+import decimal
+import pytz
+import unittest
+
+class BinaryIngestTestCase(TestCase):
+    """
+    Test binary measurement bodies
+    """
+    client_api = APIClient()
+
+    def setUp(self):
+        user = GeneralUser.objects.create_user(
+            username = 'TUBinary',
+            password = "123Password",
+            email = 'test@test.com'
+        )
+        project = models.Projects.objects.create(
+            user=user,
+            name='Test',
+            description='Test project',
+            snippet_title='Test Snippet',
+            snippet_image='image.png',
+        )
+        token = CustomAccessTokens(user=user, name="testToken")
+        self.header = {'HTTP_CA_TOKEN':token.uuid_token}
+        token.save()
+        project.access_keys.add(token)
+        zone = models.Zones.objects.create(project=project, name='Test zone', description='')
+        self.sensor = models.Sensors.objects.create(zone=zone, sensor_type=choices.DHT22, ambiental=True)
+        self.url = reverse('iot_api:iot_general_api-measure')
+
+
+    def test_frames(self):
+        """
+        Test fixed width frames are decoded and stored
+        """
+        taken = datetime.datetime.now(pytz.utc).replace(microsecond=0) - datetime.timedelta(minutes=5)
+        body = parsers.encode_frames([
+            (self.sensor.id, 1, 21.5, int(taken.timestamp() * 1000)),
+            (self.sensor.id, 2, -3.25, 0),
+            (self.sensor.id, 99, 1, 0),
+            (self.sensor.id, 1, 10 ** 7, 0),
+            (0, 1, 1, 0),
+        ], timestamps=True)
+        self.assertEqual(len(body), 4 + 5 * 17)
+        post_response = self.client_api.post(self.url, body, content_type=parsers.FRAME_MEDIA_TYPE, **self.header)
+        self.assertEqual(post_response.status_code, 207)
+        self.assertEqual([(e['index'], list(e['errors'])) for e in post_response.data['errors']], [
+            (2, ['measurement_type']), (3, ['value']), (4, ['id_sensor']),
+        ])
+        stored = models.Measurement.objects.order_by('id')
+        self.assertEqual([(m.measurement_type, m.value) for m in stored], [
+            (choices.A_TEMPERATURE, decimal.Decimal('21.5')),
+            (choices.R_HUMIDITY, decimal.Decimal('-3.25')),
+        ])
+        self.assertEqual(stored[0].created_at, taken)
+        # Timestamps datetime can't represent are rejected by row, even without a past bound
+        body = parsers.encode_frames([
+            (self.sensor.id, 1, 1, 2 ** 63 - 1),
+            (self.sensor.id, 1, 1, -2 ** 63),
+            (self.sensor.id, 1, 1, int(taken.timestamp() * 1000)),
+        ], timestamps=True)
+        with self.settings(IOT_TIMESTAMP_SKEW={'PAST':None}):
+            post_response = self.client_api.post(self.url, body, content_type=parsers.FRAME_MEDIA_TYPE, **self.header)
+        self.assertEqual(post_response.status_code, 207)
+        self.assertEqual([(e['index'], e['errors']['timestamp']) for e in post_response.data['errors']], [
+            (0, ['Timestamp out of range']), (1, ['Timestamp out of range']),
+        ])
+        # Truncated frames are rejected
+        post_response = self.client_api.post(self.url, body[:-1], content_type=parsers.FRAME_MEDIA_TYPE, **self.header)
+        self.assertEqual(post_response.status_code, 400)
+
+
+    @unittest.skipIf(parsers.msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        """
+        Test MessagePack bodies follow the JSON structure
+        """
+        body = parsers.msgpack.packb({'sensors':[
+            {'id_sensor':self.sensor.id, 'measurement_type':choices.A_TEMPERATURE, 'value':20},
+        ]})
+        post_response = self.client_api.post(self.url, body, content_type='application/msgpack', **self.header)
+        self.assertEqual(post_response.status_code, 201)
+        self.assertEqual(models.Measurement.objects.get().value, 20)
+        # Malformed bodies are parse errors
+        post_response = self.client_api.post(self.url, body[:-1], content_type='application/msgpack', **self.header)
+        self.assertEqual(post_response.status_code, 400)
+
+
+    @unittest.skipIf(parsers.cbor2 is None, 'cbor2 is not installed')
+    def test_cbor(self):
+        """
+        Test CBOR bodies follow the JSON structure
+        """
+        body = parsers.cbor2.dumps({'sensors':[
+            {'id_sensor':self.sensor.id, 'measurement_type':choices.R_HUMIDITY, 'value':40.25},
+        ]})
+        post_response = self.client_api.post(self.url, body, content_type='application/cbor', **self.header)
+        self.assertEqual(post_response.status_code, 201)
+        self.assertEqual(models.Measurement.objects.get().value, decimal.Decimal('40.25'))
+        # Malformed bodies are parse errors
+        post_response = self.client_api.post(self.url, body[:-1], content_type='application/cbor', **self.header)
+        self.assertEqual(post_response.status_code, 400)
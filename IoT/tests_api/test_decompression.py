@@ -0,0 +1,128 @@
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+from users.models import GeneralUser, CustomAccessTokens
+from IoT import middleware
+import IoT.models as models
+import IoT.model_choices as choices
+import gzip
+import io
+import json
+import unittest
+import zlib
+
+class RequestDecompressionTestCase(TestCase):
+    """
+    Test compressed request bodies
+    """
+    client_api = APIClient()
+
+    def setUp(self):
+        cache.clear()
+        user = GeneralUser.objects.create_user(
+            username = 'TUCompressed',
+            password = "123Password",
+            email = 'test@test.com'
+        )
+        self.project = models.Projects.objects.create(
+            user=user,
+            name='Test',
+            description='Test project',
+            snippet_title='Test Snippet',
+            snippet_image='image.png',
+        )
+        token = CustomAccessTokens(user=user, name="testToken")
+        self.header = {'HTTP_CA_TOKEN':token.uuid_token}
+        token.save()
+        self.project.access_keys.add(token)
+        zone = models.Zones.objects.create(project=self.project, name='Test zone', description='')
+        self.sensor = models.Sensors.objects.create(zone=zone, sensor_type=choices.DHT22, ambiental=True)
+
+
+    def post(self, url, body, encoding='gzip', content_type='application/json'):
+        return self.client_api.post(url, body, content_type=content_type, HTTP_CONTENT_ENCODING=encoding, **self.header)
+
+
+    def test_compressed_bodies(self):
+        """
+        Test gzip and deflate bodies on measure and bulk creation, and the ratio metrics
+        """
+        measurements = {'sensors':[
+            {'id_sensor':self.sensor.id, 'measurement_type':choices.A_TEMPERATURE, 'value':20 + i}
+            for i in range(50)
+        ]}
+        response = self.post(reverse('iot_api:iot_general_api-measure'), gzip.compress(json.dumps(measurements).encode()))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(models.Measurement.objects.filter(sensor=self.sensor).count(), 50)
+        zones = {'zones':[{'name':'Zone {}'.format(i), 'description':'Compressed'} for i in range(3)]}
+        response = self.post(
+            reverse('iot_api:iot_general_api-project-zones', args=(self.project.id,)),
+            zlib.compress(json.dumps(zones).encode()),
+            encoding='deflate',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(models.Zones.objects.filter(description='Compressed').count(), 3)
+        stats = middleware.stats()
+        self.assertEqual(stats['gzip']['requests'], 1)
+        self.assertEqual(stats['deflate']['requests'], 1)
+        self.assertGreater(stats['gzip']['ratio'], 1)
+        self.assertEqual(self.post(reverse('iot_api:iot_general_api-measure'), b'{}', encoding='br').status_code, 415)
+
+
+    def test_decompression_bomb(self):
+        """
+        Test bodies inflating past the guards are rejected while streamed
+        """
+        bomb = gzip.compress(b'\n' * (8 * 1024 * 1024))
+        response = self.post(reverse('iot_api:iot_general_api-measure-lines'), bomb, content_type='text/plain')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(middleware.stats()['gzip']['rejected'], 1)
+        stream = middleware.DecompressingStream(io.BytesIO(gzip.compress(b'1 2 3\n' * 100)), 'gzip', 300, 100)
+        self.assertEqual(stream.read(6), b'1 2 3\n')
+        with self.assertRaises(middleware.RequestDataTooBig):
+            stream.read()
+
+
+
+    def test_truncated_bodies(self):
+        """
+        Test truncated bodies and trailing data are rejected, gzip members are inflated
+        """
+        url = reverse('iot_api:iot_general_api-measure-lines')
+        lines = '{0} A_TEMPERATURE 21.5\n{0} A_TEMPERATURE 1234.75\n'.format(self.sensor.id).encode()
+        body = gzip.compress(lines)
+        response = self.post(url, body[:-5], content_type='text/plain')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(models.Measurement.objects.filter(sensor=self.sensor).exists())
+        response = self.post(url, body + b'trailing', content_type='text/plain')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(models.Measurement.objects.filter(sensor=self.sensor).exists())
+        response = self.post(url, body + gzip.compress(lines) + b'\0\0', content_type='text/plain')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(models.Measurement.objects.filter(sensor=self.sensor).count(), 4)
+        with self.assertRaises(middleware.SuspiciousOperation):
+            middleware.DecompressingStream(io.BytesIO(zlib.compress(lines) + body), 'deflate', 10**6, 100).read()
+
+
+    @unittest.skipIf(middleware.zstandard is None, 'zstandard is not installed')
+    def test_zstd_bodies(self):
+        """
+        Test zstd frames are inflated one after another, truncated bodies and trailing data are rejected
+        """
+        zstandard = middleware.zstandard
+        url = reverse('iot_api:iot_general_api-measure-lines')
+        lines = '{0} A_TEMPERATURE 21.5\n{0} A_TEMPERATURE 1234.75\n'.format(self.sensor.id).encode()
+        body = zstandard.ZstdCompressor().compress(lines)
+        for invalid in (body[:-3], body + b'trailing'):
+            response = self.post(url, invalid, encoding='zstd', content_type='text/plain')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(models.Measurement.objects.filter(sensor=self.sensor).exists())
+        response = self.post(url, body + body, encoding='zstd', content_type='text/plain')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(models.Measurement.objects.filter(sensor=self.sensor).count(), 4)
+        bomb = zstandard.ZstdCompressor().compress(b'\n' * (8 * 1024 * 1024))
+        stream = middleware.DecompressingStream(io.BytesIO(bomb), 'zstd', 10**9, 100)
+        with self.assertRaises(middleware.RequestDataTooBig):
+            stream.read()
+        self.assertLess(stream.size, 1024 * 1024)
@@ -0,0 +1,129 @@
+from django.test import TestCase
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+from users.models import GeneralUser, CustomAccessTokens
+from IoT import deletions, rollups
+import IoT.models as models
+import IoT.model_choices as choices
+
+class DeletionsTestCase(TestCase):
+    """
+    Test tombstoned deletions and their background purge
+    """
+    client_api = APIClient()
+
+    def setUp(self):
+        # Create User
+        self.user = GeneralUser.objects.create_user(
+            username = 'TUDeletions',
+            password = "123Password",
+            email = 'test@test.com'
+        )
+        project = models.Projects.objects.create(
+            user=self.user,
+            name='Test',
+            description='Test project',
+            snippet_title='Test Snippet',
+            snippet_image='image.png',
+        )
+        token = CustomAccessTokens(user=self.user, name="testToken")
+        self.header = {'HTTP_CA_TOKEN':token.uuid_token}
+        token.save()
+        project.access_keys.add(token)
+        self.zone = models.Zones.objects.create(project=project, name='Test zone', description='')
+        node = models.Node.objects.create(zone=self.zone, name='Test node', description='')
+        self.sensors = [
+            models.Sensors.objects.create(zone=self.zone, sensor_type=choices.DHT22, ambiental=True),
+            models.Sensors.objects.create(zone=self.zone, node=node, sensor_type=choices.DHT22, ambiental=False),
+        ]
+        measurements = models.Measurement.objects.bulk_create([
+            models.Measurement(sensor=s, zone=self.zone, project=project, measurement_type=choices.A_TEMPERATURE, value=v)
+            for s in self.sensors for v in range(5)
+        ])
+        rollups.record(measurements)
+
+
+    def test_zone_deletion(self):
+        """
+        Test a deleted zone is hidden right away and purged by the worker
+        """
+        url_zone = reverse('iot_api:iot_general_api-zone', kwargs={'pk':self.zone.id})
+        delete_response = self.client_api.delete(url_zone, format='json', **self.header)
+        self.assertEqual(delete_response.status_code, 200)
+        job = delete_response.data['deletion']
+        self.assertEqual(job['status'], choices.PENDING)
+        # Hidden from reads and permissions
+        get_response = self.client_api.get(url_zone, format='json', **self.header)
+        self.assertNotEqual(get_response.status_code, 200)
+        url_sensor = reverse('iot_api:iot_general_api-sensor', kwargs={'pk':self.sensors[1].id})
+        self.assertNotEqual(self.client_api.get(url_sensor, format='json', **self.header).status_code, 200)
+        self.assertFalse(models.AccessIndex.objects.filter(zone=self.zone).exists())
+        self.assertEqual(models.Measurement.objects.count(), 10)
+        # Purge
+        self.assertEqual(deletions.run_pending(), 1)
+        url_deletion = reverse('iot_api:iot_general_api-deletion', kwargs={'pk':job['id']})
+        status_response = self.client_api.get(url_deletion, format='json', **self.header)
+        self.assertEqual(status_response.status_code, 200)
+        self.assertEqual(status_response.data['deletion']['status'], choices.DONE)
+        self.assertEqual(status_response.data['deletion']['deleted_rows'], 10 + 2 * len(rollups.granularities()))
+        self.assertEqual(models.Measurement.objects.count(), 0)
+        self.assertFalse(models.Zones.all_objects.filter(pk=self.zone.id).exists())
+        self.assertFalse(models.Sensors.all_objects.exists())
+        self.assertFalse(models.Node.all_objects.exists())
+
+
+    def test_unauthorized_zone_deletion(self):
+        """
+        Test zones can't be deleted through a project by tokens not managing them
+        """
+        user = GeneralUser.objects.create_user(
+            username = 'TUDeletionsOther',
+            password = "123Password",
+            email = 'other@test.com'
+        )
+        project = models.Projects.objects.create(
+            user=user,
+            name='Other',
+            description='Other project',
+            snippet_title='Test Snippet',
+            snippet_image='image.png',
+        )
+        token = CustomAccessTokens(user=user, name="otherToken")
+        header = {'HTTP_CA_TOKEN':token.uuid_token}
+        token.save()
+        project.access_keys.add(token)
+        own_zone = models.Zones.objects.create(project=project, name='Other zone', description='')
+        url_project_zones = reverse('iot_api:iot_general_api-project-zones', kwargs={'pk':project.id})
+        delete_response = self.client_api.delete(url_project_zones, {
+            'zones':[{'id_zone':own_zone.id}, {'id_zone':self.zone.id}],
+        }, format='json', **header)
+        self.assertNotEqual(delete_response.status_code, 200)
+        self.assertFalse(models.DeletionJob.objects.exists())
+        self.assertEqual(models.Zones.objects.filter(pk__in=(own_zone.id, self.zone.id)).count(), 2)
+        self.assertEqual(models.Measurement.objects.count(), 10)
+        # Zones the token manages are still deleted
+        delete_response = self.client_api.delete(url_project_zones, {
+            'zones':[{'id_zone':own_zone.id}],
+        }, format='json', **header)
+        self.assertEqual(delete_response.status_code, 200)
+        self.assertFalse(models.Zones.objects.filter(pk=own_zone.id).exists())
+
+
+    def test_sensor_deletion(self):
+        """
+        Test deleting a sensor only purges its own measurements
+        """
+        url_sensor = reverse('iot_api:iot_general_api-sensor', kwargs={'pk':self.sensors[0].id})
+        delete_response = self.client_api.delete(url_sensor, format='json', **self.header)
+        self.assertEqual(delete_response.status_code, 200)
+        self.assertEqual(self.zone.zone_ambiental_sensors.count(), 1)
+        deletions.run_pending()
+        self.assertEqual(set(models.Measurement.objects.values_list('sensor_id', flat=True)), {self.sensors[1].id})
+        # Jobs are only visible to their user
+        other = GeneralUser.objects.create_user(username='TUOther', password="123Password", email='other@test.com')
+        token = CustomAccessTokens(user=other, name="otherToken")
+        header = {'HTTP_CA_TOKEN':token.uuid_token}
+        token.save()
+        url_deletion = reverse('iot_api:iot_general_api-deletion', kwargs={'pk':delete_response.data['deletion']['id']})
+        status_response = self.client_api.get(url_deletion, format='json', **header)
+        self.assertEqual(status_response.status_code, 404)
@@ -0,0 +1,58 @@
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from users.models import GeneralUser, CustomAccessTokens
+import IoT.models as models
+import IoT.model_choices as choices
+
+class DeviceRoutesTestCase(TestCase):
+    """
+    Test the lean device ingestion routes
+    """
+    client_api = APIClient()
+
+    def setUp(self):
+        user = GeneralUser.objects.create_user(
+            username = 'TUDevice',
+            password = "123Password",
+            email = 'test@test.com'
+        )
+        project = models.Projects.objects.create(
+            user=user,
+            name='Test',
+            description='Test project',
+            snippet_title='Test Snippet',
+            snippet_image='image.png',
+        )
+        token = CustomAccessTokens(user=user, name="testToken")
+        self.header = {'HTTP_CA_TOKEN':token.uuid_token}
+        token.save()
+        project.access_keys.add(token)
+        zone = models.Zones.objects.create(project=project, name='Test zone', description='')
+        self.sensor = models.Sensors.objects.create(zone=zone, sensor_type=choices.DHT22, ambiental=True)
+
+
+    def test_lean_measure(self):
+        """
+        Test measurements are stored skipping the rest of the middleware and the Accept negotiation
+        """
+        data = {'sensors':[{'id_sensor':self.sensor.id, 'measurement_type':choices.A_TEMPERATURE, 'value':21.5}]}
+        response = self.client_api.post(reverse('iot_ingest_measure'), data, format='json', HTTP_ACCEPT='text/html', **self.header)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        # XFrameOptionsMiddleware didn't run
+        self.assertFalse(response.has_header('X-Frame-Options'))
+        self.assertEqual(models.Measurement.objects.filter(sensor=self.sensor).count(), 1)
+        response = self.client_api.post(reverse('iot_ingest_measure'), data, format='json')
+        self.assertIn(response.status_code, (401, 403))
+
+
+    def test_lean_measure_lines(self):
+        """
+        Test line protocol bodies on the lean route
+        """
+        body = '{0} A_TEMPERATURE 20\n{0} 2 40.5\nbad line\n'.format(self.sensor.id)
+        response = self.client_api.post(reverse('iot_ingest_measure_lines'), body.encode(), content_type='text/plain', **self.header)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['stored'], 2)
+        self.assertEqual(response.data['errors'][0]['index'], 3)
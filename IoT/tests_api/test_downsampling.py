@@ -0,0 +1,136 @@
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+from users.models import GeneralUser, CustomAccessTokens
+from IoT import downsampling, series
+import IoT.api.serializers as serializers
+import IoT.models as models
+import IoT.model_choices as choices
+import datetime
+import numpy as np
+import pytz
+
+class DownsamplingTestCase(TestCase):
+    """
+    Test series downsampling engine and its API
+    """
+    client_api = APIClient()
+
+    def setUp(self):
+        # Create User
+        user = GeneralUser.objects.create_user(
+            username = 'TUDownsampling',
+            password = "123Password",
+            email = 'test@test.com'
+        )
+        project = models.Projects.objects.create(
+            user=user,
+            name='Test',
+            description='Test project',
+            snippet_title='Test Snippet',
+            snippet_image='image.png',
+        )
+        token = CustomAccessTokens(
+            user=user,
+            name="testToken"
+        )
+        self.token = token.uuid_token
+        token.save()
+        project.access_keys.add(token)
+        zone = models.Zones.objects.create(project=project, name='Test zone', description='')
+        self.sensor = models.Sensors.objects.create(zone=zone, sensor_type=choices.DHT22, ambiental=True)
+        self.dates = [datetime.datetime(2020, 1, 1, tzinfo=pytz.utc) + datetime.timedelta(minutes=x) for x in range(500)]
+        self.values = [round(float(np.sin(x / 20.0) * 50), 2) for x in range(500)]
+        # Spike that must survive lttb and minmax
+        self.values[250] = 99.0
+
+
+    def test_modes(self):
+        """
+        Test every mode bounds the amount of points
+        """
+        dates, values, indices = downsampling.downsample(self.dates, self.values, 50, 'lttb')
+        self.assertEqual(len(dates), 50)
+        self.assertEqual(indices[0], 0)
+        self.assertEqual(indices[-1], 499)
+        self.assertIn(250, indices)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        dates, values, indices = downsampling.downsample(self.dates, self.values, 50, 'minmax')
+        self.assertTrue(len(dates) <= 50)
+        self.assertEqual(max(values), 99.0)
+        self.assertEqual(min(values), min(self.values))
+        dates, values, indices = downsampling.downsample(self.dates, self.values, 50, 'avg')
+        self.assertEqual(indices, None)
+        self.assertEqual(len(values), 50)
+        self.assertAlmostEqual(float(np.mean(values)), float(np.mean(self.values)), places=6)
+        # Short series are returned as they are
+        dates, values, indices = downsampling.downsample(self.dates[:10], self.values[:10], 50)
+        self.assertEqual(values, self.values[:10])
+        with self.assertRaises(ValueError):
+            downsampling.downsample(self.dates, self.values, 50, 'median')
+
+
+    def test_api_points(self):
+        """
+        Test sensor_measurements downsampling per measurement type
+        """
+        for m_type in (choices.A_TEMPERATURE, choices.R_HUMIDITY):
+            models.Measurement.objects.bulk_create([
+                models.Measurement(sensor=self.sensor, value=value, measurement_type=m_type) for value in self.values
+            ])
+        # Spread creation dates
+        for m, date in zip(models.Measurement.objects.filter(sensor=self.sensor).order_by('id'), self.dates * 2):
+            models.Measurement.objects.filter(pk=m.pk).update(created_at=date)
+        url = reverse('iot_api:iot_general_api-sensor-measurements', args=(self.sensor.id,))
+        header = {'HTTP_CA_TOKEN':self.token}
+        get_response = self.client_api.get(url, {'points':40}, format='json', **header)
+        self.assertEqual(get_response.status_code, 200)
+        measurements = get_response.data['measurements']
+        self.assertEqual(len(measurements), 80)
+        self.assertEqual(len([m for m in measurements if m['measurement_type'] == choices.R_HUMIDITY]), 40)
+        # Kept points match their stored measurements
+        stored = serializers.MeasurementSerializer(
+            models.Measurement.objects.filter(pk__in=[m['id'] for m in measurements]), many=True
+        ).data
+        stored = {m['id']:dict(m) for m in stored}
+        self.assertEqual([dict(m) for m in measurements], [stored[m['id']] for m in measurements])
+        get_response = self.client_api.get(url, {'points':40, 'mode':'avg', 'type':choices.R_HUMIDITY}, format='json', **header)
+        self.assertEqual(len(get_response.data['measurements']), 40)
+        self.assertEqual(get_response.data['measurements'][0]['id'], None)
+        get_response = self.client_api.get(url, {'points':40, 'mode':'median'}, format='json', **header)
+        self.assertEqual(get_response.status_code, 400)
+        # Values every mode would answer with the whole range
+        for params in ({'points':0}, {'points':-5}, {'points':2}, {'points':1, 'mode':'minmax'}, {'points':0, 'mode':'avg'}, {'points':'ten'}):
+            get_response = self.client_api.get(url, params, format='json', **header)
+            self.assertEqual(get_response.status_code, 400)
+            self.assertEqual(get_response.data['status'], 'Invalid parameters')
+
+
+    def test_series_loader(self):
+        """
+        Test zone series are loaded with one query and split per sensor
+        """
+        sensors = [self.sensor] + [
+            models.Sensors.objects.create(zone=self.sensor.zone, sensor_type=choices.DHT11, ambiental=True) for _ in range(2)
+        ]
+        for i, date in enumerate(self.dates[:90]):
+            models.Measurement.objects.create(
+                sensor=sensors[i % 3], value=i, measurement_type=choices.A_TEMPERATURE
+            )
+        # Reverse creation dates so the loader must sort them
+        for i, m in enumerate(models.Measurement.objects.order_by('id')):
+            models.Measurement.objects.filter(pk=m.pk).update(created_at=self.dates[89 - i])
+        with CaptureQueriesContext(connection) as ctx:
+            loaded = series.load(models.Measurement.objects.filter(zone=self.sensor.zone), 'sensor_id')
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(set(loaded), {s.id for s in sensors})
+        x, y = loaded[sensors[1].id]
+        self.assertEqual(len(x), 30)
+        self.assertTrue(np.all(np.diff(x) > 0))
+        self.assertEqual(y[-1], 1.0)
+        url = reverse('sensor_mixed_graph', args=(self.sensor.zone.project_id, self.sensor.zone_id, choices.A_TEMPERATURE))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
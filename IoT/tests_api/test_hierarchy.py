@@ -0,0 +1,148 @@
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, IntegrityError, transaction
+from django.urls import reverse
+from users.models import GeneralUser, CustomAccessTokens
+from IoT import hierarchy
+from IoT.api import permissions
+import time
+import types
+from unittest import mock
+import IoT.models as models
+import IoT.model_choices as choices
+
+class HierarchyCacheTestCase(TestCase):
+    """
+    Test project hierarchy snapshots and their invalidation
+    """
+
+    def setUp(self):
+        # Create User
+        self.user = GeneralUser.objects.create_user(
+            username = 'TUHierarchy',
+            password = "123Password",
+            email = 'test@test.com'
+        )
+        self.projects = [
+            models.Projects.objects.create(
+                user=self.user,
+                name='Test{}'.format(x),
+                description='Test project',
+                snippet_title='Test Snippet',
+                snippet_image='image.png',
+            ) for x in range(2)
+        ]
+        self.token = CustomAccessTokens.objects.create(user=self.user, name="testToken")
+        self.zone = models.Zones.objects.create(project=self.projects[0], name='Test zone', description='')
+        self.node = models.Node.objects.create(zone=self.zone, name='Test node', description='')
+        self.sensor = models.Sensors.objects.create(zone=self.zone, node=self.node, sensor_type=choices.DHT22, ambiental=False)
+
+
+    def test_snapshot_invalidation(self):
+        """
+        Test snapshots are reused until the hierarchy changes
+        """
+        project_id = self.projects[0].id
+        snapshot = hierarchy.project(project_id)
+        self.assertEqual(set(snapshot.sensors), {self.sensor.id})
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertIs(hierarchy.project(project_id), snapshot)
+            self.assertEqual(hierarchy.zone_project(self.zone.id), project_id)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        # New sensors
+        ambiental = models.Sensors.objects.create(zone=self.zone, sensor_type=choices.DHT11, ambiental=True)
+        self.assertEqual(hierarchy.project(project_id).ambiental(self.zone.id), [ambiental.id])
+        # Moving a zone changes both projects
+        self.zone.project = self.projects[1]
+        self.zone.save()
+        self.assertEqual(hierarchy.project(project_id).sensors, {})
+        self.assertEqual(set(hierarchy.project(self.projects[1].id).sensors), {self.sensor.id, ambiental.id})
+        self.assertEqual(hierarchy.zone_project(self.zone.id), self.projects[1].id)
+        # Deletions
+        self.node.delete()
+        self.assertEqual(set(hierarchy.project(self.projects[1].id).sensors), {ambiental.id})
+        self.assertEqual(hierarchy.project(0), None)
+
+
+    @override_settings(CACHES={
+        'default':{'BACKEND':'django.core.cache.backends.locmem.LocMemCache', 'LOCATION':'default'},
+        'worker_a':{'BACKEND':'django.core.cache.backends.locmem.LocMemCache', 'LOCATION':'worker_a'},
+        'worker_b':{'BACKEND':'django.core.cache.backends.locmem.LocMemCache', 'LOCATION':'worker_b'},
+    })
+    def test_revoked_token_other_worker(self):
+        """
+        Test a token revoked by a worker is denied by workers with their own cache
+        """
+        hierarchy.l1.clear()
+        request = types.SimpleNamespace(user=self.user, auth=self.token)
+        check = lambda: permissions.CanManageSensor().has_object_permission(request, None, self.sensor)
+        self.projects[0].access_keys.add(self.token)
+        with override_settings(IOT_HIERARCHY_CACHE={'CACHE_ALIAS':'worker_a'}):
+            self.assertIn(self.sensor.id, hierarchy.project(self.projects[0].id).sensors)
+            self.assertTrue(check())
+        with override_settings(IOT_HIERARCHY_CACHE={'CACHE_ALIAS':'worker_b'}):
+            self.projects[0].access_keys.remove(self.token)
+        with override_settings(IOT_HIERARCHY_CACHE={'CACHE_ALIAS':'worker_a'}):
+            # Snapshots of worker a aren't used to authorize
+            self.assertFalse(check())
+        hierarchy.l1.clear()
+
+
+    @override_settings(CACHES={
+        'default':{'BACKEND':'django.core.cache.backends.locmem.LocMemCache', 'LOCATION':'default'},
+        'worker_a':{'BACKEND':'django.core.cache.backends.locmem.LocMemCache', 'LOCATION':'worker_a'},
+        'worker_b':{'BACKEND':'django.core.cache.backends.locmem.LocMemCache', 'LOCATION':'worker_b'},
+    })
+    def test_snapshot_max_age(self):
+        """
+        Test workers with their own cache refresh outdated snapshots after MAX_AGE seconds
+        """
+        hierarchy.l1.clear()
+        project_id = self.projects[0].id
+        worker_a = {'CACHE_ALIAS':'worker_a', 'MAX_AGE':60}
+        with override_settings(IOT_HIERARCHY_CACHE=worker_a):
+            self.assertEqual(hierarchy.project(project_id).ambiental(self.zone.id), [])
+        with override_settings(IOT_HIERARCHY_CACHE={'CACHE_ALIAS':'worker_b', 'MAX_AGE':60}):
+            ambiental = models.Sensors.objects.create(zone=self.zone, sensor_type=choices.DHT11, ambiental=True)
+        with override_settings(IOT_HIERARCHY_CACHE=worker_a):
+            self.assertEqual(hierarchy.project(project_id).ambiental(self.zone.id), [])
+            later_time, later_monotonic = time.time() + 61, time.monotonic() + 61
+            with mock.patch('time.time', return_value=later_time), mock.patch('time.monotonic', return_value=later_monotonic):
+                self.assertEqual(hierarchy.project(project_id).ambiental(self.zone.id), [ambiental.id])
+        hierarchy.l1.clear()
+
+
+    def test_sensors_without_signals(self):
+        """
+        Test sensors written without signals can't lose their project
+        """
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            models.Sensors.objects.bulk_create([models.Sensors(zone=self.zone, sensor_type=choices.DHT22, ambiental=True)])
+        models.Sensors.objects.bulk_create([models.Sensors(zone=self.zone, project=self.projects[0], sensor_type=choices.DHT22, ambiental=True)])
+        self.assertEqual(len(hierarchy.project(self.projects[0].id).sensors), 2)
+        # Queryset updates leave project_id behind, snapshots follow the zone
+        zone = models.Zones.objects.create(project=self.projects[1], name='Other zone', description='')
+        models.Sensors.objects.filter(pk=self.sensor.pk).update(zone=zone, node=None)
+        hierarchy.bump(self.projects[0].id, self.projects[1].id)
+        self.assertIn(self.sensor.id, hierarchy.project(self.projects[1].id).sensors)
+        self.assertNotIn(self.sensor.id, hierarchy.project(self.projects[0].id).sensors)
+
+
+    def test_sensor_project(self):
+        """
+        Test sensors follow the project of their zone
+        """
+        self.assertEqual(self.sensor.project_id, self.projects[0].id)
+        self.zone.project = self.projects[1]
+        self.zone.save()
+        self.sensor.refresh_from_db()
+        self.assertEqual(self.sensor.project_id, self.projects[1].id)
+        zone = models.Zones.objects.create(project=self.projects[0], name='Other zone', description='')
+        self.sensor.zone_id = zone.id
+        self.sensor.save()
+        self.assertEqual(models.Sensors.objects.get(pk=self.sensor.id).project_id, self.projects[0].id)
+        # Plots validate the project without loading the hierarchy
+        url = reverse('sensor_graph', args=(self.projects[1].id, self.sensor.id))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        url = reverse('sensor_graph', args=(0, self.sensor.id))
+        self.assertEqual(self.client.get(url).status_code, 404)
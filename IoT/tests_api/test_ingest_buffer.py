@@ -0,0 +1,105 @@
+from django.test import TestCase
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+from unittest import mock
+from users.models import GeneralUser, CustomAccessTokens
+from IoT.api import buffer
+import IoT.api.ingest as ingest
+import IoT.models as models
+import IoT.model_choices as choices
+import glob
+import os
+import tempfile
+
+class IngestBufferTestCase(TestCase):
+    """
+    Test the write-ahead ingest buffer
+    """
+
+    def setUp(self):
+        user = GeneralUser.objects.create_user(
+            username = 'TUBuffer',
+            password = "123Password",
+            email = 'test@test.com'
+        )
+        project = models.Projects.objects.create(
+            user=user,
+            name='Test',
+            description='Test project',
+            snippet_title='Test Snippet',
+            snippet_image='image.png',
+        )
+        token = CustomAccessTokens(user=user, name="testToken")
+        self.header = {'HTTP_CA_TOKEN':token.uuid_token}
+        token.save()
+        project.access_keys.add(token)
+        zone = models.Zones.objects.create(project=project, name='Test zone', description='')
+        self.sensor = models.Sensors.objects.create(zone=zone, sensor_type=choices.DHT22, ambiental=True)
+        self.directory = tempfile.TemporaryDirectory()
+        self.prefix = os.path.join(self.directory.name, 'ingest.wal')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def readings(self, *values):
+        return ingest.build_measurements(
+            [ingest.Reading(i, self.sensor.id, choices.A_TEMPERATURE, v) for i, v in enumerate(values)],
+            {self.sensor.id:self.sensor},
+        )
+
+
+    def test_group_commit(self):
+        """
+        Test accepted readings are logged and stored together on flush
+        """
+        ingest_buffer = buffer.IngestBuffer({'PATH':self.prefix, 'DURABILITY':buffer.FSYNC, 'MAX_ROWS':4})
+        accepted = self.readings(1, 2) + self.readings(3)
+        ingest_buffer.add(accepted[:2])
+        ingest_buffer.add(accepted[2:])
+        self.assertEqual(models.Measurement.objects.count(), 0)
+        self.assertEqual(len(glob.glob(self.prefix + '.*')), 1)
+        with self.assertRaises(buffer.BufferFull):
+            ingest_buffer.add(self.readings(4, 5))
+        self.assertEqual(ingest_buffer.flush(), 3)
+        stored = models.Measurement.objects.order_by('id')
+        self.assertEqual([int(m.value) for m in stored], [1, 2, 3])
+        # Readings keep the time they were accepted
+        self.assertEqual(stored[0].created_at, accepted[0].created_at)
+        self.assertEqual(stored[0].zone_id, self.sensor.zone_id)
+        self.assertEqual(models.MeasurementRollup.objects.filter(granularity=choices.DAY).get().count, 3)
+        self.assertEqual(glob.glob(self.prefix + '.*'), [])
+
+
+    def test_replay(self):
+        """
+        Test readings left in the log by a crash are replayed
+        """
+        ingest_buffer = buffer.IngestBuffer({'PATH':self.prefix, 'DURABILITY':buffer.WRITE})
+        ingest_buffer.add(self.readings(1, 2))
+        # Simulate a crash within the last record
+        with open(glob.glob(self.prefix + '.*')[0], 'a') as f:
+            f.write('[[1, ')
+        self.assertEqual(buffer.replay(self.prefix), 2)
+        self.assertEqual(models.Measurement.objects.count(), 2)
+        self.assertEqual(glob.glob(self.prefix + '.*'), [])
+
+
+    def test_buffered_measure(self):
+        """
+        Test the measure endpoint hands authorized readings to the buffer
+        """
+        ingest_buffer = buffer.IngestBuffer({'DURABILITY':buffer.MEMORY})
+        url = reverse('iot_api:iot_general_api-measure')
+        with mock.patch('IoT.api.buffer.active', return_value=ingest_buffer):
+            post_response = APIClient().post(url, {
+                'sensors':[
+                    {'id_sensor':self.sensor.id, 'measurement_type':choices.A_TEMPERATURE, 'value':10},
+                    {'id_sensor':0, 'measurement_type':choices.A_TEMPERATURE, 'value':10},
+                ]
+            }, format='json', **self.header)
+        self.assertEqual(post_response.status_code, 207)
+        self.assertEqual(post_response.data['accepted'], 1)
+        self.assertEqual(post_response.data['errors'][0]['index'], 1)
+        self.assertEqual(models.Measurement.objects.count(), 0)
+        self.assertEqual(ingest_buffer.flush(), 1)
+        self.assertEqual(models.Measurement.objects.get().sensor_id, self.sensor.id)
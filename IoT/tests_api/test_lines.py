@@ -0,0 +1,100 @@
+from django.test import TestCase
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+from unittest import mock
+from users.models import GeneralUser, CustomAccessTokens
+from IoT.api import lines
+import IoT.models as models
+import IoT.model_choices as choices
+import decimal
+import gzip
+import io
+
+class LineProtocolTestCase(TestCase):
+    """
+    Test line protocol ingestion
+    """
+    client_api = APIClient()
+
+    def setUp(self):
+        user = GeneralUser.objects.create_user(
+            username = 'TULines',
+            password = "123Password",
+            email = 'test@test.com'
+        )
+        project = models.Projects.objects.create(
+            user=user,
+            name='Test',
+            description='Test project',
+            snippet_title='Test Snippet',
+            snippet_image='image.png',
+        )
+        token = CustomAccessTokens(user=user, name="testToken")
+        self.header = {'HTTP_CA_TOKEN':token.uuid_token}
+        token.save()
+        project.access_keys.add(token)
+        zone = models.Zones.objects.create(project=project, name='Test zone', description='')
+        self.sensor = models.Sensors.objects.create(zone=zone, sensor_type=choices.DHT22, ambiental=True)
+
+
+    def test_tokenize(self):
+        """
+        Test lines split across reads and oversized lines
+        """
+        body = b'1 2 3\n' + b'x' * 50 + b'\n\n4 5 6'
+        tokens = list(lines.tokenize(io.BytesIO(body), read_size=4, max_line=20))
+        self.assertEqual(tokens, [(1, b'1 2 3'), (2, None), (3, b''), (4, b'4 5 6')])
+
+
+    def test_measure_lines(self):
+        """
+        Test a text body is stored in chunks and bad lines are reported
+        """
+        url = reverse('iot_api:iot_general_api-measure-lines')
+        body = '\n'.join(
+            ['# gateway log', '']
+            + ['{} A_TEMPERATURE {}'.format(self.sensor.id, v) for v in range(10)]
+            + ['{} 2 40.25'.format(self.sensor.id), '{} 2 1.234'.format(self.sensor.id), 'abc 1 1', '0 1 1']
+        )
+        with mock.patch.object(lines, 'LINES_CHUNK_SIZE', 4):
+            post_response = self.client_api.post(url, body.encode(), content_type='text/plain', **self.header)
+        self.assertEqual(post_response.status_code, 207)
+        self.assertEqual(post_response.data['stored'], 11)
+        self.assertEqual(post_response.data['rejected'], 3)
+        self.assertEqual([(e['index'], list(e['errors'])) for e in post_response.data['errors']], [
+            (14, ['value']), (15, ['id_sensor']), (16, ['id_sensor']),
+        ])
+        self.assertEqual(
+            models.Measurement.objects.get(measurement_type=choices.R_HUMIDITY).value,
+            decimal.Decimal('40.25')
+        )
+        self.assertEqual(models.MeasurementRollup.objects.get(granularity=choices.DAY, measurement_type=choices.A_TEMPERATURE).count, 10)
+
+
+    def test_chunked_lines(self):
+        """
+        Test bodies without Content-Length are read from the stream
+        """
+        url = reverse('iot_api:iot_general_api-measure-lines')
+        body = '\n'.join('{} A_TEMPERATURE {}'.format(self.sensor.id, v) for v in range(5)).encode()
+        chunked = {'CONTENT_LENGTH':'', 'HTTP_TRANSFER_ENCODING':'chunked'}
+        post_response = self.client_api.post(url, body, content_type='text/plain', **dict(
+            chunked, **{'wsgi.input':io.BytesIO(body)}, **self.header
+        ))
+        self.assertEqual(post_response.status_code, 201)
+        self.assertEqual(post_response.data['stored'], 5)
+        # Compressed chunked body
+        post_response = self.client_api.post(url, body, content_type='text/plain', **dict(
+            chunked, HTTP_CONTENT_ENCODING='gzip', **{'wsgi.input':io.BytesIO(gzip.compress(body))}, **self.header
+        ))
+        self.assertEqual(post_response.status_code, 201)
+        self.assertEqual(models.Measurement.objects.count(), 10)
+        # Empty chunked and regular bodies
+        post_response = self.client_api.post(url, b'', content_type='text/plain', **dict(
+            chunked, **{'wsgi.input':io.BytesIO(b'')}, **self.header
+        ))
+        self.assertEqual(post_response.status_code, 400)
+        self.assertEqual(post_response.data['status'], 'Empty body')
+        post_response = self.client_api.post(url, b'', content_type='text/plain', **self.header)
+        self.assertEqual(post_response.status_code, 400)
+        self.assertEqual(post_response.data['status'], 'Empty body')
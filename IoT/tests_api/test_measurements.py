@@ -1,4 +1,6 @@
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient
 from users.models import GeneralUser, CustomAccessTokens
@@ -130,7 +132,11 @@ class MeasurementManagemenetTestCase(TestCase):
                 **header
             )
             self.assertEqual(get_response.status_code, 200) # Gotten correctly
-            self.assertEqual(ms, get_response.data['measurements'])
+            stored = get_response.data['measurements']
+            if not connection.features.can_return_rows_from_bulk_insert:
+                # Ids aren't returned by bulk inserts on this backend
+                stored = [{k:v for k, v in row.items() if k != 'id'} for row in stored]
+            self.assertEqual(ms, stored)
 
         self.assertEqual(m_count+(len(sensors*nmp_sensor)), len(models.Measurement.objects.all()))
 
@@ -181,7 +187,11 @@ class MeasurementManagemenetTestCase(TestCase):
                 **header
             )
             self.assertEqual(get_response.status_code, 200) # Gotten correctly
-            self.assertEqual(ms, get_response.data['measurements'])
+            stored = get_response.data['measurements']
+            if not connection.features.can_return_rows_from_bulk_insert:
+                # Ids aren't returned by bulk inserts on this backend
+                stored = [{k:v for k, v in row.items() if k != 'id'} for row in stored]
+            self.assertEqual(ms, stored)
 
         self.assertEqual(m_count+(len(sensors*nmp_sensor)), len(models.Measurement.objects.all()))
 
@@ -326,4 +336,116 @@ class MeasurementManagemenetTestCase(TestCase):
             get_response.status_code == 400
         )
         self.assertEqual(m_count, len(models.Measurement.objects.all()))
-        
\ No newline at end of file
+        
+
+    def test_bulk_measurement_partial(self):
+        """
+        Test batches with invalid and unauthorized rows are reported per row
+        """
+        # Create sensors
+        zone_sensor = self.CreateSensors(n=1)[0]
+        node_sensor = self.CreateSensors(n=1, node=True)[0]
+        # Create header
+        header = {'HTTP_CA_TOKEN':self.node_token}
+        # Count measurements
+        m_count = len(models.Measurement.objects.all())
+        # Create url
+        sensor_url = reverse('iot_api:iot_general_api-measure')
+        m = {
+            'sensors':[
+                {'value':10, 'id_sensor':node_sensor.id, 'measurement_type':choices.A_TEMPERATURE},
+                {'value':10, 'id_sensor':node_sensor.id, 'measurement_type':'NOT_A_TYPE'},
+                {'value':10, 'id_sensor':zone_sensor.id, 'measurement_type':choices.A_TEMPERATURE},
+                {'value':11, 'id_sensor':node_sensor.id, 'measurement_type':choices.R_HUMIDITY},
+            ]
+        }
+        post_response = self.client_api.post(
+            sensor_url,
+            m,
+            format="json",
+            **header
+        )
+        self.assertEqual(post_response.status_code, 207) # Partially created
+        self.assertEqual(len(post_response.data['measurements']), 2)
+        self.assertEqual([e['index'] for e in post_response.data['errors']], [1, 2])
+        self.assertIn('measurement_type', post_response.data['errors'][0]['errors'])
+        self.assertIn('id_sensor', post_response.data['errors'][1]['errors'])
+        self.assertEqual(m_count + 2, len(models.Measurement.objects.all()))
+        # Ids are only returned when the backend reports them, they're never guessed
+        for measurement in post_response.data['measurements']:
+            if connection.features.can_return_rows_from_bulk_insert:
+                self.assertTrue(models.Measurement.objects.filter(pk=measurement['id'], sensor=node_sensor).exists())
+            else:
+                self.assertNotIn('id', measurement)
+
+
+    def test_bulk_measurement_queries(self):
+        """
+        Test the amount of queries of a batch only grows with its insert chunks
+        """
+        # Create sensors
+        sensors = self.CreateSensors(n=5)
+        # Create header
+        header = {'HTTP_CA_TOKEN':self.zone_token}
+        # Create url
+        sensor_url = reverse('iot_api:iot_general_api-measure')
+        queries = []
+        for nmp_sensor in (2, 200):
+            m = {
+                'sensors':[{
+                    'value':x % 100,
+                    'id_sensor':sensor.id,
+                    'measurement_type':choices.A_TEMPERATURE
+                } for x in range(nmp_sensor) for sensor in sensors]
+            }
+            with CaptureQueriesContext(connection) as ctx:
+                post_response = self.client_api.post(
+                    sensor_url,
+                    m,
+                    format="json",
+                    **header
+                )
+            self.assertEqual(post_response.status_code, 201) # Measurements created
+            self.assertEqual(len(post_response.data['measurements']), nmp_sensor * len(sensors))
+            queries.append(len(ctx.captured_queries))
+        # A thousand rows must take at least 50 times less queries than rows
+        self.assertLess(queries[1], 1000 / 50)
+        self.assertLess(queries[1] - queries[0], 10)
+
+
+    def test_measurement_location(self):
+        """
+        Test measurements carry the zone and project of their sensor
+        """
+        sensor = self.CreateSensors(n=1)[0]
+        header = {'HTTP_CA_TOKEN':self.zone_token}
+        post_response = self.client_api.post(
+            reverse('iot_api:iot_general_api-measure'),
+            {'sensors':[{'value':10, 'id_sensor':sensor.id, 'measurement_type':choices.A_TEMPERATURE}]},
+            format="json",
+            **header
+        )
+        self.assertEqual(post_response.status_code, 201)
+        # Single saves are located by the signals
+        models.Measurement.objects.create(sensor=sensor, value=11, measurement_type=choices.A_TEMPERATURE)
+        measurements = models.Measurement.objects.filter(zone=self.zone, project=self.zone.project_id)
+        self.assertEqual(measurements.count(), 2)
+        # Moving the zone moves its measurements
+        project = models.Projects.objects.create(
+            user=self.zone.project.user,
+            name='Other',
+            description='Other project',
+            snippet_title='Test Snippet',
+            snippet_image='image.png',
+        )
+        self.zone.project = project
+        self.zone.save()
+        self.assertEqual(models.Measurement.objects.filter(project=project).count(), 2)
+        # Moving the sensor moves its measurements
+        zone = models.Zones.objects.create(project=project, name='Other zone', description='')
+        sensor.zone = zone
+        sensor.save()
+        self.assertEqual(models.Measurement.objects.filter(zone=zone, project=project).count(), 2)
+        # Zone wide deletions only touch the measurements table
+        zone.zone_measurements.all().delete()
+        self.assertFalse(models.Measurement.objects.filter(sensor=sensor).exists())
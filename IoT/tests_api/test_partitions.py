@@ -0,0 +1,31 @@
+from django.core.management import call_command
+from django.test import TestCase
+from IoT import partitions
+import datetime
+import io
+import pytz
+
+class PartitionsTestCase(TestCase):
+    """
+    Test monthly chunks and partition definitions
+    """
+
+    def test_month_chunks(self):
+        """
+        Test ranges are split on month boundaries
+        """
+        start = datetime.datetime(2019, 11, 15, 12, tzinfo=pytz.utc)
+        end = datetime.datetime(2020, 2, 3, tzinfo=pytz.utc)
+        chunks = list(partitions.month_chunks(start, end))
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(chunks[0], (start, datetime.datetime(2019, 12, 1, tzinfo=pytz.utc)))
+        self.assertEqual(chunks[2][0], datetime.datetime(2020, 1, 1, tzinfo=pytz.utc))
+        self.assertEqual(chunks[-1][1], end)
+        clauses = partitions.partition_clauses(start, datetime.datetime(2020, 1, 1, tzinfo=pytz.utc))
+        self.assertEqual(clauses[0], "PARTITION p201911 VALUES LESS THAN (TO_DAYS('2019-12-01'))")
+        self.assertEqual(clauses[2], "PARTITION p202001 VALUES LESS THAN (TO_DAYS('2020-02-01'))")
+        self.assertEqual(clauses[-1], 'PARTITION pmax VALUES LESS THAN MAXVALUE')
+        # Other databases don't have native partitions
+        out = io.StringIO()
+        call_command('manage_partitions', stdout=out)
+        self.assertIn('only available on MySQL', out.getvalue())
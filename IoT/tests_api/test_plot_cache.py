@@ -0,0 +1,151 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from users.models import GeneralUser, CustomAccessTokens
+from unittest import mock
+import threading
+from IoT import checks, rendering, retention
+import IoT.models as models
+import IoT.model_choices as choices
+
+class PlotCacheTestCase(TestCase):
+    """
+    Test rendered plots are cached and invalidated by new measurements
+    """
+    client_api = APIClient()
+
+    def setUp(self):
+        # Create User
+        user = GeneralUser.objects.create_user(
+            username = 'TUPlotCache',
+            password = "123Password",
+            email = 'test@test.com'
+        )
+        self.project = models.Projects.objects.create(
+            user=user,
+            name='Test',
+            description='Test project',
+            snippet_title='Test Snippet',
+            snippet_image='image.png',
+        )
+        token = CustomAccessTokens(
+            user=user,
+            name="testToken"
+        )
+        self.token = token.uuid_token
+        token.save()
+        self.project.access_keys.add(token)
+        zone = models.Zones.objects.create(project=self.project, name='Test zone', description='')
+        self.sensor = models.Sensors.objects.create(zone=zone, sensor_type=choices.DHT22, ambiental=True)
+        self.measure({20, 21, 22})
+
+
+    def measure(self, values):
+        post_response = self.client_api.post(reverse('iot_api:iot_general_api-measure'), {
+            'sensors':[{
+                'value':v,
+                'id_sensor':self.sensor.id,
+                'measurement_type':choices.A_TEMPERATURE
+            } for v in values]
+        }, format='json', HTTP_CA_TOKEN=self.token)
+        self.assertEqual(post_response.status_code, 201)
+
+
+    def test_plot_cache(self):
+        """
+        Test repeated plots are cache hits or 304 until new measurements arrive
+        """
+        url = reverse('sensor_specific_graph', args=(self.project.id, self.sensor.id, choices.A_TEMPERATURE))
+        with mock.patch('IoT.rendering.draw', wraps=rendering.draw) as render:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/png')
+            etag = response['ETag']
+            # Cache hit
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(render.call_count, 1)
+            # Conditional request
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            # Other windows are cached independently
+            response = self.client.get(url, {'from':'2000-01-01'})
+            self.assertNotEqual(response['ETag'], etag)
+            self.assertEqual(render.call_count, 2)
+            # New measurements invalidate the plot
+            self.measure({30})
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+            self.assertEqual(render.call_count, 3)
+            response = self.client.get(url, {'from':'tomorrow'})
+            self.assertEqual(response.status_code, 400)
+
+
+    @override_settings(CACHES={
+        'default':{'BACKEND':'django.core.cache.backends.locmem.LocMemCache', 'LOCATION':'default'},
+        'worker_a':{'BACKEND':'django.core.cache.backends.locmem.LocMemCache', 'LOCATION':'worker_a'},
+        'worker_b':{'BACKEND':'django.core.cache.backends.locmem.LocMemCache', 'LOCATION':'worker_b'},
+    })
+    def test_versions_other_worker(self):
+        """
+        Test workers with their own cache see new and deleted measurements
+        """
+        url = reverse('sensor_specific_graph', args=(self.project.id, self.sensor.id, choices.A_TEMPERATURE))
+        with override_settings(IOT_PLOT_CACHE={'CACHE_ALIAS':'worker_a'}):
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with override_settings(IOT_PLOT_CACHE={'CACHE_ALIAS':'worker_b'}):
+            self.measure({30})
+        with override_settings(IOT_PLOT_CACHE={'CACHE_ALIAS':'worker_a'}):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+            # Retention and purges delete rows
+            retention.delete_in_batches(models.Measurement.objects.filter(sensor=self.sensor, value=30))
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+
+    def test_render_pool(self):
+        """
+        Test empty plots render and a saturated pool rejects renders
+        """
+        url = reverse('sensor_mixed_graph', args=(self.project.id, self.sensor.zone_id, choices.R_HUMIDITY))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        pool = rendering.RenderPool(workers=1, queue=0, timeout=5)
+        started, release = threading.Event(), threading.Event()
+
+        def blocked_draw(*args, **kwargs):
+            started.set()
+            release.wait(5)
+            return b''
+
+        with mock.patch('IoT.rendering.draw', blocked_draw):
+            worker = threading.Thread(target=pool.render, args=([],))
+            worker.start()
+            started.wait(5)
+            with self.assertRaises(rendering.RenderBusy):
+                pool.render([])
+            release.set()
+            worker.join()
+        self.assertTrue(pool.render([rendering.Panel('Test', [('a', [1, 2], [3, 4])])]).startswith(b'\x89PNG'))
+        pool.shutdown()
+
+
+    def test_shared_cache_check(self):
+        """
+        Test the deploy check warns about per process hierarchy caches
+        """
+        ids = lambda: [w.id for w in checks.shared_caches(None)]
+        with override_settings(CACHES={'default':{'BACKEND':'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual(ids(), ['IoT.W001'])
+        with override_settings(CACHES={
+            'default':{'BACKEND':'django.core.cache.backends.locmem.LocMemCache'},
+            'shared':{'BACKEND':'django.core.cache.backends.memcached.MemcachedCache', 'LOCATION':'127.0.0.1:11211'},
+        }, IOT_PLOT_CACHE={'CACHE_ALIAS':'shared'}, IOT_HIERARCHY_CACHE={'CACHE_ALIAS':'shared'}):
+            self.assertEqual(ids(), [])
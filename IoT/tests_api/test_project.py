@@ -1,4 +1,6 @@
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient
 from users.models import GeneralUser, CustomAccessTokens
@@ -264,4 +266,50 @@ class ProjectManagementTestCase(TestCase):
             get_response.status_code == 403 or 
             get_response.status_code == 401 or 
             get_response.status_code == 400
-        )
\ No newline at end of file
+        )
+
+    def test_projects_tree_queries(self):
+        """
+        Test project trees are serialized with a constant amount of queries
+        """
+        url = reverse('iot_api:iot_general_api-projects')
+        header = {'HTTP_CA_TOKEN':self.token}
+        # Warm up the token cache
+        self.client_api.get(url, format="json", **header)
+
+        def create_tree(name, size):
+            project = models.Projects.objects.create(
+                user=self.user,
+                name=name,
+                description='Test project',
+                snippet_title='Test Snippet',
+                snippet_image='image.png',
+            )
+            project.access_keys.add(self.token_obj)
+            for z in range(size):
+                zone = models.Zones.objects.create(project=project, name='Zone{}'.format(z), description='')
+                models.Sensors.objects.create(zone=zone, sensor_type=choices.DHT22, ambiental=True)
+                for n in range(size):
+                    node = models.Node.objects.create(zone=zone, name='Node{}'.format(n), description='')
+                    for s in range(size):
+                        models.Sensors.objects.create(zone=zone, node=node, sensor_type=choices.DHT11, ambiental=False)
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                get_response = self.client_api.get(url, format="json", **header)
+            self.assertEqual(get_response.status_code, 200)
+            return len(queries), get_response.data['projects']
+
+        create_tree('Small', 1)
+        small, projects = count_queries()
+        self.assertEqual(len(projects), 1)
+        create_tree('Large', 3)
+        large, projects = count_queries()
+        self.assertEqual(small, large)
+        self.assertEqual(len(projects), 2)
+        zones = projects[1]['zones']
+        self.assertEqual(len(zones), 3)
+        self.assertEqual(len(zones[0]['ambiental']), 1)
+        self.assertEqual(len(zones[0]['nodes'][0]['sensors']), 3)
+        self.assertEqual(zones[0]['id_project'], projects[1]['id'])
+        self.assertEqual(zones[0]['nodes'][0]['sensors'][0]['id_node'], zones[0]['nodes'][0]['id'])
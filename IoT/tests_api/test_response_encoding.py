@@ -0,0 +1,110 @@
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+from users.models import GeneralUser, CustomAccessTokens
+from IoT.api import renderers
+from IoT import loaders, middleware
+import IoT.api.serializers as serializers
+import IoT.models as models
+import IoT.model_choices as choices
+import datetime
+import decimal
+import gzip
+import json
+import pytz
+import zlib
+
+class ResponseEncodingTestCase(TestCase):
+    """
+    Test the JSON renderer and compressed responses
+    """
+    client_api = APIClient()
+
+    def setUp(self):
+        user = GeneralUser.objects.create_user(
+            username = 'TUEncoding',
+            password = "123Password",
+            email = 'test@test.com'
+        )
+        self.project = models.Projects.objects.create(
+            user=user,
+            name='Test   project',
+            description='Test project',
+            snippet_title='Test Snippet',
+            snippet_image='image.png',
+        )
+        token = CustomAccessTokens(user=user, name="testToken")
+        self.header = {'HTTP_CA_TOKEN':token.uuid_token}
+        token.save()
+        self.project.access_keys.add(token)
+        for z in range(5):
+            zone = models.Zones.objects.create(project=self.project, name='Zone {}'.format(z), description='Test zone')
+            node = models.Node.objects.create(zone=zone, name='Node {}'.format(z), description='Test node')
+            self.sensor = models.Sensors.objects.create(zone=zone, node=node, sensor_type=choices.DHT22, ambiental=False)
+
+
+    def test_fast_renderer(self):
+        """
+        Test the output matches DRF's JSONRenderer
+        """
+        data = {
+            'projects':serializers.NestedProjectsSerializer(
+                loaders.load_project_tree(models.Projects.objects.all()), many=True
+            ).data,
+            'value':decimal.Decimal('21.50'),
+            'created_at':datetime.datetime(2020, 1, 1, 12, 0, 0, 123456, tzinfo=pytz.utc),
+            1:None,
+        }
+        self.assertEqual(renderers.FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertIn(renderers.FastJSONRenderer, renderers.renderer_classes())
+
+
+    def test_compressed_responses(self):
+        """
+        Test responses are compressed with the negotiated encoding above MIN_SIZE
+        """
+        self.assertEqual(middleware.negotiate('gzip;q=0.5, zstd;q=0.8, br', ['zstd', 'gzip']), 'zstd')
+        self.assertEqual(middleware.negotiate('*;q=0.1, gzip;q=0', ['gzip']), None)
+        url = reverse('iot_api:iot_general_api-projects')
+        plain = self.client_api.get(url, **self.header)
+        compressed = self.client_api.get(url, HTTP_ACCEPT_ENCODING='gzip', **self.header)
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertLess(len(compressed.content), len(plain.content))
+        self.assertEqual(json.loads(gzip.decompress(compressed.content)), json.loads(plain.content))
+        # Small responses
+        small = self.client_api.get(reverse('iot_api:iot_general_api-sensor', args=(self.sensor.id,)), HTTP_ACCEPT_ENCODING='gzip', **self.header)
+        self.assertFalse(small.has_header('Content-Encoding'))
+        # Streamed responses
+        models.Measurement.objects.bulk_create([
+            models.Measurement(sensor=self.sensor, measurement_type=choices.A_TEMPERATURE, value=i) for i in range(50)
+        ])
+        url = reverse('iot_api:iot_general_api-sensor-measurements', args=(self.sensor.id,))
+        streamed = self.client_api.get(url, {'format':'ndjson'}, HTTP_ACCEPT_ENCODING='gzip', **self.header)
+        self.assertEqual(streamed['Content-Encoding'], 'gzip')
+        self.assertEqual(len(gzip.decompress(b''.join(streamed.streaming_content)).splitlines()), 50)
+
+
+    def test_streamed_flushes(self):
+        """
+        Test streamed responses are flushed before their last chunk
+        """
+        produced = []
+
+        def chunks():
+            for i in range(100):
+                produced.append(i)
+                yield '{{"value": {}}}\n'.format(i).encode() * 50
+
+        stream = middleware.ResponseCompressionMiddleware.compress_stream(middleware.GzipCompressor(6), chunks(), 4096)
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        first = b''
+        while not first:
+            first = decoder.decompress(next(stream))
+        # The first rows can be decoded while the rest are still being produced
+        self.assertLess(len(produced), 100)
+        self.assertTrue(first.startswith(b'{"value": 0}\n'))
+        rest = decoder.decompress(b''.join(stream))
+        self.assertEqual(len((first + rest).splitlines()), 5000)
+        self.assertTrue(decoder.eof)
@@ -0,0 +1,77 @@
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from users.models import GeneralUser
+from IoT import retention
+import IoT.models as models
+import IoT.model_choices as choices
+import datetime
+import io
+
+class RetentionTestCase(TestCase):
+    """
+    Test retention policies enforcement
+    """
+
+    def setUp(self):
+        user = GeneralUser.objects.create_user(
+            username = 'TURetention',
+            password = "123Password",
+            email = 'test@test.com'
+        )
+        self.projects = []
+        self.sensors = []
+        for name in ('First', 'Second'):
+            project = models.Projects.objects.create(
+                user=user,
+                name=name,
+                description='Test project',
+                snippet_title='Test Snippet',
+                snippet_image='image.png',
+            )
+            zone = models.Zones.objects.create(project=project, name='Test zone', description='')
+            self.projects.append(project)
+            self.sensors.append(models.Sensors.objects.create(zone=zone, sensor_type=choices.DHT22, ambiental=True))
+        now = timezone.now()
+        for sensor in self.sensors:
+            for m_type in (choices.A_TEMPERATURE, choices.R_HUMIDITY):
+                for days in (1, 10, 20, 40):
+                    measurement = models.Measurement.objects.create(sensor=sensor, measurement_type=m_type, value=days)
+                    models.Measurement.objects.filter(pk=measurement.pk).update(
+                        created_at=now - datetime.timedelta(days=days)
+                    )
+
+
+    def test_scoped_policies(self):
+        """
+        Test policies only remove the expired measurements of their project and type
+        """
+        policy = models.RetentionPolicy.objects.create(
+            project=self.projects[0], measurement_type=choices.A_TEMPERATURE, days=15
+        )
+        result = retention.enforce(policy, dry_run=True)
+        self.assertEqual(result['deleted'], 2)
+        self.assertEqual(models.Measurement.objects.count(), 16)
+        progress = []
+        result = retention.enforce(policy, batch_size=1, progress=progress.append)
+        self.assertEqual(result['deleted'], 2)
+        self.assertEqual(progress, [1, 2])
+        remaining = models.Measurement.objects.filter(sensor=self.sensors[0], measurement_type=choices.A_TEMPERATURE)
+        self.assertEqual(sorted(m.value for m in remaining), [1, 10])
+        self.assertEqual(models.Measurement.objects.count(), 14)
+        policy.refresh_from_db()
+        self.assertIsNotNone(policy.last_run_at)
+
+
+    def test_command(self):
+        """
+        Test the command enforces every enabled policy in batches
+        """
+        models.RetentionPolicy.objects.create(days=30)
+        models.RetentionPolicy.objects.create(project=self.projects[1], days=5)
+        models.RetentionPolicy.objects.create(days=0, enabled=False)
+        out = io.StringIO()
+        call_command('enforce_retention', batch_size=2, stdout=out)
+        self.assertIn('8 measurements deleted', out.getvalue())
+        self.assertEqual(models.Measurement.objects.filter(sensor=self.sensors[0]).count(), 6)
+        self.assertEqual(models.Measurement.objects.filter(sensor=self.sensors[1]).count(), 2)
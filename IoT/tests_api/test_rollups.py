@@ -0,0 +1,146 @@
+from django.test import TestCase
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+from users.models import GeneralUser, CustomAccessTokens
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from IoT import rollups
+import IoT.api.serializers as serializers
+import IoT.models as models
+import IoT.model_choices as choices
+import datetime
+import decimal
+import pytz
+
+class RollupsTestCase(TestCase):
+    """
+    Test measurement rollups maintenance and queries
+    """
+    client_api = APIClient()
+
+    def setUp(self):
+        # Create User
+        user = GeneralUser.objects.create_user(
+            username = 'TURollups',
+            password = "123Password",
+            email = 'test@test.com'
+        )
+        project = models.Projects.objects.create(
+            user=user,
+            name='Test',
+            description='Test project',
+            snippet_title='Test Snippet',
+            snippet_image='image.png',
+        )
+        token = CustomAccessTokens(
+            user=user,
+            name="testToken"
+        )
+        self.token = token.uuid_token
+        token.save()
+        project.access_keys.add(token)
+        zone = models.Zones.objects.create(project=project, name='Test zone', description='')
+        self.sensor = models.Sensors.objects.create(zone=zone, sensor_type=choices.DHT22, ambiental=True)
+
+
+    def test_ingest_updates_rollups(self):
+        """
+        Test rollups are merged incrementally on ingestion
+        """
+        url = reverse('iot_api:iot_general_api-measure')
+        header = {'HTTP_CA_TOKEN':self.token}
+        for values in ((10, 20, 30), (5, 40)):
+            post_response = self.client_api.post(url, {
+                'sensors':[{
+                    'value':v,
+                    'id_sensor':self.sensor.id,
+                    'measurement_type':choices.A_TEMPERATURE
+                } for v in values]
+            }, format='json', **header)
+            self.assertEqual(post_response.status_code, 201)
+        day = models.MeasurementRollup.objects.get(sensor=self.sensor, granularity=choices.DAY)
+        self.assertEqual(day.count, 5)
+        self.assertEqual(day.min_value, decimal.Decimal('5'))
+        self.assertEqual(day.max_value, decimal.Decimal('40'))
+        self.assertEqual(day.sum_value, decimal.Decimal('105'))
+        self.assertEqual(day.last_value, decimal.Decimal('40'))
+        # Compaction recomputes the same aggregates from raw measurements
+        minutes = models.MeasurementRollup.objects.filter(granularity=choices.MINUTE)
+        self.assertEqual(sum(r.count for r in minutes), 5)
+        rollups.compact(day.bucket, day.bucket + datetime.timedelta(days=1))
+        day = models.MeasurementRollup.objects.get(sensor=self.sensor, granularity=choices.DAY)
+        self.assertEqual((day.count, day.sum_value, day.last_value), (5, decimal.Decimal('105'), decimal.Decimal('40')))
+
+
+    def test_series_resolution(self):
+        """
+        Test queries use the coarsest rollup satisfying the resolution
+        """
+        start = datetime.datetime(2020, 1, 1, tzinfo=pytz.utc)
+        models.Measurement.objects.bulk_create([
+            models.Measurement(sensor=self.sensor, value=x % 50, measurement_type=choices.A_TEMPERATURE)
+            for x in range(48 * 60)
+        ])
+        # Spread creation dates, one measurement per minute for two days
+        for x, pk in enumerate(models.Measurement.objects.order_by('id').values_list('id', flat=True)):
+            models.Measurement.objects.filter(pk=pk).update(created_at=start + datetime.timedelta(minutes=x))
+        rollups.compact(start, start + datetime.timedelta(days=2))
+        self.assertEqual(rollups.pick_granularity(30), None)
+        self.assertEqual(rollups.pick_granularity(1800), choices.MINUTE)
+        self.assertEqual(rollups.pick_granularity(7200), choices.HOUR)
+        self.assertEqual(rollups.pick_granularity(10**6), choices.DAY)
+        url = reverse('iot_api:iot_general_api-sensor-aggregates', args=(self.sensor.id,))
+        header = {'HTTP_CA_TOKEN':self.token}
+        get_response = self.client_api.get(url, {
+            'type':choices.A_TEMPERATURE,
+            'resolution':3600,
+            'from':'2020-01-01',
+            'to':'2020-01-02',
+        }, format='json', **header)
+        self.assertEqual(get_response.status_code, 200)
+        self.assertEqual(get_response.data['granularity'], choices.HOUR)
+        aggregates = get_response.data['aggregates']
+        self.assertEqual(len(aggregates), 24)
+        self.assertEqual(aggregates[0]['count'], 60)
+        self.assertEqual(aggregates[0]['min_value'], '0.00')
+        self.assertEqual(aggregates[0]['max_value'], '49.00')
+        get_response = self.client_api.get(url, {'type':choices.A_TEMPERATURE, 'resolution':'daily'}, format='json', **header)
+        self.assertEqual(get_response.status_code, 400)
+
+
+    def test_raw_series(self):
+        """
+        Test resolutions finer than every rollup are aggregated by the database
+        """
+        start = datetime.datetime(2020, 1, 1, tzinfo=pytz.utc)
+        seconds = [0, 10, 50, 50, 61, 3600]
+        values = [1, 7, 3, 4, 9, 2]
+        models.Measurement.objects.bulk_create([
+            models.Measurement(sensor=self.sensor, value=v, measurement_type=choices.A_TEMPERATURE) for v in values
+        ])
+        for second, pk in zip(seconds, models.Measurement.objects.order_by('id').values_list('id', flat=True)):
+            models.Measurement.objects.filter(pk=pk).update(created_at=start + datetime.timedelta(seconds=second))
+        with CaptureQueriesContext(connection) as ctx:
+            granularity, minutes = rollups.series(self.sensor.id, choices.A_TEMPERATURE, start, None, resolution=30)
+        self.assertEqual(len(ctx.captured_queries), 2)
+        self.assertEqual(granularity, None)
+        self.assertEqual([r.bucket for r in minutes], [start, start + datetime.timedelta(minutes=1), start + datetime.timedelta(hours=1)])
+        first = minutes[0]
+        self.assertEqual((first.count, first.min_value, first.max_value, first.sum_value), (4, 1, 7, 15))
+        # Ties keep the latest stored measurement
+        self.assertEqual((first.last_value, first.last_at), (4, start + datetime.timedelta(seconds=50)))
+        self.assertEqual([r.last_value for r in minutes[1:]], [9, 2])
+
+
+    def test_single_saves_update_rollups(self):
+        """
+        Test measurements saved one at a time reach their rollups
+        """
+        ser = serializers.MeasurementSerializer(data={
+            'value':'12.50', 'id_sensor':self.sensor.id, 'measurement_type':choices.A_TEMPERATURE,
+        })
+        self.assertTrue(ser.is_valid())
+        ser.save()
+        models.Measurement.objects.create(sensor=self.sensor, value=7, measurement_type=choices.A_TEMPERATURE)
+        day = models.MeasurementRollup.objects.get(sensor=self.sensor, granularity=choices.DAY)
+        self.assertEqual((day.count, day.sum_value, day.last_value), (2, decimal.Decimal('19.50'), decimal.Decimal('7')))
@@ -2,11 +2,14 @@ from django.test import TestCase
 from django.utils import timezone
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient
+from unittest import mock
 from users.models import GeneralUser, CustomAccessTokens
+from IoT.api import pagination
 from IoT.api.views import IoTProjectsViewSet
 import IoT.models as models
 import IoT.model_choices as choices
 import datetime
+import json
 import pytz
 
 class SensorManagementTestCase(TestCase):
@@ -271,3 +274,88 @@ class SensorManagementTestCase(TestCase):
 
         self.assertEqual(sensor_count, len(models.Sensors.objects.all()))
 
+
+
+    def CreateMeasurements(self, sensor, dates):
+        """
+        Create one measurement per date for sensor
+        """
+        for i, date in enumerate(dates):
+            m = models.Measurement.objects.create(
+                sensor=sensor,
+                value=i,
+                measurement_type=choices.A_TEMPERATURE
+            )
+            # created_at is set on creation, it's updated to the wanted date
+            models.Measurement.objects.filter(pk=m.pk).update(created_at=date)
+
+
+    def test_paginated_measurements(self):
+        """
+        Test time range filtering and keyset pagination of measurements
+        """
+        sensor = self.CreateSensors(n=1)[0]
+        header = {'HTTP_CA_TOKEN':self.zone_token}
+        start = datetime.datetime(2020, 1, 31, 23, 0, tzinfo=pytz.utc)
+        # Two measurements share the same date in order to test ties
+        dates = [start + datetime.timedelta(hours=h) for h in (0, 1, 1, 2, 3, 30)]
+        self.CreateMeasurements(sensor, dates)
+        url_sensor_measurements = reverse('iot_api:iot_general_api-sensor-measurements', args=(sensor.id,))
+        # Walk all pages
+        seen = []
+        cursor = None
+        while True:
+            params = {'page_size':2}
+            if cursor:
+                params['cursor'] = cursor
+            get_response = self.client_api.get(url_sensor_measurements, params, format="json", **header)
+            self.assertEqual(get_response.status_code, 200)
+            self.assertTrue(len(get_response.data['measurements']) <= 2)
+            seen.extend(m['id'] for m in get_response.data['measurements'])
+            cursor = get_response.data['next']
+            if cursor is None:
+                break
+        self.assertEqual(seen, list(models.Measurement.objects.filter(sensor=sensor).order_by('created_at', 'id').values_list('id', flat=True)))
+        # Range filtering
+        get_response = self.client_api.get(url_sensor_measurements, {
+            'from':'2020-02-01T00:00:00Z',
+            'to':'2020-02-01T02:00:00Z',
+        }, format="json", **header)
+        self.assertEqual(len(get_response.data['measurements']), 3)
+        # Calendar filtering
+        get_response = self.client_api.get(url_sensor_measurements, {'y':2020, 'm':2}, format="json", **header)
+        self.assertEqual(len(get_response.data['measurements']), 5)
+        get_response = self.client_api.get(url_sensor_measurements, {'y':2020, 'm':2, 'd':30}, format="json", **header)
+        self.assertEqual(get_response.data['measurements'], [])
+        # Without page_size or cursor the whole range is returned
+        with mock.patch.object(pagination, 'PAGE_SIZE', 2):
+            get_response = self.client_api.get(url_sensor_measurements, format="json", **header)
+        self.assertEqual(len(get_response.data['measurements']), 6)
+        self.assertIsNone(get_response.data['next'])
+        # Invalid parameters
+        get_response = self.client_api.get(url_sensor_measurements, {'from':'yesterday'}, format="json", **header)
+        self.assertEqual(get_response.status_code, 400)
+
+
+    def test_streamed_measurements(self):
+        """
+        Test streamed measurements match the paginated ones
+        """
+        sensor = self.CreateSensors(n=1)[0]
+        header = {'HTTP_CA_TOKEN':self.zone_token}
+        start = datetime.datetime(2020, 1, 1, tzinfo=pytz.utc)
+        self.CreateMeasurements(sensor, [start + datetime.timedelta(minutes=x) for x in range(25)])
+        url_sensor_measurements = reverse('iot_api:iot_general_api-sensor-measurements', args=(sensor.id,))
+        paginated = self.client_api.get(url_sensor_measurements, format="json", **header).data['measurements']
+        # Newline delimited JSON
+        ndjson_response = self.client_api.get(url_sensor_measurements, {'format':'ndjson'}, **header)
+        self.assertEqual(ndjson_response.status_code, 200)
+        self.assertTrue(ndjson_response.streaming)
+        self.assertEqual(ndjson_response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(ndjson_response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(l) for l in lines], paginated)
+        # Chunked JSON body
+        json_response = self.client_api.get(url_sensor_measurements, {'stream':1, 'from':'2020-01-01T00:10:00Z'}, **header)
+        body = json.loads(b''.join(json_response.streaming_content))
+        self.assertEqual(body['measurements'], paginated[10:])
+        self.assertIsNone(body['next'])
@@ -2,11 +2,15 @@ from rest_framework.routers import DefaultRouter
 from django.urls import include, path
 from IoT import views
 from IoT.api import views as api_views
+from IoT.api import device
 
 router = DefaultRouter()
 router.register(r'g',api_views.IoTProjectsViewSet,basename='iot_general_api')
 
 urlpatterns = [
+    # Lean device routes, see IOT_LEAN_ROUTES
+    path('api/ingest/measure/', device.MeasureView.as_view(), name="iot_ingest_measure"),
+    path('api/ingest/measure_lines/', device.MeasureLinesView.as_view(), name="iot_ingest_measure_lines"),
     path('api/',include((router.urls,'iot_api'))),
     path('<int:project_id>/<int:sensor_id>/plot/', views.sensor_graph, name="sensor_graph"),
     path('<int:project_id>/<int:sensor_id>/plot/<slug:measurement_type>/', views.graph, name="sensor_specific_graph"),
@@ -1,27 +1,65 @@
-from matplotlib.backends.backend_agg import FigureCanvasAgg
+from django.conf import settings
 from django.shortcuts import get_object_or_404, render
 from django.core.exceptions import PermissionDenied
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, HttpResponseBadRequest, Http404
 from django.template import loader
 from django.urls import reverse
 from IoT import models
+from IoT import hierarchy, plot_cache, rendering, series
+from IoT.api.pagination import time_range
 import IoT.model_choices as choices
-import matplotlib.pyplot as plt
-import io
 
+# Maximum points drawn per series, plots are 1000px wide
+PLOT_POINTS = getattr(settings, 'IOT_PLOT_POINTS', 1000)
 
-def project_sensors(project_id):
+
+def plot_window(request):
+    """
+    Returns the (start, end) window requested with from/to/y/m/d
+    """
+    start, end = time_range(request.GET)
+    return start, end, (start.isoformat() if start else '', end.isoformat() if end else '')
+
+
+def plot_response(request, parts, sensor_ids, render):
     """
-    Find all sensors in project
+    Returns the cached plot response, 503 when the render pool is busy
     """
-    project = get_object_or_404(models.Projects, pk=project_id)
-    sensors = []
-    for z in project.project_zones.all():
-        sensors.extend(z.zone_ambiental_sensors.all())
-        for n in z.zone_nodes.all():
-            sensors.extend(n.node_sensors.all())
-    
-    return sensors
+    try:
+        return plot_cache.cached_plot(request, parts, sensor_ids, render)
+    except rendering.RenderBusy as e:
+        response = HttpResponse(str(e), status=503, content_type='text/plain')
+        response['Retry-After'] = '5'
+        return response
+
+
+def length_panels(measures, title=None):
+    """
+    Groups (label, values, dates) series with the same amount of values into panels
+    """
+    panels = []
+    for l in sorted(set(len(v) for (x,v,d) in measures)):
+        panel = rendering.Panel(title)
+        for label, values, dates in measures:
+            if len(values) == l:
+                panel.add(label, dates, values)
+        panels.append(panel)
+    return panels
+
+
+def sensor_in_project(sensor, project_id):
+    """
+    Validates a sensor belongs to a project
+    ====
+
+    Uses the denormalized project of the sensor, the project is
+    only queried to tell apart missing projects
+    """
+    if sensor.project_id == project_id:
+        return
+    if not models.Projects.objects.filter(pk=project_id).exists():
+        raise Http404()
+    raise PermissionDenied()
 
 
 def sensor_graph(request, project_id, sensor_id):
@@ -34,49 +72,32 @@ def sensor_graph(request, project_id, sensor_id):
     selected sensor which then are plotted in a 
     matplotlib plot and transformed to an image to
     return it
+
+    Rendered plots are cached until the sensor receives
+    new measurements (see IoT.plot_cache)
     """
     sensor = get_object_or_404(models.Sensors, pk=sensor_id)
-    if sensor not in project_sensors(project_id):
-        raise PermissionDenied()
-
-    measures = list()
-    for m_type in [x for x,v in choices.MEASUREMENT_TYPE_CHOICES]:
-        measurements = sensor.sensor_measurements.values_list('value','created_at')
-        measurements = measurements.filter(measurement_type=m_type)
-        if measurements:
-            values, dates = zip(*measurements)
-            measures.append(({k:v for k,v in choices.MEASUREMENT_TYPE_CHOICES}[m_type], values, dates))
-    # Count unique lenghts of values
-    d = []
-    d = set([len(l) for (x,l,m) in measures if len(l) not in d])
-    # Create figure and axes
-    f, a =  plt.subplots(len(d),1,figsize=(10,(5*len(d))))
-    f.suptitle({k:v for k,v in choices.SENSOR_TYPE_CHOICES}[sensor.sensor_type], fontsize=16)
-    if len(d) > 1:
-        # Loop same lenght values
-        for i, l in enumerate(d):
-            same = [x for x in measures if len(x[1]) == l]
-            for values in same:
-                # Plot
-                a[i].plot(values[2],values[1],label=values[0])
-                a[i].legend()
-    else:
-        for values in measures:
-            # Plot
-            a.plot(values[2],values[1],label=values[0])
-            a.legend()
-
-    f.autofmt_xdate()
-    # Byte information
-    buf = io.BytesIO()
-    canvas = FigureCanvasAgg(f)
-    canvas.print_png(buf)
-    # Format response
-    response = HttpResponse(buf.getvalue(), content_type='image/png')
-    response['Content-Length'] = str(len(response.content))
-    # Clear figure to save space
-    f.clear()
-    return response
+    sensor_in_project(sensor, project_id)
+    try:
+        start, end, window = plot_window(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    def render():
+        measures = list()
+        # Every measurement type is loaded with a single query
+        loaded = series.load(sensor.sensor_measurements.between(start, end), 'measurement_type')
+        for m_type in [x for x,v in choices.MEASUREMENT_TYPE_CHOICES]:
+            if m_type in loaded:
+                dates, values = series.plot_series(*loaded[m_type], PLOT_POINTS)
+                measures.append(({k:v for k,v in choices.MEASUREMENT_TYPE_CHOICES}[m_type], values, dates))
+        # Measurement types with the same amount of values share a subplot
+        return rendering.render(
+            length_panels(measures),
+            title={k:v for k,v in choices.SENSOR_TYPE_CHOICES}[sensor.sensor_type],
+        )
+
+    return plot_response(request, ('sensor_graph', sensor.id, '', window, PLOT_POINTS), [sensor.id], render)
 
 
 def graph(request, project_id, sensor_id, measurement_type):
@@ -89,27 +110,23 @@ def graph(request, project_id, sensor_id, measurement_type):
     then transformed into an image and returned
     """
     sensor = get_object_or_404(models.Sensors, pk=sensor_id)
-    if sensor not in project_sensors(project_id):
-        raise PermissionDenied()
+    sensor_in_project(sensor, project_id)
+    try:
+        start, end, window = plot_window(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
 
-    measurements = sensor.sensor_measurements.values_list('value','created_at')
-    measurements = measurements.filter(measurement_type=measurement_type)
-    # Missing date filtering and authentication
-    values, dates = zip(*measurements)
-    f, ax = plt.subplots(figsize=(10,10))
-    ax.plot(dates, values)
-    ax.set_title({k:v for k,v in choices.MEASUREMENT_TYPE_CHOICES}[measurement_type])
-    f.autofmt_xdate()
-    # Byte information
-    buf = io.BytesIO()
-    canvas = FigureCanvasAgg(f)
-    canvas.print_png(buf)
-    # Format response
-    response = HttpResponse(buf.getvalue(), content_type='image/png')
-    response['Content-Length'] = str(len(response.content))
-    # Clear figure to save space
-    f.clear()
-    return response
+    def render():
+        measurements = sensor.sensor_measurements.between(start, end).filter(measurement_type=measurement_type)
+        loaded = series.load(measurements, 'measurement_type')
+        panels = []
+        title = {k:v for k,v in choices.MEASUREMENT_TYPE_CHOICES}.get(measurement_type, measurement_type)
+        if measurement_type in loaded:
+            dates, values = series.plot_series(*loaded[measurement_type], PLOT_POINTS)
+            panels.append(rendering.Panel(title, [(None, dates, values)]))
+        return rendering.render(panels, title=None if panels else title, figsize=(10,10))
+
+    return plot_response(request, ('graph', sensor.id, measurement_type, window, PLOT_POINTS), [sensor.id], render)
 
 
 def graph_mixed(request, project_id, zone_id, measurement_type):
@@ -125,42 +142,37 @@ def graph_mixed(request, project_id, zone_id, measurement_type):
     In case some sensors have less measurement than others they
     are separated into different subplots
     """
-    zone = get_object_or_404(models.Zones, pk=zone_id)
-    project = get_object_or_404(models.Projects, pk=project_id)
-    if zone not in project.project_zones.all():
+    snapshot = hierarchy.project(project_id)
+    if snapshot is None or hierarchy.zone_project(zone_id) is None:
+        raise Http404()
+    if zone_id not in snapshot.zones:
         raise PermissionDenied()
-
-    sensors = zone.zone_ambiental_sensors.filter(ambiental=True)
-    measures = list()
-    for sensor in sensors:
-        measurements = sensor.sensor_measurements.values_list('value','created_at')
-        measurements = measurements.filter(measurement_type=measurement_type)
-        if measurements:
-            values, dates = zip(*measurements)
-            measures.append((sensor.sensor_type, values, dates))
-    # Missing date filtering and authentication
-    # Count unique lenghts of values
-    d = []
-    d = set([len(l) for (x,l,m) in measures if len(l) not in d])
-    # Create figure and axes
-    f, a =  plt.subplots(len(d),1,figsize=(10,(5*len(d))))
-    # Loop same lenght values
-    for i, l in enumerate(d):
-        same = [x for x in measures if len(x[1]) == l]
-        for values in same:
-            # Plot
-            a[i].set_title({k:v for k,v in choices.MEASUREMENT_TYPE_CHOICES}[measurement_type])
-            a[i].plot(values[2],values[1],label=values[0])
-            a[i].legend()
-
-    f.autofmt_xdate()
-    # Byte information
-    buf = io.BytesIO()
-    canvas = FigureCanvasAgg(f)
-    canvas.print_png(buf)
-    # Format response
-    response = HttpResponse(buf.getvalue(), content_type='image/png')
-    response['Content-Length'] = str(len(response.content))
-    # Clear figure to save space
-    f.clear()
-    return response
\ No newline at end of file
+    try:
+        start, end, window = plot_window(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    sensors = snapshot.ambiental(zone_id)
+
+    def render():
+        measures = list()
+        # Series of every ambiental sensor of the zone in a single query
+        measurements = models.Measurement.objects.between(start, end).filter(
+            zone_id=zone_id,
+            measurement_type=measurement_type,
+            sensor_id__in=sensors,
+        )
+        loaded = series.load(measurements, 'sensor_id')
+        for sensor_id in sensors:
+            if sensor_id in loaded:
+                dates, values = series.plot_series(*loaded[sensor_id], PLOT_POINTS)
+                measures.append((snapshot.sensors[sensor_id].sensor_type, values, dates))
+        title = {k:v for k,v in choices.MEASUREMENT_TYPE_CHOICES}.get(measurement_type, measurement_type)
+        return rendering.render(length_panels(measures, title), title=None if measures else title)
+
+    return plot_response(
+        request,
+        ('graph_mixed', zone_id, measurement_type, window, PLOT_POINTS),
+        sensors,
+        render
+    )
@@ -62,6 +62,10 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'IoT.middleware.ResponseCompressionMiddleware',
+    'IoT.middleware.RequestDecompressionMiddleware',
+    # Device routes skip the middleware below
+    'IoT.middleware.LeanRouteMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -167,3 +171,142 @@ else:
     STATICFILES_DIRS =(
         os.path.join(SETTINGS_PATH, 'static'),
     )
+
+# IoT measurement ingestion
+# Amount of rows written by each INSERT when storing measurement batches
+IOT_INGEST_CHUNK_SIZE = 500
+
+# Access token cache (see users.api.token_cache)
+# BACKEND can be 'django' (uses CACHE_ALIAS from CACHES) or 'local' (process memory)
+# Setting TTL to 0 disables the cache
+# Deleted or revoked tokens are only removed from the cache of the worker handling the change,
+# per process caches ('local' or a LocMem CACHE_ALIAS) keep entries at most LOCAL_TTL seconds.
+# Point CACHE_ALIAS to a cache shared by every worker in production (see users.checks)
+CA_TOKEN_CACHE = {
+    'BACKEND': 'django',
+    'CACHE_ALIAS': 'default',
+    'MAX_SIZE': 1024,
+    'TTL': 300,
+    'LOCAL_TTL': 5,
+}
+
+# Measurements returned per page by default and at most by sensor_measurements,
+# pages are only used when "page_size" or "cursor" are requested
+IOT_MEASUREMENTS_PAGE_SIZE = 1000
+IOT_MEASUREMENTS_MAX_PAGE_SIZE = 10000
+# Rows fetched per database round trip when streaming measurements
+IOT_STREAM_CHUNK_SIZE = 2000
+# Maximum points drawn per series by the plot views
+IOT_PLOT_POINTS = 1000
+
+# Measurement rollups (see IoT.rollups)
+# ON_INGEST updates the rollups whenever measurements are stored, when disabled
+# they must be recomputed periodically with the compact_rollups command
+IOT_ROLLUPS = {
+    'ON_INGEST': True,
+    'GRANULARITIES': ['minute', 'hour', 'day'],
+}
+
+# Rendered plot cache (see IoT.plot_cache)
+# Plots are stored in CACHE_ALIAS for TTL seconds, setting TTL to 0 disables the cache
+# Plots are keyed by the sensor versions stored in the database (Sensors.measurements_changed_at),
+# thus CACHE_ALIAS may be per process, each worker then renders and keeps its own plots
+IOT_PLOT_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TTL': 3600,
+}
+
+# Plot rendering pool (see IoT.rendering)
+# WORKERS threads draw plots, once QUEUE renders are waiting new plots answer 503
+IOT_PLOT_RENDERING = {
+    'WORKERS': 2,
+    'QUEUE': 8,
+    'TIMEOUT': 30,
+}
+
+# Project hierarchy snapshots (see IoT.hierarchy)
+# Snapshots are stored in CACHE_ALIAS and the last L1_SIZE used are kept in process memory
+# Snapshots are only used for tree reads, CACHE_ALIAS must be shared by every worker to keep them fresh (check --deploy warns)
+# Versions expire after MAX_AGE seconds, bounding how long other workers keep outdated snapshots on a per process cache
+IOT_HIERARCHY_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TTL': 86400,
+    'L1_SIZE': 256,
+    'MAX_AGE': 60,
+}
+
+# Monthly Measurement partitions on MySQL (see IoT.partitions)
+# AHEAD months of partitions are created by the manage_partitions command
+IOT_MEASUREMENT_PARTITIONS = {
+    'AHEAD': 3,
+}
+
+# Measurement retention (see IoT.retention)
+# Expired measurements are deleted BATCH_SIZE rows at a time waiting SLEEP seconds between batches
+IOT_RETENTION = {
+    'BATCH_SIZE': 5000,
+    'SLEEP': 0.0,
+}
+
+# Deletion of zones, nodes and sensors (see IoT.deletions)
+# Deleted objects are hidden right away and purged by a background thread when ASYNC is enabled,
+# otherwise schedule the purge_deletions command
+IOT_DELETIONS = {
+    'ASYNC': True,
+}
+
+# Write-ahead ingest buffer (see IoT.api.buffer)
+# When ENABLED measurements are logged with the selected DURABILITY (fsync, write or memory) and
+# group committed every FLUSH_MS milliseconds or FLUSH_ROWS rows, run replay_ingest_log after a crash
+IOT_INGEST_BUFFER = {
+    'ENABLED': False,
+    'DURABILITY': 'fsync',
+    'PATH': 'ingest.wal',
+    'FLUSH_MS': 200,
+    'FLUSH_ROWS': 5000,
+    'MAX_ROWS': 100000,
+}
+
+# Device timestamps (see IoT.api.ingest)
+# Readings may be timestamped up to FUTURE seconds ahead and PAST seconds behind the server clock,
+# older series are loaded through the backfill endpoint in chunks of IOT_BACKFILL_CHUNK_SIZE rows
+IOT_TIMESTAMP_SKEW = {
+    'FUTURE': 300,
+    'PAST': 604800,
+}
+IOT_BACKFILL_CHUNK_SIZE = 5000
+
+# Line protocol ingestion (see IoT.api.lines)
+# Lines are authorized and committed IOT_LINES_CHUNK_SIZE at a time while the body is streamed
+IOT_LINES_CHUNK_SIZE = 5000
+
+# Compressed request bodies (see IoT.middleware)
+# gzip, deflate and zstd bodies under PATHS are inflated while read, bodies inflating past MAX_SIZE
+# bytes or MAX_RATIO times their compressed size are rejected, ratios are counted in CACHE_ALIAS
+IOT_REQUEST_DECOMPRESSION = {
+    'PATHS': ['/IoT/api/'],
+    'MAX_SIZE': 64 * 1024 * 1024,
+    'MAX_RATIO': 100,
+    'CACHE_ALIAS': 'default',
+}
+
+# Compressed responses (see IoT.middleware)
+# Responses under PATHS of at least MIN_SIZE bytes are compressed with the accepted encoding,
+# br and zstd need the brotli and zstandard packages
+IOT_RESPONSE_COMPRESSION = {
+    'PATHS': ['/IoT/api/'],
+    'MIN_SIZE': 1024,
+    'ENCODINGS': ['zstd', 'br', 'gzip'],
+    'LEVELS': {'zstd': 3, 'br': 4, 'gzip': 6},
+    # Streamed responses are flushed every FLUSH_SIZE uncompressed bytes
+    'FLUSH_SIZE': 16 * 1024,
+}
+
+# JSON renderer of the IoT API (see IoT.api.renderers), encodes with orjson when it's installed
+IOT_JSON_RENDERER = 'IoT.api.renderers.FastJSONRenderer'
+
+# Lean device routes (see IoT.middleware.LeanRouteMiddleware)
+# Requests under PATHS skip the session, CSRF, authentication, messages and clickjacking middleware
+IOT_LEAN_ROUTES = {
+    'PATHS': ['/IoT/api/ingest/'],
+}
@@ -0,0 +1,153 @@
+"""
+Shared helpers for the benchmarks
+====
+
+Benchmarks run against a throwaway test database created from
+backend.settings, thus your development or production data is never
+touched. Export the RDS_* environment variables (see backend.README)
+to run them against MySQL instead of SQLite
+"""
+import argparse, datetime, decimal, os, random, statistics, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django
+
+
+def parser(description):
+    """
+    Argument parser with the options shared by every benchmark
+    """
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument('--sqlite-file', default=None,
+        help='Store the SQLite test database in this file instead of memory (needed for big tables)')
+    p.add_argument('--keepdb', action='store_true',
+        help='Reuse the test database between runs (skips the data generation when it already exists)')
+    p.add_argument('--repeat', type=int, default=5, help='Times every measured operation is repeated')
+    return p
+
+
+def setup(args):
+    """
+    Configures Django and creates the benchmark database
+    """
+    from django.conf import settings
+    if args.sqlite_file:
+        settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = args.sqlite_file
+    django.setup()
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=args.keepdb)
+    return old_name
+
+
+def teardown(args, old_name):
+    from django.db import connection
+    connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=args.keepdb)
+
+
+def timed(fn, repeat=5):
+    """
+    Runs fn repeat times returning (median seconds, last result)
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def create_hierarchy(zones=1, nodes=1, sensors=1, ambiental=0, username='benchmark'):
+    """
+    Creates a user, a token and a project with the requested tree
+    ====
+
+    Returns (raw token, token, project, list of sensors)
+    """
+    from users.models import GeneralUser, CustomAccessTokens
+    from IoT import models
+    import IoT.model_choices as choices
+    user, _ = GeneralUser.objects.get_or_create(username=username)
+    token = CustomAccessTokens(user=user, name='benchmark')
+    raw_token = token.uuid_token
+    token.save()
+    project = models.Projects.objects.create(
+        user=user,
+        name='Benchmark',
+        description='Benchmark project',
+        snippet_title='Benchmark',
+        snippet_image='image.png',
+    )
+    project.access_keys.add(token)
+    created = []
+    for z in range(zones):
+        zone = models.Zones.objects.create(project=project, name='Z{}'.format(z), description='')
+        created.extend(models.Sensors.objects.bulk_create([
+            models.Sensors(zone=zone, project=project, sensor_type=choices.DHT22, ambiental=True) for _ in range(ambiental)
+        ]))
+        for n in range(nodes):
+            node = models.Node.objects.create(zone=zone, name='N{}'.format(n), description='')
+            created.extend(models.Sensors.objects.bulk_create([
+                models.Sensors(zone=zone, project=project, node=node, sensor_type=choices.DHT22, ambiental=False) for _ in range(sensors)
+            ]))
+    return raw_token, token, project, list(models.Sensors.objects.filter(project=project))
+
+
+def fill_measurements(sensor_ids, rows, types=None, start=None, step=60, batch=20000, progress=True):
+    """
+    Inserts rows synthetic measurements spread between sensor_ids
+    ====
+
+    Rows are written with raw executemany calls so tables of
+    millions of rows can be generated in a reasonable time
+    """
+    from django.db import connection, transaction
+    from IoT.models import Measurement, Sensors
+    import IoT.model_choices as choices
+    types = types or [t for t, _ in choices.MEASUREMENT_TYPE_CHOICES]
+    start = start or datetime.datetime(2015, 1, 1, tzinfo=datetime.timezone.utc)
+    table = connection.ops.quote_name(Measurement._meta.db_table)
+    sql = 'INSERT INTO {} (measurement_type, value, created_at, sensor_id, zone_id, project_id) VALUES (%s, %s, %s, %s, %s, %s)'.format(table)
+    locations = {pk:(zone_id, project_id) for pk, zone_id, project_id in Sensors.objects.filter(
+        pk__in=sensor_ids
+    ).values_list('id', 'zone_id', 'project_id')}
+    ops = connection.ops
+    rnd = random.Random(0)
+    written = 0
+    with connection.cursor() as cursor:
+        while written < rows:
+            size = min(batch, rows - written)
+            params = []
+            for i in range(written, written + size):
+                created_at = start + datetime.timedelta(seconds=step * (i // len(sensor_ids)))
+                params.append((
+                    types[i % len(types)],
+                    ops.adapt_decimalfield_value(decimal.Decimal(rnd.randint(0, 10000)) / 100, 8, 2),
+                    ops.adapt_datetimefield_value(created_at),
+                    sensor_ids[i % len(sensor_ids)],
+                ) + locations[sensor_ids[i % len(sensor_ids)]])
+            with transaction.atomic():
+                cursor.executemany(sql, params)
+            written += size
+            if progress:
+                print('\r  {:,}/{:,} rows'.format(written, rows), end='', flush=True)
+    if progress:
+        print()
+
+
+def report(title, rows, headers):
+    """
+    Prints a result table
+    """
+    print('\n' + title)
+    widths = [max(len(str(x)) for x in col) for col in zip(headers, *rows)]
+    line = '  '.join('{:<%d}' % w for w in widths)
+    print(line.format(*headers))
+    print(line.format(*['-' * w for w in widths]))
+    for row in rows:
+        print(line.format(*row))
@@ -0,0 +1,78 @@
+"""
+Device ingestion overhead benchmark
+====
+
+Sends the same measure requests through the full middleware stack
+and DRF negotiation of IoTProjectsViewSet (IoT/api/g/measure/) and
+through the lean device route (IoT/api/ingest/measure/), requests go
+through Django's request handler as they would in production.
+
+Rejected requests (a sensor the token can't manage) store nothing,
+so their time is mostly per-request overhead.
+
+Usage:
+    $ python benchmarks/ingest_overhead.py --requests 500
+"""
+import common
+
+
+def main():
+    p = common.parser(__doc__)
+    p.add_argument('--requests', type=int, default=500, help='Requests sent per route and case')
+    args = p.parse_args()
+    old_name = common.setup(args)
+    try:
+        from django.db import connection
+        from django.test import Client
+        from django.test.utils import CaptureQueriesContext
+        from IoT import access_index, models
+        import IoT.model_choices as choices
+        import json
+        import logging
+
+        # Rejected requests are logged as warnings
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        raw_token, token, project, sensors = common.create_hierarchy(zones=1, nodes=1, sensors=1, ambiental=0)
+        # Sensors are bulk created, thus their permissions are indexed here
+        access_index.rebuild_token_index([token.id])
+        sensor = sensors[0]
+        client = Client()
+        header = {'HTTP_CA_TOKEN':raw_token}
+        cases = {
+            'stored':json.dumps({'sensors':[{'id_sensor':sensor.id, 'measurement_type':choices.A_TEMPERATURE, 'value':21.5}]}),
+            'rejected':json.dumps({'sensors':[{'id_sensor':sensor.id + 1000, 'measurement_type':choices.A_TEMPERATURE, 'value':21.5}]}),
+        }
+        routes = {
+            'viewset (g/measure/)':'/IoT/api/g/measure/',
+            'lean (ingest/measure/)':'/IoT/api/ingest/measure/',
+        }
+        # Warm up caches (token, URL resolver, imports)
+        for url in routes.values():
+            client.post(url, cases['stored'], content_type='application/json', **header)
+
+        rows = []
+        for case, body in cases.items():
+            for name, url in routes.items():
+                def send():
+                    for _ in range(args.requests):
+                        client.post(url, body, content_type='application/json', **header)
+                seconds, _ = common.timed(send, args.repeat)
+                with CaptureQueriesContext(connection) as ctx:
+                    client.post(url, body, content_type='application/json', **header)
+                rows.append((
+                    case,
+                    name,
+                    '{:.3f} ms'.format(seconds * 1000 / args.requests),
+                    len(ctx.captured_queries),
+                ))
+        common.report(
+            'Measure requests ({:,} stored, {})'.format(models.Measurement.objects.count(), connection.vendor),
+            rows,
+            ('case', 'route', 'per request', 'queries'),
+        )
+    finally:
+        common.teardown(args, old_name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Measurement time-series index benchmark
+====
+
+Compares the plot and measurement queries of a sensor with the
+composite (sensor, measurement_type, created_at) indexes against the
+previous schema that only had the sensor foreign key index.
+
+Usage:
+    $ python benchmarks/measurement_indexes.py --rows 1000000
+    $ python benchmarks/measurement_indexes.py --rows 50000000 --sqlite-file /tmp/bench.sqlite3 --keepdb
+
+Export the RDS_* environment variables to run it on MySQL
+"""
+import common
+
+
+def plans(connection, queries):
+    """
+    Returns the query plan of every query
+    """
+    explain = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    result = {}
+    with connection.cursor() as cursor:
+        for name, qs in queries.items():
+            sql, params = qs.query.sql_with_params()
+            cursor.execute(explain + sql, params)
+            columns = [c[0] for c in cursor.description]
+            if connection.vendor == 'sqlite':
+                steps = [row[-1] for row in cursor.fetchall()]
+            else:
+                steps = [
+                    ' '.join('{}={}'.format(c, v) for c, v in zip(columns, row) if c in ('type', 'key', 'rows', 'Extra') and v)
+                    for row in cursor.fetchall()
+                ]
+            result[name] = ' | '.join(steps)
+    return result
+
+
+def main():
+    p = common.parser(__doc__)
+    p.add_argument('--rows', type=int, default=500000, help='Synthetic measurements to generate')
+    p.add_argument('--sensors', type=int, default=100, help='Sensors the measurements are spread on')
+    args = p.parse_args()
+    old_name = common.setup(args)
+    try:
+        from django.db import connection, models as dj_models
+        from IoT.models import Measurement
+        import IoT.model_choices as choices
+
+        if not Measurement.objects.exists():
+            print('Generating {:,} measurements for {} sensors'.format(args.rows, args.sensors))
+            _, _, _, sensors = common.create_hierarchy(zones=1, nodes=1, sensors=args.sensors)
+            common.fill_measurements([s.id for s in sensors], args.rows)
+        sensor_id = Measurement.objects.values_list('sensor_id', flat=True).first()
+        dates = Measurement.objects.filter(sensor_id=sensor_id).aggregate(first=dj_models.Min('created_at'), last=dj_models.Max('created_at'))
+        # A window covering a tenth of the sensor history
+        middle = dates['first'] + (dates['last'] - dates['first']) / 2
+        window = (middle, middle + (dates['last'] - dates['first']) / 10)
+        queries = {
+            'type series (graph)':Measurement.objects.filter(
+                sensor_id=sensor_id, measurement_type=choices.A_TEMPERATURE
+            ).values_list('value', 'created_at'),
+            'time window':Measurement.objects.filter(
+                sensor_id=sensor_id, created_at__gte=window[0], created_at__lt=window[1]
+            ).values_list('id', 'value', 'created_at'),
+            'type time window':Measurement.objects.filter(
+                sensor_id=sensor_id, measurement_type=choices.A_TEMPERATURE,
+                created_at__gte=window[0], created_at__lt=window[1]
+            ).values_list('value', 'created_at'),
+            'first page ordered':Measurement.objects.filter(
+                sensor_id=sensor_id
+            ).order_by('created_at', 'id').values_list('id', 'value', 'created_at')[:1000],
+        }
+
+        def run(label):
+            rows = []
+            query_plans = plans(connection, queries)
+            for name, qs in queries.items():
+                seconds, result = common.timed(lambda: list(qs.all()), args.repeat)
+                rows.append((name, '{:.2f} ms'.format(seconds * 1000), len(result), query_plans[name]))
+            common.report(label, rows, ('query', 'median', 'rows', 'plan'))
+
+        composite = [i for i in Measurement._meta.indexes]
+        fk_index = dj_models.Index(fields=['sensor'], name='iot_meas_bench_sensor')
+        # Previous schema, only the foreign key index
+        with connection.schema_editor() as editor:
+            editor.add_index(Measurement, fk_index)
+            for index in composite:
+                editor.remove_index(Measurement, index)
+        run('Foreign key index only ({:,} rows, {})'.format(Measurement.objects.count(), connection.vendor))
+        # Current schema
+        with connection.schema_editor() as editor:
+            for index in composite:
+                editor.add_index(Measurement, index)
+            editor.remove_index(Measurement, fk_index)
+        run('Composite time-series indexes ({:,} rows, {})'.format(Measurement.objects.count(), connection.vendor))
+    finally:
+        common.teardown(args, old_name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Sensor in project check benchmark
+====
+
+Compares the membership check done by the plot views before
+rendering: the previous scan of every zone and node of the project
+against the denormalized project of the sensor and the cached
+hierarchy snapshot.
+
+Usage:
+    $ python benchmarks/project_membership.py --zones 20 --nodes 50 --sensors 20
+"""
+import common
+
+
+def legacy_project_sensors(project_id):
+    """
+    Previous IoT.views.project_sensors implementation
+    """
+    from django.shortcuts import get_object_or_404
+    from IoT import models
+    project = get_object_or_404(models.Projects, pk=project_id)
+    sensors = []
+    for z in project.project_zones.all():
+        sensors.extend(z.zone_ambiental_sensors.all())
+        for n in z.zone_nodes.all():
+            sensors.extend(n.node_sensors.all())
+    return sensors
+
+
+def main():
+    p = common.parser(__doc__)
+    p.add_argument('--zones', type=int, default=20, help='Zones of the project')
+    p.add_argument('--nodes', type=int, default=50, help='Nodes per zone')
+    p.add_argument('--sensors', type=int, default=20, help='Sensors per node')
+    args = p.parse_args()
+    old_name = common.setup(args)
+    try:
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from IoT import hierarchy, models
+        from IoT.views import sensor_in_project
+
+        if not models.Sensors.objects.exists():
+            print('Generating {:,} sensors'.format(args.zones * args.nodes * args.sensors))
+            common.create_hierarchy(zones=args.zones, nodes=args.nodes, sensors=args.sensors)
+        project_id = models.Projects.objects.values_list('id', flat=True).first()
+        # Worst case of the scan, the last sensor of the project
+        sensor = models.Sensors.objects.filter(project_id=project_id).order_by('-id').first()
+
+        checks = {
+            'zone and node scan (previous)':lambda: sensor in legacy_project_sensors(project_id),
+            'denormalized project_id':lambda: sensor_in_project(sensor, project_id) is None,
+            'hierarchy snapshot':lambda: sensor.id in hierarchy.project(project_id).sensors,
+        }
+        # Build the snapshot once, it's shared between requests
+        hierarchy.project(project_id)
+        rows = []
+        for name, check in checks.items():
+            with CaptureQueriesContext(connection) as ctx:
+                seconds, result = common.timed(check, args.repeat)
+            rows.append((name, '{:.3f} ms'.format(seconds * 1000), len(ctx.captured_queries) // args.repeat, str(result)))
+        common.report(
+            'Sensor in project ({:,} sensors, {})'.format(models.Sensors.objects.count(), connection.vendor),
+            rows,
+            ('check', 'median', 'queries', 'member'),
+        )
+    finally:
+        common.teardown(args, old_name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Response encoding benchmark
+====
+
+Renders the NestedProjectsSerializer output of the projects view with
+DRF's JSONRenderer and the IoT API FastJSONRenderer, then compresses
+it with every available response encoding to compare the bytes sent
+and the time spent.
+
+Usage:
+    $ python benchmarks/response_encoding.py --projects 5 --zones 10 --nodes 10 --sensors 10
+"""
+import common
+
+
+def main():
+    p = common.parser(__doc__)
+    p.add_argument('--projects', type=int, default=5, help='Projects of the user')
+    p.add_argument('--zones', type=int, default=10, help='Zones per project')
+    p.add_argument('--nodes', type=int, default=10, help='Nodes per zone')
+    p.add_argument('--sensors', type=int, default=10, help='Sensors per node')
+    args = p.parse_args()
+    old_name = common.setup(args)
+    try:
+        from rest_framework.renderers import JSONRenderer
+        from IoT import loaders, middleware, models
+        from IoT.api import renderers, serializers
+
+        if not models.Projects.objects.exists():
+            print('Generating {:,} sensors'.format(args.projects * args.zones * args.nodes * args.sensors))
+            for _ in range(args.projects):
+                common.create_hierarchy(zones=args.zones, nodes=args.nodes, sensors=args.sensors, ambiental=2)
+        data = {
+            'status':'Information shown',
+            'projects':serializers.NestedProjectsSerializer(
+                loaders.load_project_tree(models.Projects.objects.order_by('id')), many=True
+            ).data,
+        }
+
+        rows = []
+        body = None
+        for name, renderer in (('JSONRenderer', JSONRenderer()), ('FastJSONRenderer', renderers.FastJSONRenderer())):
+            seconds, body = common.timed(lambda: renderer.render(data), args.repeat)
+            rows.append((name, '{:.2f} ms'.format(seconds * 1000), '{:,}'.format(len(body))))
+        common.report(
+            'Rendering ({:,} sensors, orjson {})'.format(
+                models.Sensors.objects.count(), 'installed' if renderers.orjson else 'missing'
+            ),
+            rows,
+            ('renderer', 'median', 'bytes'),
+        )
+
+        c = middleware.response_config()
+        rows = [('identity', '-', '{:,}'.format(len(body)), '1.00')]
+        for encoding, factory in middleware.compressors().items():
+            level = c['LEVELS'].get(encoding, 6)
+
+            def compress():
+                compressor = factory(level)
+                return compressor.compress(body) + compressor.flush()
+            seconds, compressed = common.timed(compress, args.repeat)
+            rows.append((
+                '{} (level {})'.format(encoding, level),
+                '{:.2f} ms'.format(seconds * 1000),
+                '{:,}'.format(len(compressed)),
+                '{:.2f}'.format(len(body) / len(compressed)),
+            ))
+        common.report('Response compression', rows, ('encoding', 'median', 'bytes on wire', 'ratio'))
+    finally:
+        common.teardown(args, old_name)
+
+
+if __name__ == '__main__':
+    main()
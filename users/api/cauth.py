@@ -1,4 +1,5 @@
 from users.models import CustomAccessTokens
+from users.api.token_cache import token_cache
 from rest_framework import authentication
 from rest_framework import exceptions
 import hashlib
@@ -6,9 +7,11 @@ import hashlib
 class CAccessTokenRestAuth(authentication.BaseAuthentication):
     """
     Para proyectos mas avanzados implementar capa intermedia
-    Cache, PRIMARY KEY
+    PRIMARY KEY
     Add invalidate field 
     Expiration date
+
+    Resolved tokens are kept inside users.api.token_cache
     """
     def authenticate(self, request):
         token = request.META.get('HTTP_CA_TOKEN')
@@ -19,11 +22,15 @@ class CAccessTokenRestAuth(authentication.BaseAuthentication):
         if not token:
             return None
 
+        hashed_token = hashlib.sha256(token.encode()).hexdigest()
+        cached = token_cache.get(hashed_token)
+        if cached is not None:
+            return cached
         try:
-            hashed_token = hashlib.sha256(token.encode()).hexdigest()
-            token = CustomAccessTokens.objects.get(uuid_token=hashed_token)
+            token = CustomAccessTokens.objects.select_related('user').get(uuid_token=hashed_token)
             user = token.user
         except CustomAccessTokens.DoesNotExist:
             raise exceptions.AuthenticationFailed('No such token')
 
+        token_cache.set(hashed_token, (user, token))
         return (user, token)
\ No newline at end of file
@@ -0,0 +1,201 @@
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+import copy, threading, time
+
+"""
+Access token resolution cache
+====
+
+Maps the sha256 hash of a raw access token to its (user, token)
+pair so CAccessTokenRestAuth doesn't query the database on every
+request. Entries are invalidated by the receivers in users.signals,
+which only reach the cache of the worker handling the change. Caches
+kept per process ('local' or a per process CACHE_ALIAS) therefore keep
+entries at most LOCAL_TTL seconds, see users.checks
+"""
+
+DEFAULT_SETTINGS = {
+    # 'django' uses the cache framework, 'local' keeps entries in process memory
+    'BACKEND':'django',
+    # Cache alias used by the 'django' backend
+    'CACHE_ALIAS':'default',
+    # Maximum amount of tokens kept by the 'local' backend
+    'MAX_SIZE':1024,
+    # Seconds before an entry must be resolved again, 0 disables the cache
+    'TTL':300,
+    # Maximum TTL when entries are kept per process, other workers accept revoked tokens until it expires
+    'LOCAL_TTL':5,
+}
+
+# Cache backends only visible to the process using them
+PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+class BaseTokenCache:
+    """
+    Common hit and miss accounting of token caches
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, hashed_token):
+        value = self._get(hashed_token)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def stats(self):
+        """
+        Returns the hit and miss counters of the cache
+        """
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'hits':hits,
+            'misses':misses,
+            'hit_ratio':hits / total if total else 0.0,
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+class LocalTokenCache(BaseTokenCache):
+    """
+    Bounded in process LRU cache with expiration
+    ====
+
+    Values are copied when stored and returned, threads never share
+    the cached (user, token) instances
+    """
+    def __init__(self, ttl, max_size):
+        super(LocalTokenCache, self).__init__(ttl)
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def _get(self, hashed_token):
+        with self._lock:
+            entry = self._entries.get(hashed_token)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[hashed_token]
+                return None
+            self._entries.move_to_end(hashed_token)
+            return copy.deepcopy(value)
+
+    def set(self, hashed_token, value):
+        with self._lock:
+            self._entries[hashed_token] = (time.monotonic() + self.ttl, copy.deepcopy(value))
+            self._entries.move_to_end(hashed_token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *hashed_tokens):
+        with self._lock:
+            for hashed_token in hashed_tokens:
+                self._entries.pop(hashed_token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        stats = super(LocalTokenCache, self).stats()
+        with self._lock:
+            stats['size'] = len(self._entries)
+        return stats
+
+
+class DjangoTokenCache(BaseTokenCache):
+    """
+    Token cache stored within Django's cache framework
+    ====
+
+    Allows sharing the cache between processes, hit and miss
+    counters are kept per process
+    """
+    key_prefix = 'ca_token:'
+
+    def __init__(self, ttl, alias):
+        super(DjangoTokenCache, self).__init__(ttl)
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _get(self, hashed_token):
+        return self.cache.get(self.key_prefix + hashed_token)
+
+    def set(self, hashed_token, value):
+        self.cache.set(self.key_prefix + hashed_token, value, self.ttl)
+
+    def invalidate(self, *hashed_tokens):
+        self.cache.delete_many([self.key_prefix + h for h in hashed_tokens])
+
+    def clear(self):
+        # Entries expire on their own, other keys of the cache must be kept
+        pass
+
+
+class DummyTokenCache(BaseTokenCache):
+    """
+    Used when the cache is disabled
+    """
+    def _get(self, hashed_token):
+        return None
+
+    def set(self, hashed_token, value):
+        pass
+
+    def invalidate(self, *hashed_tokens):
+        pass
+
+    def clear(self):
+        pass
+
+
+def config():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'CA_TOKEN_CACHE', {}))
+
+
+def per_process(config):
+    """
+    Returns whether the cache described by config is only visible to the current process
+    """
+    if config['BACKEND'] != 'django':
+        return True
+    return settings.CACHES.get(config['CACHE_ALIAS'], {}).get('BACKEND') in PROCESS_CACHES
+
+
+def build_token_cache():
+    """
+    Creates the token cache configured by CA_TOKEN_CACHE
+    """
+    c = config()
+    ttl = c['TTL']
+    if per_process(c):
+        ttl = min(ttl, c['LOCAL_TTL'])
+    if not ttl:
+        return DummyTokenCache(0)
+    if c['BACKEND'] == 'django':
+        return DjangoTokenCache(ttl, c['CACHE_ALIAS'])
+    return LocalTokenCache(ttl, c['MAX_SIZE'])
+
+
+token_cache = build_token_cache()
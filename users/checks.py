@@ -0,0 +1,28 @@
+from django.core.checks import Tags, Warning, register
+from users.api import token_cache
+
+"""
+Deployment checks
+====
+
+Deleted and revoked tokens are removed from the token cache of the
+worker handling the change, every worker must therefore share it.
+Run with "manage.py check --deploy"
+"""
+
+
+@register(Tags.caches, deploy=True)
+def shared_token_cache(app_configs, **kwargs):
+    """
+    Warns when CA_TOKEN_CACHE keeps entries per process
+    """
+    config = token_cache.config()
+    if not config['TTL'] or not token_cache.per_process(config):
+        return []
+    return [Warning(
+        'CA_TOKEN_CACHE keeps tokens per process, other workers accept deleted or revoked tokens for up to {} seconds'.format(
+            min(config['TTL'], config['LOCAL_TTL'])
+        ),
+        hint='Use the \'django\' BACKEND with a CACHE_ALIAS shared by every worker (e.g. Memcached or Redis)',
+        id='users.W001',
+    )]
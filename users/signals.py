@@ -0,0 +1,37 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from users.models import GeneralUser, CustomAccessTokens
+from users.api.token_cache import token_cache
+
+"""
+Users signal receivers
+====
+
+Removes cached access tokens whenever a token or its user changes
+"""
+
+
+@receiver(pre_save, sender=CustomAccessTokens)
+def remember_token_hash(sender, instance, raw=False, **kwargs):
+    """
+    Stores the previous hash of a token since saving it hashes it again
+    """
+    instance._previous_hash = None
+    if not raw and instance.pk is not None:
+        instance._previous_hash = sender.objects.filter(pk=instance.pk).values_list('uuid_token', flat=True).first()
+
+
+@receiver(post_save, sender=CustomAccessTokens)
+@receiver(post_delete, sender=CustomAccessTokens)
+def invalidate_token(sender, instance, **kwargs):
+    hashes = [instance.uuid_token]
+    if getattr(instance, '_previous_hash', None):
+        hashes.append(instance._previous_hash)
+    token_cache.invalidate(*hashes)
+
+
+@receiver(post_save, sender=GeneralUser)
+@receiver(post_delete, sender=GeneralUser)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    hashes = CustomAccessTokens.objects.filter(user_id=instance.pk).values_list('uuid_token', flat=True)
+    token_cache.invalidate(*hashes)
@@ -1,3 +1,132 @@
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+from users.models import GeneralUser, CustomAccessTokens
+from users.api.token_cache import token_cache, build_token_cache, LocalTokenCache, DjangoTokenCache
+from users import checks
+from django.test import override_settings
+import threading
+import IoT.models as models
 
-# Create your tests here.
+class TokenCacheTestCase(TestCase):
+    """
+    Test access token resolution cache
+    """
+    client_api = APIClient()
+
+    def setUp(self):
+        token_cache.clear()
+        token_cache.reset_stats()
+        # Create User
+        self.user = GeneralUser.objects.create_user(
+            username = 'TUTokenCache',
+            password = "123Password",
+            email = 'test@test.com'
+        )
+        # Create and save project token
+        token = CustomAccessTokens(
+            user=self.user,
+            name="testToken"
+        )
+        self.raw_token = token.uuid_token
+        token.save()
+        self.token = token
+        project = models.Projects.objects.create(
+            user=self.user,
+            name='Test',
+            description='Test project',
+            snippet_title='Test Snippet',
+            snippet_image='image.png',
+        )
+        project.access_keys.add(token)
+        self.url = reverse('iot_api:iot_general_api-project', args=(project.id,))
+
+
+    def test_cached_authentication(self):
+        """
+        Test repeated requests resolve the token from the cache
+        """
+        header = {'HTTP_CA_TOKEN':self.raw_token}
+        first = self.client_api.get(self.url, format='json', **header)
+        self.assertEqual(first.status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client_api.get(self.url, format='json', **header)
+        self.assertEqual(second.status_code, 200)
+        self.assertFalse([q for q in ctx.captured_queries if 'customaccesstokens' in q['sql'].lower()])
+        self.assertEqual(token_cache.stats()['hits'], 1)
+        self.assertEqual(token_cache.stats()['misses'], 1)
+
+
+    def test_invalidation(self):
+        """
+        Test deleted tokens and modified users are not served from the cache
+        """
+        header = {'HTTP_CA_TOKEN':self.raw_token}
+        self.assertEqual(self.client_api.get(self.url, format='json', **header).status_code, 200)
+        # Modified users must be resolved again
+        self.user.first_name = 'Changed'
+        self.user.save()
+        self.client_api.get(self.url, format='json', **header)
+        self.assertEqual(token_cache.stats()['misses'], 2)
+        # Deleted tokens can't authenticate
+        self.token.delete()
+        response = self.client_api.get(self.url, format='json', **header)
+        self.assertTrue(response.status_code in (401, 403))
+
+
+    def test_local_cache_bounds(self):
+        """
+        Test the local cache evicts least recently used and expired entries
+        """
+        cache = LocalTokenCache(ttl=60, max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        expired = LocalTokenCache(ttl=-1, max_size=2)
+        expired.set('a', 1)
+        self.assertEqual(expired.get('a'), None)
+
+
+    def test_local_cache_copies(self):
+        """
+        Test cached values aren't shared between callers and counters add up across threads
+        """
+        cache = LocalTokenCache(ttl=60, max_size=2)
+        cache.set('a', (self.user, self.token))
+        user, token = cache.get('a')
+        self.assertEqual(token.pk, self.token.pk)
+        self.assertIsNot(user, self.user)
+        user.first_name = 'Changed'
+        self.assertNotEqual(cache.get('a')[0].first_name, 'Changed')
+        threads = [threading.Thread(target=lambda: [cache.get('a') for _ in range(200)]) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(cache.stats()['hits'], 802)
+
+
+    def test_per_process_cache(self):
+        """
+        Test per process token caches keep entries for LOCAL_TTL seconds and are reported
+        """
+        shared = {
+            'default':{'BACKEND':'django.core.cache.backends.locmem.LocMemCache'},
+            'shared':{'BACKEND':'django.core.cache.backends.memcached.MemcachedCache', 'LOCATION':'127.0.0.1:11211'},
+        }
+        with override_settings(CACHES=shared, CA_TOKEN_CACHE={'TTL':300, 'LOCAL_TTL':5}):
+            cache = build_token_cache()
+            self.assertIsInstance(cache, DjangoTokenCache)
+            self.assertEqual(cache.ttl, 5)
+            self.assertEqual([w.id for w in checks.shared_token_cache(None)], ['users.W001'])
+        with override_settings(CACHES=shared, CA_TOKEN_CACHE={'BACKEND':'local', 'TTL':300, 'LOCAL_TTL':5}):
+            self.assertEqual(build_token_cache().ttl, 5)
+            self.assertEqual(len(checks.shared_token_cache(None)), 1)
+        with override_settings(CACHES=shared, CA_TOKEN_CACHE={'CACHE_ALIAS':'shared', 'TTL':300}):
+            self.assertEqual(build_token_cache().ttl, 300)
+            self.assertEqual(checks.shared_token_cache(None), [])